@@ -1,10 +1,15 @@
 import os
 import sys
-from fastapi import FastAPI, HTTPException
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
-import hashlib
+from starlette.routing import Match
 import traceback
-import random
 
 # 設定路徑：確保程式能找到 iching_system 資料夾
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,24 +20,278 @@ CORE_LOADED = False
 LOAD_ERROR = ""
 get_hexagram = None
 compute_b_stage = None
+YiliGenerator = None
+build_reading = None
+stream_batch = None
+progressive_reading = None
+DivinationSession = None
+admitted_reading = None
+MAX_BATCH_ITEMS = 0
+get_response_cache = None
+HTTP_DURATION = None
+WarmupState = None
+render_reading = None
+fast_dumps = None
+get_job_queue = None
+wants_msgpack = None
 
 # 嘗試引入核心模組
 try:
     # 修正：直接匯入存在的函數，而不是不存在的 Class
     from iching_system.core.data_loader import get_hexagram
     from iching_system.core.calculator import compute_b_stage
+    from iching_system.core.yili_generator import YiliGenerator
+    from iching_system.service.reading import build_reading, render_reading
+    from iching_system.utils.serialization import dumps as fast_dumps
+    from iching_system.service.batch import stream_batch, MAX_BATCH_ITEMS
+    from iching_system.service.progressive import progressive_reading
+    from iching_system.service.session import DivinationSession
+    from iching_system.service.admission import admitted_reading, get_admission, ClientRateLimited
+    from iching_system.utils.serialization import loads as fast_loads
+    from iching_system.service.response_cache import get_response_cache, cache_key, etag_matches, make_etag
+    from iching_system.service.instrumentation import HTTP_DURATION, HTTP_IN_FLIGHT, refresh_cache_ratios
+    from iching_system.service.warmup import WarmupState, warm_up
+    from iching_system.service.jobs import get_job_queue, JobWorker, JobQueueFull
+    from iching_system.llm.clients import close_async_clients
+    from iching_system.service.compact import (
+        wants_msgpack, get_template_table, MSGPACK_MEDIA_TYPE
+    )
     
     CORE_LOADED = True
-    print("Core modules (data_loader, calculator) loaded successfully.")
+    print("Core modules (data_loader, calculator, yili_generator, service) loaded successfully.")
 except Exception as e:
     CORE_LOADED = False
     LOAD_ERROR = str(e)
     print(f"Failed to load core modules: {e}")
 
-app = FastAPI(title="Yi Li Decision API", version="1.0.0")
+WARMUP = WarmupState() if WarmupState else None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    啟動時在背景預熱（資料、索引、解卦路徑、LLM 客戶端），
+    預熱完成前 /health/ready 回傳 503；
+    背景工作使用程序內佇列時，在本程序啟動 worker；
+    結束時關閉本 event loop 的非同步 LLM 連線池
+    """
+    tasks = []
+    if CORE_LOADED:
+        tasks.append(asyncio.create_task(warm_up(WARMUP, get_generator, get_adapter)))
+        if get_job_queue().in_process:
+            worker = JobWorker(get_job_queue(), get_generator, get_adapter)
+            tasks.append(asyncio.create_task(worker.run()))
+    yield
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if CORE_LOADED:
+        await close_async_clients()
+        if _adapter is not None:
+            await _adapter.aclose()
+
+
+class FastJSONResponse(JSONResponse):
+    """以 orjson / msgspec（若已安裝）序列化的 JSON 回應，內容與 JSONResponse 相同"""
+    
+    def render(self, content) -> bytes:
+        if fast_dumps is None:
+            return super().render(content)
+        return fast_dumps(content)
+
+
+app = FastAPI(title="Yi Li Decision API", version="1.0.0", lifespan=lifespan,
+              default_response_class=FastJSONResponse)
+
+
+def _route_template(request):
+    """以路由樣板（如 /api/reading/{yao}）作為指標 label，避免 label 數量無限增長"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """每個路由的延遲與處理中請求數"""
+    if HTTP_DURATION is None:
+        return await call_next(request)
+    
+    route = _route_template(request)
+    HTTP_IN_FLIGHT.inc(route=route)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_DURATION.observe(time.perf_counter() - start,
+                              method=request.method, route=route, status=status)
+        HTTP_IN_FLIGHT.dec(route=route)
 
 class QuestionRequest(BaseModel):
     question: str
+    adapt: bool = True  # 是否以 LLM 微調 s1/s2/s6（未設定 LLM 時回傳中性版）
+
+class BatchItem(BaseModel):
+    question: Optional[str] = None
+    yao_values: Optional[List[int]] = None
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    adapt: bool = False  # 批次預設不微調（大量離線產生時只用查表與預生成版本）
+
+class A4JobRequest(BaseModel):
+    question: str
+    description: Optional[str] = None  # 背景描述（未填時以問題代替）
+    inner_scores: List[int] = [5, 5, 5]  # 內三爻問卷分數 0-10
+    adapt: bool = True
+
+class AdaptStreamRequest(BaseModel):
+    question: str
+    yao_values: List[int]
+    section: str  # 's1' | 's2' | 's6'
+
+def _model_dict(model: BaseModel) -> dict:
+    """pydantic v2 的 model_dump；v1 沒有時退回 dict()"""
+    if hasattr(model, 'model_dump'):
+        return model.model_dump()
+    return model.dict()
+
+
+# 需要 LLM 微調的段落：短 id -> (YiliGenerator 段落 id, 段落名稱)
+ADAPT_SECTIONS = {
+    's1': ('s1_status', '現況'),
+    's2': ('s2_trend', '變化趨勢'),
+    's6': ('s6_outlook', '展望'),
+}
+
+_generator = None
+_adapter = None
+
+def get_generator():
+    """YiliGenerator 只載入一次"""
+    global _generator
+    if _generator is None:
+        _generator = YiliGenerator()
+    return _generator
+
+def get_adapter():
+    """
+    LLM 微調適配器（延遲載入，避免沒有 anthropic 時無法啟動）
+    
+    無法建立（未安裝套件或未設定 API Key）時回傳 None，解卦改用中性版
+    """
+    global _adapter
+    if _adapter is None:
+        from iching_system.llm.clients import get_anthropic_api_key
+        from iching_system.llm.cassette import get_cassette
+        backend = os.environ.get('YILI_LLM_ADAPTER', 'claude').lower()
+        if backend == 'claude' and not get_anthropic_api_key() and get_cassette() is None:
+            return None
+        try:
+            from iching_system.core.yili_llm_adapter import create_adapter
+            from iching_system.llm.semantic_cache import CachedLLMAdapter
+            _adapter = CachedLLMAdapter(create_adapter())
+        except Exception as e:
+            print(f"LLM adapter unavailable: {e}")
+            return None
+    return _adapter
+
+# 解卦結果是確定的：A1 只由六爻決定，可長期快取；微調版依問題快取
+CACHE_CONTROL_READING = os.getenv('CACHE_CONTROL_READING', 'public, max-age=31536000, immutable')
+CACHE_CONTROL_ASK = os.getenv('CACHE_CONTROL_ASK', 'public, max-age=3600')
+
+async def _cached_response(http_request, key, compute, cache_control, route, cacheable=None):
+    """
+    回應快取 + ETag
+    
+    GET 帶 If-None-Match 且符合時回 304（不含內容）；
+    cacheable 判斷為否的結果不存入快取，也不讓 CDN 快取。
+    Accept: application/msgpack 時回應 MessagePack（模板文字可改為引用，見 service/compact.py）
+    """
+    etag, body, stored = await get_response_cache().get_or_compute(
+        key, compute, route=route, cacheable=cacheable, serializer=render_reading
+    )
+    if not stored:
+        # 合併到同一計算的請求也得到同一個判斷（含加入 /api/ask/stream 計算的請求）
+        cache_control = "no-store"
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept, X-Yili-Templates"}
+    media_type = "application/json"
+    if wants_msgpack(http_request.headers.get("accept")):
+        # 快取的是 JSON：解碼後以 MessagePack 重新編碼（6 KB 約數十微秒）
+        table = get_template_table(get_generator())
+        body = table.encode(fast_loads(body), table.cached_chunks(http_request.headers.get("x-yili-templates")))
+        etag = headers["ETag"] = make_etag(body)
+        headers["X-Yili-Templates-Version"] = table.version
+        media_type = MSGPACK_MEDIA_TYPE
+    if http_request.method == "GET" and etag_matches(http_request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+# 信任反向代理的 X-Forwarded-For（部署在 Cloud Run / 負載平衡器後方時設定為 1）
+TRUST_PROXY_HEADERS = os.getenv('TRUST_PROXY_HEADERS', '0') == '1'
+# 前方受信任的代理層數：每層代理在 X-Forwarded-For 尾端加上它看到的來源位址
+TRUSTED_PROXY_HOPS = max(1, int(os.getenv('TRUSTED_PROXY_HOPS', '1')))
+
+def _client_id(connection):
+    """
+    LLM 准入限流用的客戶端識別（Request 或 WebSocket）
+    
+    X-Forwarded-For 的開頭可由客戶端任意填寫（每次換一個就能繞過限流），
+    只取受信任代理加上的項目：由右數第 TRUSTED_PROXY_HOPS 個
+    """
+    if TRUST_PROXY_HEADERS:
+        forwarded = [part.strip() for part in connection.headers.get('x-forwarded-for', '').split(',')]
+        forwarded = [part for part in forwarded if part]
+        if forwarded:
+            return forwarded[-min(TRUSTED_PROXY_HOPS, len(forwarded))]
+    return connection.client.host if connection.client else None
+
+def _normalize_question(question):
+    """去頭尾空白（與 Streamlit 版、批次去重一致）；起卦種子與快取鍵都用正規化後的問題"""
+    question = (question or '').strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="請輸入問題")
+    return question
+
+async def _ask(http_request, question, adapt):
+    if not CORE_LOADED:
+        raise HTTPException(status_code=500, detail=f"System Core Error: {LOAD_ERROR}")
+    question = _normalize_question(question)
+
+    try:
+        adapter = get_adapter() if adapt else None
+        # 有無微調的結果不同，分開快取
+        key = cache_key('ask', question, adapter is not None)
+        cache = get_response_cache()
+        if adapter is not None and not cache.is_cached_or_pending(key):
+            # 只有會開始新計算的請求扣客戶端額度；相同的進行中請求直接合併
+            get_admission().check_client(_client_id(http_request))
+        return await _cached_response(
+            http_request, key,
+            # 快取未命中才需要 LLM 名額；未取得時回傳 degraded 的不微調版本
+            lambda: admitted_reading(question, get_generator(), adapter),
+            CACHE_CONTROL_ASK, route='/api/ask',
+            # 微調失敗（回傳原文）或降級的結果不快取，下次重試
+            cacheable=lambda data: adapter is None or len(data['reading']['meta'].get('adapted', [])) == 3
+        )
+
+    except ClientRateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    except Exception as e:
+        error_msg = traceback.format_exc()
+        print(f"Runtime Error: {error_msg}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(event, data, event_id=None):
+    """組成一則 server-sent event（event_id 供客戶端以 Last-Event-ID 續傳）"""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {fast_dumps(data).decode('utf-8')}\n\n"
 
 @app.get("/")
 def home():
@@ -41,56 +300,365 @@ def home():
     else:
         return {"status": "System Warning", "error": f"Import Error: {LOAD_ERROR}"}
 
+@app.get("/health/live")
+async def liveness():
+    """存活檢查：程序可回應即為存活"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """就緒檢查：核心載入且預熱完成才接流量"""
+    if not CORE_LOADED:
+        return JSONResponse({"ready": False, "error": f"Import Error: {LOAD_ERROR}"}, status_code=503)
+    state = WARMUP.to_dict()
+    return JSONResponse(state, status_code=200 if state['ready'] else 503)
+
+
 @app.post("/api/ask")
-def ask_question(request: QuestionRequest):
+async def ask_question(request: QuestionRequest, http_request: Request):
+    """
+    接收問題 -> 轉化為卦象 -> 回傳完整六點解卦
+    
+    起卦由問題的 SHA-256 種子決定（同一問題結果固定），
+    s1/s2/s6 的 LLM 微調以 await 等待，不佔用執行緒池
+    """
+    return await _ask(http_request, request.question, request.adapt)
+
+
+@app.get("/api/ask")
+async def ask_question_get(http_request: Request, question: str, adapt: bool = True):
+    """同 POST /api/ask，可被 CDN 快取並以 If-None-Match 重新驗證"""
+    return await _ask(http_request, question, adapt)
+
+
+@app.get("/api/reading/{yao}")
+async def reading_by_yao(yao: str, http_request: Request):
+    """
+    A1 制式解卦（只由六爻決定，例如 /api/reading/789678）
+    """
+    if not CORE_LOADED:
+        raise HTTPException(status_code=500, detail=f"System Core Error: {LOAD_ERROR}")
+    if len(yao) != 6 or any(c not in '6789' for c in yao):
+        raise HTTPException(status_code=400, detail="六爻須為 6 個 6/7/8/9 的數字，例如 789678")
+    
+    yao_values = [int(c) for c in yao]
+    return await _cached_response(
+        http_request, cache_key('reading', yao),
+        lambda: build_reading(None, get_generator(), None, yao_values),
+        CACHE_CONTROL_READING, route='/api/reading'
+    )
+
+
+@app.get("/api/templates")
+async def templates_info():
     """
-    接收問題 -> 轉化為卦象 -> 回傳結果
+    精簡回應的模板文字表：版本、分組數與分組網址
+    
+    客戶端下載並快取分組後，請求帶 X-Yili-Templates: <version>:<已快取分組位元遮罩>，
+    MessagePack 回應中這些分組的文字改為引用（extension type 1，[分組, 序號]）
     """
     if not CORE_LOADED:
         raise HTTPException(status_code=500, detail=f"System Core Error: {LOAD_ERROR}")
+    return JSONResponse(get_template_table(get_generator()).describe(),
+                        headers={"Cache-Control": "public, max-age=3600"})
+
+
+@app.get("/api/templates/{version}/{chunk}")
+async def template_chunk(version: str, chunk: int, http_request: Request):
+    """第 chunk 組模板文字（0 共用、1-64 各卦）；網址含版本，內容不變"""
+    if not CORE_LOADED:
+        raise HTTPException(status_code=500, detail=f"System Core Error: {LOAD_ERROR}")
+    table = get_template_table(get_generator())
+    if version != table.version:
+        raise HTTPException(status_code=404, detail=f"模板版本已更新為 {table.version}")
+    if not 0 <= chunk < len(table.chunks):
+        raise HTTPException(status_code=404, detail=f"分組須為 0-{len(table.chunks) - 1}")
+    
+    data = {"version": table.version, "chunk": chunk, "texts": table.chunks[chunk]}
+    headers = {"Cache-Control": CACHE_CONTROL_READING, "Vary": "Accept"}
+    if wants_msgpack(http_request.headers.get("accept")):
+        return Response(content=table.encode(data), media_type=MSGPACK_MEDIA_TYPE, headers=headers)
+    return FastJSONResponse(data, headers=headers)
+
+
+async def _ask_stream(http_request, question, adapt):
+    if not CORE_LOADED:
+        raise HTTPException(status_code=500, detail=f"System Core Error: {LOAD_ERROR}")
+    
+    question = _normalize_question(question)
+    adapter = get_adapter() if adapt else None
+    events = progressive_reading(
+        question, get_generator(), adapter, key=cache_key('ask', question, adapter is not None),
+        client_id=_client_id(http_request)
+    )
+    
+    async def event_stream():
+        try:
+            async for event, data in events:
+                yield _sse(event, data)
+        except Exception as e:
+            print(f"Runtime Error: {traceback.format_exc()}")
+            yield _sse('error', {'detail': str(e)})
+        finally:
+            await events.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/ask/stream")
+async def ask_stream_get(http_request: Request, question: str, adapt: bool = True):
+    """
+    漸進式解卦（server-sent events，可直接用 EventSource）
+    
+    event: reading -> 起卦結果、卦象與段落順序
+    event: section -> {"id": 段落 id, "section": {...}}；s3, s4, s5 立即送出，
+                      s1, s2, s6 微調完成時送出
+    event: delta   -> {"id": 段落 id, "text": 文字增量}
+    event: done    -> {"adapted": [...], "cached": bool, "degraded": bool}
+    """
+    return await _ask_stream(http_request, question, adapt)
+
+
+@app.post("/api/ask/stream")
+async def ask_stream(request: QuestionRequest, http_request: Request):
+    """同 GET /api/ask/stream"""
+    return await _ask_stream(http_request, request.question, request.adapt)
 
+
+@app.websocket("/ws/session")
+async def session_socket(websocket: WebSocket):
+    """
+    A3 問卷 / A4 Agent 互動起卦（WebSocket，一則 JSON 一則訊息）
+    
+    訊息格式見 iching_system/service/session.py；
+    拉動滑桿只送 {"type": "score", ...}，伺服器只回傳變動的部分
+    """
+    await websocket.accept()
+    if not CORE_LOADED:
+        await websocket.close(code=1011, reason=f"System Core Error: {LOAD_ERROR}"[:120])
+        return
+    
+    async def send(message):
+        await websocket.send_text(fast_dumps(message).decode('utf-8'))
+    
+    session = DivinationSession(send, get_generator(), get_adapter(), client_id=_client_id(websocket))
     try:
-        q_text = request.question
-        
-        # 1. 將問題轉化為隨機種子 (Deterministic)
-        hash_val = int(hashlib.sha256(q_text.encode()).hexdigest(), 16)
-        random.seed(hash_val)
-        
-        # 2. 模擬生成本卦 (產生 6 個爻，每個爻是 0 或 1)
-        # 這裡我們生成一個 6 位數的二進制字串，例如 "101101"
-        # 易經通常是初爻在字串左邊或右邊需確認，這裡先假設標準順序
-        code_list = [str(random.randint(0, 1)) for _ in range(6)]
-        hex_code = "".join(code_list)
-        
-        # 3. 呼叫核心功能：查表取得真實卦名！
-        # 使用 data_loader 裡的 get_hexagram
-        hex_info = get_hexagram(hex_code)
-        
-        # 取得卦名，如果查不到就顯示代碼
-        hex_name = hex_info.get('name', f"Unknown-{hex_code}")
-        
-        # 4. 模擬動爻 (0-5, 6代表無動爻)
-        changing_line = hash_val % 7 
-        
-        # 5. 組裝回傳資料
-        return {
-            "question": q_text,
-            "hexagram": {
-                "code": hex_code,
-                "name": hex_name,  # 這是真的從您資料庫查出來的名字！
-                "changing": changing_line if changing_line < 6 else None
-            },
-            "waveform": {
-                # 這些參數未來可以從 hex_info 裡面讀取 modern2 的參數
-                "amplitude": 0.5 + (int(hex_code, 2) / 64.0),
-                "frequency": 1.2
-            },
-            "interpretation": {
-                "text": f"【核心運作中】您抽到了「{hex_name}」。(來自 iching_system 的真實資料)"
-            }
-        }
+        while True:
+            text = await websocket.receive_text()
+            try:
+                message = fast_loads(text)
+            except ValueError:
+                await session.send('error', detail="訊息必須是 JSON")
+                continue
+            await session.handle(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
 
-    except Exception as e:
-        error_msg = traceback.format_exc()
-        print(f"Runtime Error: {error_msg}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+
+@app.post("/api/jobs/a4", status_code=202)
+async def submit_a4_job(request: A4JobRequest, http_request: Request):
+    """
+    A4 Agent 起卦背景工作：立即回傳 job id，Agent 流程由 worker 執行
+    
+    以 GET /api/jobs/{id} 輪詢，或 GET /api/jobs/{id}/events 訂閱進度
+    """
+    if not CORE_LOADED:
+        raise HTTPException(status_code=500, detail=f"System Core Error: {LOAD_ERROR}")
+    try:
+        # Agent 工作需要 LLM，與 /api/ask 共用客戶端限流額度
+        get_admission().check_client(_client_id(http_request))
+        job = await get_job_queue().submit('a4', _model_dict(request))
+    except ClientRateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"id": job['id'], "status": job['status'],
+            "poll": f"/api/jobs/{job['id']}", "events": f"/api/jobs/{job['id']}/events"}
+
+
+@app.get("/api/jobs")
+async def job_stats():
+    """背景工作佇列狀態（後端與各狀態的工作數）"""
+    if not CORE_LOADED:
+        raise HTTPException(status_code=500, detail=f"System Core Error: {LOAD_ERROR}")
+    return await get_job_queue().stats()
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, after: int = 0):
+    """
+    輪詢背景工作：狀態、結果（完成時）與 seq 大於 after 的進度事件
+    
+    下次輪詢帶上最後一個事件的 seq，只取新的事件
+    """
+    if not CORE_LOADED:
+        raise HTTPException(status_code=500, detail=f"System Core Error: {LOAD_ERROR}")
+    job = await get_job_queue().get(job_id, after)
+    if job is None:
+        raise HTTPException(status_code=404, detail="找不到工作")
+    return job
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, http_request: Request, after: int = 0):
+    """
+    訂閱背景工作進度（server-sent events）
+    
+    event: status   -> {"status": ...}
+    event: progress -> {"step": "line", "line": 4, "status": "scored", "score": 7, ...}
+    event: scores   -> {"inner": [...], "outer": [...]}
+    event: done     -> 工作內容（含 result）
+    
+    每則事件帶 id（seq），重新連線時以 Last-Event-ID 續傳
+    """
+    if not CORE_LOADED:
+        raise HTTPException(status_code=500, detail=f"System Core Error: {LOAD_ERROR}")
+    queue = get_job_queue()
+    if await queue.get(job_id, after=None) is None:
+        raise HTTPException(status_code=404, detail="找不到工作")
+    last_event_id = http_request.headers.get('last-event-id')
+    if last_event_id and last_event_id.isdigit():
+        after = int(last_event_id)
+    
+    async def event_stream():
+        try:
+            async for event in queue.subscribe(job_id, after):
+                data = dict(event)
+                seq = data.pop('seq')
+                yield _sse(data.pop('type'), data, event_id=seq)
+            job = await queue.get(job_id, after=None)
+            if job is not None:
+                yield _sse('done', job)
+        except Exception as e:
+            print(f"Runtime Error: {traceback.format_exc()}")
+            yield _sse('error', {'detail': str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """取消背景工作（排隊中立即取消；執行中的工作由 worker 在下次 heartbeat 時停止）"""
+    if not CORE_LOADED:
+        raise HTTPException(status_code=500, detail=f"System Core Error: {LOAD_ERROR}")
+    job = await get_job_queue().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="找不到工作")
+    return job
+
+
+@app.post("/api/ask/batch")
+async def ask_batch(request: BatchRequest, http_request: Request):
+    """
+    批次解卦：最多 MAX_BATCH_ITEMS 筆問題或六爻，以 NDJSON 串流回傳
+    
+    每行 {"index": i, "result": {...}} 或 {"index": i, "error": "..."}；
+    相同輸入只計算一次。微調的批次整批計入一次客戶端限流（超過時 429），
+    LLM 滿載而未微調的那筆 result 帶 degraded: true
+    """
+    if not CORE_LOADED:
+        raise HTTPException(status_code=500, detail=f"System Core Error: {LOAD_ERROR}")
+    if not request.items:
+        raise HTTPException(status_code=400, detail="items 不可為空")
+    if len(request.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"一次最多 {MAX_BATCH_ITEMS} 筆")
+    
+    adapter = get_adapter() if request.adapt else None
+    if adapter is not None:
+        # 整批扣一次客戶端額度；逐筆扣會讓超過瞬間上限的後段全部降級
+        try:
+            get_admission().check_client(_client_id(http_request))
+        except ClientRateLimited as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    items = [_model_dict(item) for item in request.items]
+    return StreamingResponse(
+        stream_batch(items, get_generator(), adapter),
+        media_type="application/x-ndjson"
+    )
+
+
+@app.post("/api/adapt/stream")
+async def adapt_stream(request: AdaptStreamRequest, http_request: Request):
+    """
+    串流微調單一段落（server-sent events）
+    
+    event: delta -> {"text": 文字增量}
+    event: done  -> {"section": ..., "content": 完整文字, "degraded": bool}
+    
+    未取得 LLM 名額時直接回傳原文（degraded: true）；
+    串流中途失敗時 done 帶原文（degraded: true, reason: llm_error），客戶端應以 content 取代已顯示的增量
+    """
+    if not CORE_LOADED:
+        raise HTTPException(status_code=500, detail=f"System Core Error: {LOAD_ERROR}")
+    if request.section not in ADAPT_SECTIONS:
+        raise HTTPException(status_code=400, detail=f"未知的段落: {request.section}，可用段落: {list(ADAPT_SECTIONS)}")
+    if len(request.yao_values) != 6 or any(v not in (6, 7, 8, 9) for v in request.yao_values):
+        raise HTTPException(status_code=400, detail="yao_values 必須是 6 個 6/7/8/9 的值")
+    
+    adapter = get_adapter()
+    if adapter is None:
+        raise HTTPException(status_code=503, detail="LLM 微調未設定")
+    
+    section_id, section_name = ADAPT_SECTIONS[request.section]
+    result = get_generator().generate_a1(request.yao_values)
+    content = result['sections'][section_id]['content']
+    
+    client_id = _client_id(http_request)
+    
+    async def event_stream():
+        async with get_admission().admit(client_id) as admission:
+            if admission.admitted:
+                parts = []
+                try:
+                    async for text in adapter.aadapt_stream(content, request.question, section_name):
+                        parts.append(text)
+                        yield _sse('delta', {'text': text})
+                except Exception as e:
+                    print(f"串流微調中途失敗（{request.section}）：{e}")
+                    yield _sse('done', {'section': request.section, 'content': content,
+                                        'degraded': True, 'reason': 'llm_error'})
+                    return
+                yield _sse('done', {'section': request.section, 'content': ''.join(parts), 'degraded': False})
+                return
+        yield _sse('delta', {'text': content})
+        yield _sse('done', {'section': request.section, 'content': content,
+                            'degraded': True, 'reason': admission.reason})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus 文字格式的指標
+    
+    含每個路由的延遲與處理中請求數、各階段耗時（cast / compute_b_stage /
+    generate / llm_adapt / render）、快取命中率，以及每次 LLM 呼叫的耗時與 tokens
+    """
+    from iching_system.utils.metrics import REGISTRY
+    refresh_cache_ratios()
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/metrics/llm")
+def llm_metrics(limit: int = 100):
+    """LLM 呼叫彙總（依段落，耗時大者在前）、准入控制狀態與最近的呼叫紀錄"""
+    from iching_system.llm.telemetry import summary, recent_calls
+    return {"by_section": summary(), "admission": get_admission().stats(), "recent": recent_calls(limit)}
@@ -27,15 +27,21 @@ st.set_page_config(
 
 # 其他 import
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from iching_system.core.dayan import dayan_six_yao, score_to_yao, get_yao_name
 from iching_system.core.calculator import compute_b_stage
 from iching_system.core.yili_generator import YiliGenerator
-from iching_system.core.yili_llm_adapter import ClaudeLLMAdapter
+from iching_system.core.yili_llm_adapter import create_adapter
+from iching_system.llm.semantic_cache import CachedLLMAdapter
 from iching_system.divination.a3_questionnaire import get_aspects_for_question, classify_question
 from iching_system.divination.a4_agent import QUESTION_ASPECTS, _classify_question as a4_classify, _call_gemini, _extract_context_info, _generate_market_info, _analyze_and_score
 
+# 預生成版本之外，是否再用 LLM 即時個人化（YILI_LIVE_ADAPT=0 關閉）
+LIVE_ADAPT = os.getenv('YILI_LIVE_ADAPT', '1') != '0'
+
 # 初始化 Generator 和 Adapter（只載入一次）
 @st.cache_resource
 def get_generator():
@@ -43,7 +49,118 @@ def get_generator():
 
 @st.cache_resource
 def get_adapter():
-    return ClaudeLLMAdapter()
+    # 語意快取：相近問題抽到同一卦時重用微調結果（所有 session 共用）
+    return CachedLLMAdapter(create_adapter())
+
+# 背景預先微調 s2、s6（所有 session 共用一個執行緒池）
+@st.cache_resource
+def get_prefetch_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="yili-prefetch")
+
+
+def _session_alive(session_id):
+    """session 是否仍連線中（瀏覽器關閉後即為 False）"""
+    try:
+        from streamlit.runtime import Runtime
+        return Runtime.instance().is_active_session(session_id)
+    except Exception:
+        return True  # 無法判斷時視為仍在線
+
+
+def _prefetch_adapt(adapter, content, question, section_name, cancel, session_id):
+    """
+    背景執行緒：串流微調一個段落
+    
+    每收到一段文字就檢查是否已取消或 session 已離開，
+    是的話中止串流（關閉連線），回傳 None
+    """
+    parts = []
+    stream = adapter.adapt_stream(content, question, section_name)
+    try:
+        for text in stream:
+            if cancel.is_set() or not _session_alive(session_id):
+                return None
+            parts.append(text)
+    finally:
+        stream.close()
+    return ''.join(parts)
+
+
+def start_prefetch(sections, question):
+    """s1 開始微調時，同時在背景啟動 s2、s6 的微調"""
+    if 'prefetch' in st.session_state:
+        return
+    
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    session_id = ctx.session_id if ctx else None
+    
+    executor = get_prefetch_executor()
+    adapter = get_adapter()
+    cancel = threading.Event()
+    futures = {
+        's2': executor.submit(_prefetch_adapt, adapter, sections['s2_trend']['content'],
+                              question, 's2', cancel, session_id),
+        's6': executor.submit(_prefetch_adapt, adapter, sections['s6_outlook']['content'],
+                              question, 's6', cancel, session_id),
+    }
+    st.session_state.prefetch = {'cancel': cancel, 'futures': futures}
+
+
+def cancel_prefetch():
+    """取消本 session 尚未完成的背景微調"""
+    prefetch = st.session_state.pop('prefetch', None)
+    if prefetch:
+        prefetch['cancel'].set()
+        for future in prefetch['futures'].values():
+            future.cancel()
+
+
+def stream_adapted(adapter, content, question, section_name):
+    """串流顯示微調結果；串流中途失敗時改為顯示原文，回傳最終顯示的文字"""
+    placeholder = st.empty()
+    try:
+        with placeholder.container():
+            return st.write_stream(adapter.adapt_stream(content, question, section_name))
+    except Exception as e:
+        print(f"串流微調中途失敗（{section_name}）：{e}")
+        placeholder.markdown(content)
+        return content
+
+
+def take_prefetched(key):
+    """
+    取得背景微調結果（不等待）
+    
+    expander 收合時內容仍會執行，這裡不可阻塞，否則整頁會停在此處
+    
+    Returns:
+        (done, text)：仍在執行時 done 為 False（先顯示預生成版本）；
+        已完成時 text 為結果，被取消或失敗時為 None（改為即時串流）
+    """
+    prefetch = st.session_state.get('prefetch')
+    if not prefetch:
+        return True, None
+    future = prefetch['futures'].get(key)
+    if future is None or future.cancelled():
+        return True, None
+    if not future.done():
+        return False, None
+    try:
+        return True, future.result()
+    except Exception:
+        return True, None
+
+
+def rerun_when_prefetched():
+    """整頁顯示完後才等待仍在執行的背景微調，完成時重新執行以換上微調結果"""
+    prefetch = st.session_state.get('prefetch')
+    if not prefetch:
+        return
+    pending = [f for f in prefetch['futures'].values() if not f.done()]
+    if pending:
+        wait(pending)
+        st.rerun()
 
 # 樣式 + PWA 設定
 st.markdown("""
@@ -336,11 +453,18 @@ def show_divining():
     result = generator.generate_a1(yao_values)
     result['meta']['question'] = question if method != 'A1' else ''
     
+    # 有問題時：s1/s2/s6 先換成問題分類的預生成版本
+    variants_complete = False
+    if method != 'A1':
+        variants_complete = generator.apply_variants(result, classify_question(question))
+    
     st.session_state.result = result
     st.session_state.method_used = method
     
-    # 初始化微調狀態
-    st.session_state.adapted = {'s1': False, 's2': False, 's6': False}
+    # 初始化微調狀態（預生成版本齊全且關閉即時微調時，視為已微調）
+    cancel_prefetch()
+    skip_live = variants_complete and not LIVE_ADAPT
+    st.session_state.adapted = {'s1': skip_live, 's2': skip_live, 's6': skip_live}
     st.session_state.step = 'result'
     st.rerun()
 
@@ -370,29 +494,38 @@ def show_result():
     
     st.markdown("---")
     
-    # 1. 現況 - 進入頁面就微調
+    # 1. 現況 - 進入頁面就微調（串流顯示）
     s1 = sections['s1_status']
-    if need_adapt and not adapted['s1']:
-        with st.spinner("AI 正在解讀現況..."):
+    with st.expander(f"📍 1. {s1['title']}（{meta['ben_code']}）", expanded=True):
+        if need_adapt and not adapted['s1']:
+            start_prefetch(sections, question)
             adapter = get_adapter()
-            s1['content'] = adapter.adapt_single(s1['content'], question, 's1')
+            s1['content'] = stream_adapted(adapter, s1['content'], question, 's1')
             adapted['s1'] = True
             st.session_state.adapted = adapted
+        else:
+            st.markdown(s1['content'])
     
-    with st.expander(f"📍 1. {s1['title']}（{meta['ben_code']}）", expanded=True):
-        st.markdown(s1['content'])
-    
-    # 2. 變化趨勢 - 點開時微調
+    # 2. 變化趨勢 - 背景預先微調，點開時直接顯示
     s2 = sections['s2_trend']
     s2_expander = st.expander(f"📈 2. {s2['title']}（{meta['ben_code']}）→（{meta['zhi_code']}）")
     with s2_expander:
         if need_adapt and not adapted['s2']:
-            with st.spinner("AI 正在分析趨勢..."):
-                adapter = get_adapter()
-                s2['content'] = adapter.adapt_single(s2['content'], question, 's2')
+            done, prefetched = take_prefetched('s2')
+            if not done:
+                st.caption("⏳ AI 個人化版本準備中，完成後自動更新")
+                st.markdown(s2['content'])
+            else:
+                if prefetched is not None:
+                    s2['content'] = prefetched
+                    st.markdown(s2['content'])
+                else:
+                    adapter = get_adapter()
+                    s2['content'] = stream_adapted(adapter, s2['content'], question, 's2')
                 adapted['s2'] = True
                 st.session_state.adapted = adapted
-        st.markdown(s2['content'])
+        else:
+            st.markdown(s2['content'])
     
     # 3. 變化過程（預生成，秒出）
     s3 = sections['s3_process']
@@ -423,28 +556,41 @@ def show_result():
             st.markdown(f"*→ {item['action_hint']}*")
             st.markdown("---")
     
-    # 6. 展望 - 點開時微調（跟 s2 一樣）
+    # 6. 展望 - 背景預先微調，點開時直接顯示（跟 s2 一樣）
     s6 = sections['s6_outlook']
     s6_expander = st.expander(f"🌟 6. {s6['title']}（{meta['zhi_code']}）")
     with s6_expander:
+        st.markdown("如果依照上述建議採取行動，未來的局面將會是：")
+        st.markdown("")
         if need_adapt and not adapted['s6']:
-            with st.spinner("AI 正在分析未來展望..."):
-                adapter = get_adapter()
-                s6['content'] = adapter.adapt_single(s6['content'], question, 's6')
+            done, prefetched = take_prefetched('s6')
+            if not done:
+                st.caption("⏳ AI 個人化版本準備中，完成後自動更新")
+                st.markdown(s6['content'])
+            else:
+                if prefetched is not None:
+                    s6['content'] = prefetched
+                    st.markdown(s6['content'])
+                else:
+                    adapter = get_adapter()
+                    s6['content'] = stream_adapted(adapter, s6['content'], question, 's6')
                 adapted['s6'] = True
                 st.session_state.adapted = adapted
-        st.markdown("如果依照上述建議採取行動，未來的局面將會是：")
-        st.markdown("")
-        st.markdown(s6['content'])
+        else:
+            st.markdown(s6['content'])
     
     st.markdown("---")
     if st.button("🔄 重新占卜"):
+        cancel_prefetch()
         st.session_state.step = 'select_method'
         st.session_state.method = None
         st.session_state.question = ''
         st.session_state.scores = [5, 5, 5, 5, 5, 5]
         st.session_state.adapted = {'s1': False, 's2': False, 's6': False}
         st.rerun()
+    
+    if need_adapt:
+        rerun_when_prefetched()
 
 
 if __name__ == "__main__":
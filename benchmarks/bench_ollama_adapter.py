@@ -0,0 +1,98 @@
+"""
+OllamaLLMAdapter 基準測試
+=========================
+啟動一個本地替身伺服器（模擬 Ollama /api/chat 的延遲），
+比較三段微調（s1, s2, s6）的三種做法：
+
+1. 逐段、每次新建連線（舊做法：無連線池）
+2. 逐段並行（連線池）
+3. 批次單一 prompt
+
+執行：
+    python benchmarks/bench_ollama_adapter.py [--latency 0.3] [--rounds 5]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from iching_system.core.yili_llm_adapter import OllamaLLMAdapter
+
+
+LATENCY = 0.3
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """模擬 Ollama：固定延遲；format=json 時回傳批次 JSON"""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, *args):
+        pass
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(LATENCY)
+        prompt = body['messages'][0]['content']
+        if body.get('format') == 'json':
+            # 從 prompt 中取回段落 id，原樣加上標記回傳
+            start, end = prompt.index('{'), prompt.index('}') + 1
+            sections = json.loads(prompt[start:end])
+            content = json.dumps({k: f"[本地] {v}" for k, v in sections.items()}, ensure_ascii=False)
+        else:
+            content = "[本地] 微調後文字"
+        data = json.dumps({"message": {"content": content}, "done": True}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    global LATENCY
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+    LATENCY = args.latency
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    
+    sections = {'s1_status': '現況原文', 's2_trend': '趨勢原文', 's6_outlook': '展望原文'}
+    question = "該不該跳槽？"
+    
+    def run(label, fn):
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            fn()
+        avg = (time.perf_counter() - start) / args.rounds
+        print(f"{label:<28}{avg * 1000:8.1f} ms / 次")
+    
+    def sequential_new_connection():
+        for key, content in sections.items():
+            adapter = OllamaLLMAdapter(base_url=base_url)
+            adapter.adapt(content, question, key)
+            adapter.close()
+    
+    pooled = OllamaLLMAdapter(base_url=base_url, batch=False)
+    batched = OllamaLLMAdapter(base_url=base_url, batch=True)
+    
+    print(f"替身伺服器延遲 {LATENCY * 1000:.0f} ms，三段微調，{args.rounds} 輪平均")
+    run("逐段（每次新連線）", sequential_new_connection)
+    run("並行逐段（連線池）", lambda: pooled.adapt_batch(sections, question))
+    run("批次單一 prompt", lambda: batched.adapt_batch(sections, question))
+    
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Pre-fork 基準測試
+=================
+以不同 worker 數啟動 serve.py，量測：
+
+- 吞吐量：多個壓測程序以 keep-alive 連線持續打 API（預設 GET /api/ask 不微調，
+  每個請求都是不同問題，走完整的起卦 → 解卦 → 序列化，不命中回應快取）
+- 記憶體：壓測後各 worker 的 RSS、PSS 與私有分頁（/proc/<pid>/smaps_rollup）
+  PSS 把共用分頁平均分攤給共用的程序，最能反映 copy-on-write 的效果；
+  加上 --compare-freeze 會再跑一次不呼叫 gc.freeze() 的版本比較
+
+只支援 Linux（fork 與 /proc）。執行：
+    python benchmarks/bench_prefork.py [--workers 1,2,4] [--duration 10] [--clients 8] [--compare-freeze]
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import multiprocessing
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, port: int, freeze: bool) -> subprocess.Popen:
+    cmd = [sys.executable, os.path.join(ROOT, 'serve.py'), '--workers', str(workers),
+           '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    if not freeze:
+        cmd.append('--no-freeze')
+    return subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(port: int, workers: int, timeout: float = 60):
+    """連續多次就緒（請求會分散到各 worker）才開始壓測"""
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while time.monotonic() < deadline:
+        try:
+            ready = httpx.get(f'http://127.0.0.1:{port}/health/ready', timeout=2).status_code == 200
+        except httpx.HTTPError:
+            ready = False
+        streak = streak + 1 if ready else 0
+        if streak >= workers * 4:
+            return
+        time.sleep(0.1)
+    raise TimeoutError("服務未就緒")
+
+
+def client_worker(args):
+    """單一壓測程序：持續送請求直到結束時間，回傳完成數與錯誤數"""
+    port, path, client_id, deadline = args
+    done = errors = 0
+    with httpx.Client(base_url=f'http://127.0.0.1:{port}', timeout=10) as client:
+        while time.time() < deadline:
+            url = path.format(n=f'{client_id}-{done + errors}')
+            try:
+                if client.get(url).status_code == 200:
+                    done += 1
+                else:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+    return done, errors
+
+
+def worker_pids(master: int):
+    with open(f'/proc/{master}/task/{master}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def memory(pid: int):
+    """smaps_rollup 的 Rss / Pss / 私有分頁（MB）"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'private': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+    }
+
+
+def run(workers, freeze, args):
+    port = free_port()
+    server = start_server(workers, port, freeze)
+    try:
+        wait_ready(port, workers)
+        deadline = time.time() + args.duration
+        jobs = [(port, args.path, i, deadline) for i in range(args.clients)]
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(client_worker, jobs)
+        elapsed = time.perf_counter() - start
+
+        done = sum(r[0] for r in results)
+        errors = sum(r[1] for r in results)
+        pids = worker_pids(server.pid) if workers > 1 else [server.pid]
+        mems = [memory(pid) for pid in pids]
+        master = memory(server.pid) if workers > 1 else None
+        return {
+            'workers': workers,
+            'freeze': freeze,
+            'rps': done / elapsed,
+            'errors': errors,
+            'master_rss': master['rss'] if master else None,
+            'rss': sum(m['rss'] for m in mems) / len(mems),
+            'pss': sum(m['pss'] for m in mems) / len(mems),
+            'private': sum(m['private'] for m in mems) / len(mems),
+            'total_pss': sum(m['pss'] for m in mems) + (master['pss'] if master else 0),
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pre-fork 吞吐量與記憶體基準測試")
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--clients', type=int, default=8, help="壓測程序數")
+    parser.add_argument('--path', default='/api/ask?question=bench-{n}&adapt=false',
+                        help="請求路徑，{n} 會換成不重複的編號")
+    parser.add_argument('--compare-freeze', action='store_true', help="另外跑一次不呼叫 gc.freeze()")
+    args = parser.parse_args()
+
+    configs = [(int(n), True) for n in args.workers.split(',')]
+    if args.compare_freeze:
+        configs += [(n, False) for n, _ in configs if n > 1]
+
+    print(f"CPU：{os.cpu_count()}  壓測程序：{args.clients}  每組 {args.duration:.0f}s  路徑：{args.path}")
+    results = [run(workers, freeze, args) for workers, freeze in configs]
+
+    baseline = results[0]['rps']
+    print(f"\n{'workers':>8}{'freeze':>8}{'req/s':>10}{'倍數':>7}{'錯誤':>6}"
+          f"{'master RSS':>12}{'worker RSS':>12}{'worker PSS':>12}{'私有':>9}{'總 PSS':>10}")
+    for r in results:
+        master = f"{r['master_rss']:.1f}" if r['master_rss'] is not None else '-'
+        print(f"{r['workers']:>8}{('是' if r['freeze'] else '否'):>7}{r['rps']:>10.1f}"
+              f"{r['rps'] / baseline:>8.2f}{r['errors']:>6}{master:>12}{r['rss']:>12.1f}"
+              f"{r['pss']:>12.1f}{r['private']:>10.1f}{r['total_pss']:>10.1f}")
+    print("\n記憶體單位 MB；worker 欄位為平均值，總 PSS 含主程序")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+序列化基準測試
+==============
+比較解卦回應的序列化方式（全部 4096 組六爻的 A1 回應 + 問題版）：
+
+1. 舊做法：JSONRenderer（json.dumps indent=2）
+2. 舊做法：FastAPI JSONResponse（標準庫 json，緊湊）
+3. 快速後端 render_reading（orjson / msgspec，緊湊）
+4. JSONRenderer 縮排輸出改用快速後端
+5. 回應快取命中（已序列化的位元組，見 service/response_cache.py）
+
+並檢查輸出一致：
+- 緊湊輸出與標準庫 json.dumps(ensure_ascii=False, separators=(',', ':')) 逐位元組相同
+- 縮排輸出與原本的 JSONRenderer 逐位元組相同
+
+執行：
+    python benchmarks/bench_serialization.py [--backend json] [--rounds 3]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from iching_system.utils import serialization
+from iching_system.core.yili_generator import YiliGenerator
+from iching_system.core.yili_renderer import JSONRenderer
+from iching_system.service import reading as reading_module
+from iching_system.service.response_cache import ResponseCache, cache_key
+
+
+QUESTIONS = ["該不該換工作？", "這段感情該不該繼續？", "明年適合創業嗎？", "要不要搬到台北？"]
+
+
+def build_payloads(generator):
+    async def build():
+        payloads = []
+        for values in itertools.product((6, 7, 8, 9), repeat=6):
+            payloads.append(await reading_module.build_reading(None, generator, None, list(values)))
+        for question in QUESTIONS:
+            payloads.append(await reading_module.build_reading(question, generator))
+        return payloads
+    return asyncio.run(build())
+
+
+def _const(payload):
+    async def compute():
+        return payload
+    return compute
+
+
+def timed(func, payloads, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for payload in payloads:
+            func(payload)
+        best = min(best, time.perf_counter() - start)
+    return best / len(payloads) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解卦回應序列化基準測試")
+    parser.add_argument('--backend', choices=['auto', 'json'], default='auto',
+                        help="json：強制使用標準庫（模擬未安裝 orjson / msgspec）")
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.backend == 'json':
+        serialization.BACKEND = 'json'
+
+    generator = YiliGenerator()
+    payloads = build_payloads(generator)
+
+    def stdlib_indent(p):
+        return json.dumps(p, ensure_ascii=False, indent=2)
+
+    def stdlib_compact(p):
+        return json.dumps(p, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    renderer = JSONRenderer()
+
+    # 一致性
+    for payload in payloads:
+        assert reading_module.render_reading(payload) == stdlib_compact(payload)
+        assert renderer.render(payload) == stdlib_indent(payload)
+    print(f"一致性檢查通過：{len(payloads)} 筆回應（後端 {serialization.BACKEND}）")
+
+    # 回應快取：先填入，再量測命中
+    cache = ResponseCache(max_entries=len(payloads))
+    keys = {id(p): cache_key('bench', i) for i, p in enumerate(payloads)}
+
+    async def fill():
+        for payload in payloads:
+            await cache.get_or_compute(keys[id(payload)], _const(payload),
+                                       serializer=reading_module.render_reading)
+    asyncio.run(fill())
+
+    results = [
+        ('JSONRenderer（json indent=2）', timed(stdlib_indent, payloads, args.rounds)),
+        ('JSONResponse（json 緊湊）', timed(stdlib_compact, payloads, args.rounds)),
+        (f'render_reading（{serialization.BACKEND}）', timed(reading_module.render_reading, payloads, args.rounds)),
+        (f'JSONRenderer（{serialization.BACKEND} indent=2）', timed(renderer.render, payloads, args.rounds)),
+        ('回應快取命中', timed(lambda p: cache._get_local(keys[id(p)]), payloads, args.rounds)),
+    ]
+
+    size_indent = sum(len(stdlib_indent(p).encode('utf-8')) for p in payloads) / len(payloads)
+    size_compact = sum(len(stdlib_compact(p)) for p in payloads) / len(payloads)
+
+    baseline = results[0][1]
+    print(f"\n{'方式':<32}{'每筆 (µs)':>12}{'倍數':>8}")
+    for name, micros in results:
+        print(f"{name:<32}{micros:>12.1f}{baseline / micros:>8.1f}x")
+    print(f"\n平均大小：縮排 {size_indent:.0f} bytes，緊湊 {size_compact:.0f} bytes")
+
+
+if __name__ == '__main__':
+    main()
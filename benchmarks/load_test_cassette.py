@@ -0,0 +1,155 @@
+"""
+離線壓測（LLM cassette 重播）
+=============================
+以錄製好的 LLM 回應（或 synthetic 佔位回應）重播，
+在沒有網路的環境並行跑完整 A2 / A3 / A4 流程：
+
+- A2：報數起卦 → generate_a2（ClaudeLLMAdapter 批次微調）
+- A3：問卷起卦 → generate_a3 + interpret（interpreter._call_llm，經 router）
+- A4：Agent 起卦（Gemini 收集資料與評分）→ generate_a4
+
+先錄製（需要 API Key，以較低並行數跑一輪即可）：
+    python benchmarks/load_test_cassette.py --mode record --requests 6 --concurrency 1
+
+再離線重播：
+    python benchmarks/load_test_cassette.py --requests 60 --concurrency 8 [--latency 0.5]
+
+沒有錄製檔時可用 --synthetic 產生固定延遲的佔位回應：
+    python benchmarks/load_test_cassette.py --synthetic --latency fixed:0.3
+
+問題與分數由 --seed 決定，錄製與重播的請求序列相同
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import contextlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from iching_system.llm import cassette as cassette_module
+from iching_system.llm.cassette import Cassette, set_cassette
+
+
+QUESTIONS = [
+    "該不該換工作？",
+    "這段感情該不該繼續？",
+    "明年適合創業嗎？",
+    "要不要搬到台北？",
+    "該不該接受升遷？",
+    "要不要和對象結婚？",
+]
+
+DESCRIPTION = "目前在科技業工作五年，收到新創公司的邀約，薪水較高但風險也較大"
+
+
+def build_jobs(pipelines, count, seed):
+    """依種子產生固定的請求序列"""
+    rng = random.Random(seed)
+    jobs = []
+    for i in range(count):
+        pipeline = pipelines[i % len(pipelines)]
+        question = rng.choice(QUESTIONS)
+        if pipeline == 'a2':
+            jobs.append(('a2', question, rng.randint(1, 9999)))
+        elif pipeline == 'a3':
+            jobs.append(('a3', question, [rng.randint(0, 10) for _ in range(6)]))
+        else:
+            jobs.append(('a4', question, [rng.randint(0, 10) for _ in range(3)]))
+    return jobs
+
+
+def run_job(job, generator, adapter):
+    from iching_system.divination import number_divination, quick_questionnaire, quick_agent_divination
+    from iching_system.divination.a3_questionnaire import classify_question
+    from iching_system.interpretation import interpret
+
+    pipeline, question, arg = job
+    if pipeline == 'a2':
+        result = number_divination(arg)
+        generator.generate_a2(result['yao_values'], question, adapter, classify_question(question))
+    elif pipeline == 'a3':
+        result = quick_questionnaire(question, arg)
+        generator.generate_a3(result['yao_values'], question, result, adapter, classify_question(question))
+        interpret(question, result['hexagrams'], display=False)
+    else:
+        result = quick_agent_divination(question, DESCRIPTION, arg)
+        generator.generate_a4(result['yao_values'], question, result['context'], adapter, classify_question(question))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM cassette 離線壓測")
+    parser.add_argument('--mode', choices=['record', 'replay'], default='replay')
+    parser.add_argument('--cassette', default=cassette_module.DEFAULT_PATH)
+    parser.add_argument('--latency', default='recorded',
+                        help="recorded / 倍率（如 0.5）/ fixed:秒數 / none")
+    parser.add_argument('--synthetic', action='store_true', help="找不到錄製結果時回傳佔位回應")
+    parser.add_argument('--pipelines', default='a2,a3,a4')
+    parser.add_argument('--requests', type=int, default=30)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    set_cassette(Cassette(
+        path=args.cassette,
+        mode=args.mode,
+        latency=args.latency,
+        on_miss='synthetic' if args.synthetic else 'error'
+    ))
+    os.environ['LLM_CASSETTE_MODE'] = args.mode
+
+    from iching_system.core.yili_generator import YiliGenerator
+    from iching_system.core.yili_llm_adapter import ClaudeLLMAdapter
+    from iching_system.llm import summary
+
+    generator = YiliGenerator()
+    adapter = ClaudeLLMAdapter()
+    jobs = build_jobs(args.pipelines.split(','), args.requests, args.seed)
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+
+    def timed(job):
+        start = time.perf_counter()
+        try:
+            run_job(job, generator, adapter)
+        except Exception as e:
+            errors[job[0]] += 1
+            sys.stderr.write(f"{job[0]} 失敗：{e}\n")
+            return
+        latencies[job[0]].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    # 各流程內的 print 不計入輸出
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(timed, jobs))
+    elapsed = time.perf_counter() - start
+
+    print(f"模式：{args.mode}  延遲：{args.latency}  請求：{len(jobs)}  並行：{args.concurrency}")
+    print(f"{'流程':<6}{'完成':>6}{'失敗':>6}{'p50':>10}{'p95':>10}{'max':>10}")
+    for pipeline in args.pipelines.split(','):
+        values = latencies[pipeline]
+        if values:
+            print(f"{pipeline:<6}{len(values):>6}{errors[pipeline]:>6}"
+                  f"{percentile(values, 0.5):>10.3f}{percentile(values, 0.95):>10.3f}{max(values):>10.3f}")
+        else:
+            print(f"{pipeline:<6}{0:>6}{errors[pipeline]:>6}")
+    print(f"總耗時 {elapsed:.2f}s，吞吐量 {len(jobs) / elapsed:.2f} req/s")
+
+    print("\n各段落 LLM 呼叫：")
+    for section, stats in sorted(summary().items()):
+        print(f"  {section:<14}{stats['calls']:>5} 次  平均 {stats['avg_wall_time']:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
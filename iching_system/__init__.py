@@ -51,6 +51,7 @@ from .divination import (
 # 解卦模組
 from .interpretation import (
     interpret,
+    interpret_stream,
     quick_interpret
 )
 
@@ -87,6 +88,7 @@ __all__ = [
     
     # 解卦
     'interpret',
+    'interpret_stream',
     'quick_interpret',
     
     # 設定
@@ -19,6 +19,9 @@ from pathlib import Path
 # 資料快取
 _DATA_CACHE: Dict[str, Dict] = {}
 
+# 卦碼索引（version -> {卦碼: 卦資料}），隨 load_data 建立
+_CODE_INDEX: Dict[str, Dict[str, Dict]] = {}
+
 # 資料目錄
 _DATA_DIR: Optional[str] = None
 
@@ -95,6 +98,10 @@ def load_data(version: str = 'modern2') -> Dict:
     # 自動修復編碼問題（UTF-8 字元被錯誤以 Latin-1 保存）
     data = _fix_encoding(data)
     
+    _CODE_INDEX[version] = {
+        value['code']: value for value in data.values()
+        if isinstance(value, dict) and 'code' in value
+    }
     _DATA_CACHE[version] = data
     
     return _DATA_CACHE[version]
@@ -137,8 +144,9 @@ def _fix_encoding(obj):
 
 def clear_cache():
     """清除資料快取（用於重新載入）"""
-    global _DATA_CACHE
+    global _DATA_CACHE, _CODE_INDEX
     _DATA_CACHE = {}
+    _CODE_INDEX = {}
 
 
 def get_hexagram(code: str, version: str = 'modern2') -> Dict:
@@ -158,10 +166,10 @@ def get_hexagram(code: str, version: str = 'modern2') -> Dict:
     if code in data:
         return data[code]
     
-    # 有些資料可能用卦名作 key
-    for key, value in data.items():
-        if isinstance(value, dict) and value.get('code') == code:
-            return value
+    # 資料以卦序為 key 時，查卦碼索引
+    entry = _CODE_INDEX.get(version, {}).get(code)
+    if entry is not None:
+        return entry
     
     return {'code': code, 'name': '未知', 'error': f'找不到卦碼 {code}'}
 
@@ -243,8 +251,9 @@ def get_all_hexagram_codes() -> list:
 
 def clear_cache():
     """清除資料快取"""
-    global _DATA_CACHE
+    global _DATA_CACHE, _CODE_INDEX
     _DATA_CACHE = {}
+    _CODE_INDEX = {}
 
 
 # 便捷函數
@@ -6,15 +6,48 @@ YiliGenerator: 生成六點解卦內容（純資料，不含渲染）
     generator = YiliGenerator()
     result = generator.generate_a1(yao_values)  # A1 制式答案
     result = generator.generate_a2(yao_values, question, llm_adapter)  # A2 有問題版
+
+問題分類預生成版本（yili_variants.json，由 precompute_variants.py 離線產生）：
+    generator.apply_variants(result, 'career')  # s1/s2/s6 換成職涯版
+    generator.generate(yao_values, question, category='career')  # 同上，分類由呼叫端決定
 """
 
 import json
 import os
+import asyncio
+
+
+# 預生成版本檔案與其分類（與 a3_questionnaire.classify_question 一致）
+VARIANTS_FILENAME = 'yili_variants.json'
+VARIANT_CATEGORIES = ('career', 'relationship', 'general')
 
 
 class YiliGenerator:
     """生成六點解卦內容（純資料，不含渲染）"""
     
+    # 依問題微調的段落：(段落 id, 段落名稱)；其餘 s3, s4, s5 只由六爻決定
+    KEY_SECTIONS = (('s1_status', '現況'), ('s2_trend', '變化趨勢'), ('s6_outlook', '展望'))
+    
+    SECTION_TITLES = {
+        's1_status': '現況',
+        's2_trend': '變化趨勢',
+        's3_process': '變化過程中會面臨的情況',
+        's4_stages': '六階段境遇',
+        's5_advice': '建議',
+        's6_outlook': '依建議行動後的展望',
+    }
+    
+    # 建議的行動提示：(action, 內/外) -> 文字
+    ACTION_HINTS = {
+        ('promote', '內'): '這是值得積極推動的方向，順勢而為會有好結果。',
+        ('promote', '外'): '外在條件支持這個變化，把握機會順勢推進。',
+        ('prevent', '內'): '這個變化目前不宜強推，守住現狀較為有利。',
+        ('prevent', '外'): '外在變化暫時不利，建議觀望等待更好時機。',
+        # 靜卦時建議主動改變
+        ('change', '內'): '雖然目前穩定，但主動在此方向努力會帶來正向改變。',
+        ('change', '外'): '可以主動觀察並創造這個方向的外在機會。',
+    }
+    
     def __init__(self, data_path=None):
         """載入三個 JSON"""
         if data_path is None:
@@ -25,12 +58,22 @@ class YiliGenerator:
         with open(os.path.join(data_path, 'i_ching_modern2.json'), 'r', encoding='utf-8') as f:
             self.modern2 = json.load(f)
         
+        # 卦碼索引：卦碼 -> (卦序, 卦資料)
+        self._by_code = {entry['code']: (k, entry) for k, entry in self.modern2.items()}
+        
         with open(os.path.join(data_path, 'yili_general.json'), 'r', encoding='utf-8') as f:
             self.general = json.load(f)
         
         with open(os.path.join(data_path, 'yili_4096_trends.json'), 'r', encoding='utf-8') as f:
             self.trends = json.load(f)
         
+        # 問題分類預生成版本（可選，檔案不存在時只有中性版）
+        self.variants = {'s1': {}, 's2': {}, 's6': {}}
+        variants_path = os.path.join(data_path, VARIANTS_FILENAME)
+        if os.path.exists(variants_path):
+            with open(variants_path, 'r', encoding='utf-8') as f:
+                self.variants.update(json.load(f).get('sections', {}))
+        
         # 常數
         self.LINE_NAMES = {
             1: "基礎能力", 2: "外在表現", 3: "成長潛力",
@@ -219,17 +262,13 @@ class YiliGenerator:
     
     def _get_entry_by_code(self, code):
         """根據卦碼取得卦資料"""
-        for entry in self.modern2.values():
-            if entry['code'] == code:
-                return entry
-        return None
+        item = self._by_code.get(code)
+        return item[1] if item else None
     
     def _get_hex_number_by_code(self, code):
         """根據卦碼取得卦號"""
-        for k, entry in self.modern2.items():
-            if entry['code'] == code:
-                return k
-        return None
+        item = self._by_code.get(code)
+        return item[0] if item else None
     
     def calculate_hexagrams(self, yao_values):
         """
@@ -325,13 +364,13 @@ class YiliGenerator:
         
         # 【1. 現況】
         result['sections']['s1_status'] = {
-            'title': '現況',
+            'title': self.SECTION_TITLES['s1_status'],
             'content': ben_template.get('卦解', '')
         }
         
         # 【2. 變化趨勢】
         result['sections']['s2_trend'] = {
-            'title': '變化趨勢',
+            'title': self.SECTION_TITLES['s2_trend'],
             'content': trend_data.get('趨勢', '')
         }
         
@@ -340,7 +379,7 @@ class YiliGenerator:
             trans_text = trans_template.get('卦解', '')
             trans_text = self._adapt_text_for_section(trans_text, 'trans')
             result['sections']['s3_process'] = {
-                'title': '變化過程中會面臨的情況',
+                'title': self.SECTION_TITLES['s3_process'],
                 'content': trans_text
             }
         else:
@@ -357,7 +396,7 @@ class YiliGenerator:
                 'is_change': i in change_positions
             })
         result['sections']['s4_stages'] = {
-            'title': '六階段境遇',
+            'title': self.SECTION_TITLES['s4_stages'],
             'stages': stages
         }
         
@@ -374,12 +413,7 @@ class YiliGenerator:
             # 根據 action 調整建議文字
             base_advice = ben_template.get('6789建議', {}).get(str(pos), {}).get(str(v), '')
             
-            if action == 'promote':
-                action_hint = '這是值得積極推動的方向，順勢而為會有好結果。' if scope == '內' else '外在條件支持這個變化，把握機會順勢推進。'
-            elif action == 'prevent':
-                action_hint = '這個變化目前不宜強推，守住現狀較為有利。' if scope == '內' else '外在變化暫時不利，建議觀望等待更好時機。'
-            else:  # change（靜卦時建議主動改變）
-                action_hint = '雖然目前穩定，但主動在此方向努力會帶來正向改變。' if scope == '內' else '可以主動觀察並創造這個方向的外在機會。'
+            action_hint = self.ACTION_HINTS[(action, scope)]
             
             advices.append({
                 'position': pos,
@@ -391,7 +425,7 @@ class YiliGenerator:
             })
         
         result['sections']['s5_advice'] = {
-            'title': '建議',
+            'title': self.SECTION_TITLES['s5_advice'],
             'is_static': len(change_positions) == 0,
             'items': advices
         }
@@ -400,14 +434,81 @@ class YiliGenerator:
         zhi_text = zhi_template.get('卦解', '')
         zhi_text = self._adapt_text_for_section(zhi_text, 'outlook')
         result['sections']['s6_outlook'] = {
-            'title': '依建議行動後的展望',
+            'title': self.SECTION_TITLES['s6_outlook'],
             'content': zhi_text
         }
         
         return result
     
+    # === 模板文字 ===
+    def template_chunks(self):
+        """
+        generate_a1 會用到的固定文字，依卦分組（精簡回應以編號引用，見 service/compact.py）
+        
+        Returns:
+            65 組文字清單：
+            [0] 共用文字（段落標題、階段名稱、爻位名稱、行動提示）
+            [n] 第 n 卦：卦解、變化過程版、展望版、六階段 1-6、6789建議（爻位 1-6 × 6/7/8/9）
+            順序固定；資料檔改變時內容跟著改變
+        """
+        common = list(self.SECTION_TITLES.values())
+        common += self.STAGE_NAMES + self.SCOPE_LABELS[::3]
+        common += [self.LINE_NAMES[i] for i in range(1, 7)]
+        common += list(self.ACTION_HINTS.values())
+        
+        chunks = [common]
+        for num in range(1, 65):
+            template = self.general.get(str(num), {})
+            text = template.get('卦解', '')
+            chunk = [text, self._adapt_text_for_section(text, 'trans'), self._adapt_text_for_section(text, 'outlook')]
+            chunk += [template.get('六階段', {}).get(str(i), '') for i in range(1, 7)]
+            advice = template.get('6789建議', {})
+            chunk += [advice.get(str(pos), {}).get(str(v), '') for pos in range(1, 7) for v in (6, 7, 8, 9)]
+            chunks.append(chunk)
+        return chunks
+    
+    # === 問題分類預生成版本 ===
+    def variant_keys(self, meta):
+        """
+        s1/s2/s6 在 yili_variants.json 中的 key
+        
+        s1：本卦卦號；s2：本卦_之卦；s6：之卦卦號
+        """
+        ben_num = self._get_hex_number_by_code(meta['ben_code'])
+        zhi_num = self._get_hex_number_by_code(meta['zhi_code'])
+        return {
+            's1_status': ('s1', ben_num),
+            's2_trend': ('s2', f"{ben_num}_{zhi_num}"),
+            's6_outlook': ('s6', zhi_num),
+        }
+    
+    def apply_variants(self, result, category):
+        """
+        將 s1/s2/s6 換成該分類的預生成版本（就地修改）
+        
+        Args:
+            result: generate_a1 的結果
+            category: 'career' | 'relationship' | 'general'
+        
+        Returns:
+            是否三段都有預生成版本（False 時缺的段落保留中性版）；
+            至少換上一段時才在 meta['variant'] 記錄分類
+        """
+        complete = True
+        applied = False
+        for section_id, (group, key) in self.variant_keys(result['meta']).items():
+            text = self.variants.get(group, {}).get(key, {}).get(category)
+            if text:
+                result['sections'][section_id]['content'] = text
+                applied = True
+            else:
+                complete = False
+        if applied:
+            result['meta']['variant'] = category
+        return complete
+    
     # === 統一生成方法 ===
-    def generate(self, yao_values, question=None, llm_adapter=None):
+    def generate(self, yao_values, question=None, llm_adapter=None, category=None):
         """
         統一生成六點解卦
         
@@ -417,24 +518,23 @@ class YiliGenerator:
                 - None: 返回中性版（A1 模式）
                 - str: 有問題版（A2/A3 模式）
             llm_adapter: LLM 微調適配器（可選）
-                - None: 返回中性版（即使有 question）
+                - None: 返回中性版或預生成版（即使有 question）
                 - 有值: 微調 s1, s2, s6（關鍵段落）
+            category: 問題分類（a3_questionnaire.classify_question 的結果）；
+                有 question 且有值時，先換成該分類的預生成版本
+                （LLM 微調變成可選的額外個人化）
         
         Returns:
             dict with meta and sections
         """
-        # 先取得中性版（A1）
-        result = self.generate_a1(yao_values)
-        
-        # 如果沒有 question，直接返回中性版
+        # 如果沒有 question，直接返回中性版（A1）
         if question is None:
-            return result
+            return self.generate_a1(yao_values)
         
-        # 有 question，設定模式
-        result['meta']['mode'] = 'A2'
-        result['meta']['question'] = question
+        # 有 question：中性版加上 A2 標記與預生成版本
+        result = self._question_result(yao_values, question, category)
         
-        # 如果沒有 adapter，返回中性版（只加 question 標記）
+        # 如果沒有 adapter，返回中性版或預生成版（只加 question 標記）
         if llm_adapter is None:
             return result
         
@@ -442,6 +542,17 @@ class YiliGenerator:
         # s3（變化過程）、s4（六階段）、s5（建議）保持中性版
         sections = result['sections']
         
+        # 支援批次微調的 adapter：一次呼叫處理三段
+        if hasattr(llm_adapter, 'adapt_batch'):
+            adapted = llm_adapter.adapt_batch({
+                's1_status': sections['s1_status']['content'],
+                's2_trend': sections['s2_trend']['content'],
+                's6_outlook': sections['s6_outlook']['content'],
+            }, question, names=dict(self.KEY_SECTIONS))
+            for key, content in adapted.items():
+                sections[key]['content'] = content
+            return result
+        
         # 微調 s1 現況
         sections['s1_status']['content'] = llm_adapter.adapt(
             sections['s1_status']['content'], question, '現況'
@@ -459,31 +570,95 @@ class YiliGenerator:
         
         return result
     
+    def _question_result(self, yao_values, question, category=None):
+        """
+        有問題版的基礎結果（generate 與 generate_a2 / a3 / a4 共用）
+        
+        中性版（A1）標記 A2 模式與問題；有 category 時 s1/s2/s6
+        換成該分類的預生成版本
+        """
+        result = self.generate_a1(yao_values)
+        result['meta']['mode'] = 'A2'
+        result['meta']['question'] = question
+        
+        if category:
+            self.apply_variants(result, category)
+        return result
+    
+    async def agenerate(self, yao_values, question=None, llm_adapter=None, category=None):
+        """
+        generate 的非同步版本（供 async API 使用）
+        
+        查表與預生成版本同 generate；s1, s2, s6 的微調以 await 等待，
+        等待 LLM 時不佔用執行緒
+        """
+        result = self.generate(yao_values, question, category=category)
+        if question is not None and llm_adapter is not None:
+            await self.aadapt_key_sections(result, question, llm_adapter)
+        return result
+    
+    async def aadapt_key_sections(self, result, question, llm_adapter):
+        """
+        非同步微調關鍵段落 s1, s2, s6（就地修改 result）
+        
+        優先使用 adapter 的 aadapt_batch / aadapt；
+        只有同步方法的 adapter 改在執行緒中呼叫
+        
+        完成後 meta['adapted'] 記錄實際微調成功的段落
+        （adapter 失敗時回傳原文，該段不列入）
+        """
+        sections = result['sections']
+        keys = self.KEY_SECTIONS
+        originals = {key: sections[key]['content'] for key, _ in keys}
+        
+        if hasattr(llm_adapter, 'aadapt_batch'):
+            adapted = await llm_adapter.aadapt_batch(originals, question, names=dict(keys))
+        elif hasattr(llm_adapter, 'aadapt'):
+            texts = await asyncio.gather(*(
+                llm_adapter.aadapt(originals[key], question, name) for key, name in keys
+            ))
+            adapted = {key: text for (key, _), text in zip(keys, texts)}
+        elif hasattr(llm_adapter, 'adapt_batch'):
+            adapted = await asyncio.to_thread(llm_adapter.adapt_batch, originals, question, names=dict(keys))
+        else:
+            texts = await asyncio.gather(*(
+                asyncio.to_thread(llm_adapter.adapt, originals[key], question, name) for key, name in keys
+            ))
+            adapted = {key: text for (key, _), text in zip(keys, texts)}
+        
+        for key, content in adapted.items():
+            sections[key]['content'] = content
+        result['meta']['adapted'] = sorted(k for k, v in adapted.items() if v != originals[k])
+        return result
+    
     # === A2 有問題版生成（保留向下相容）===
-    def generate_a2(self, yao_values, question, llm_adapter=None):
+    def generate_a2(self, yao_values, question, llm_adapter=None, category=None):
         """
-        A2 有問題版：中性版 + LLM 微調
+        A2 有問題版：中性版（或預生成版）+ LLM 微調
         
         Args:
             yao_values: list of 6 values
             question: 用戶問題字串
             llm_adapter: LLM 微調適配器（需有 adapt 方法）
+            category: 問題分類；有值時 s1/s2/s6 先換成該分類的預生成版本（同 generate）
         
         Returns:
             dict with meta and sections (微調後)
         """
-        # 先取得 A1 結果
-        base_result = self.generate_a1(yao_values)
-        base_result['meta']['mode'] = 'A2'
-        base_result['meta']['question'] = question
+        base_result = self._question_result(yao_values, question, category)
         
         if llm_adapter is None:
-            # 無 LLM，直接返回中性版
+            # 無 LLM，直接返回中性版或預生成版
             return base_result
         
         # 有 LLM，進行微調
         sections = base_result['sections']
         
+        # 支援批次微調的 adapter：整份解卦一次呼叫
+        if hasattr(llm_adapter, 'adapt_batch'):
+            self._adapt_all_batch(sections, question, llm_adapter)
+            return base_result
+        
         # 微調各段落
         sections['s1_status']['content'] = llm_adapter.adapt(
             sections['s1_status']['content'], question, '現況'
@@ -515,17 +690,44 @@ class YiliGenerator:
         
         return base_result
     
+    def _adapt_all_batch(self, sections, question, llm_adapter):
+        """
+        批次微調全部段落（s1-s6，含六階段與各項建議）
+        
+        以扁平的段落 id 送出，例如 s4_stage_3、s5_advice_2，
+        回傳後依 id 寫回 sections；段落名稱與逐段微調相同（adapter 逐段補齊時使用）
+        """
+        targets = {
+            's1_status': (sections['s1_status'], 'content', '現況'),
+            's2_trend': (sections['s2_trend'], 'content', '變化趨勢'),
+            's6_outlook': (sections['s6_outlook'], 'content', '展望'),
+        }
+        if sections['s3_process']:
+            targets['s3_process'] = (sections['s3_process'], 'content', '變化過程')
+        for stage in sections['s4_stages']['stages']:
+            targets[f"s4_stage_{stage['position']}"] = (stage, 'content', f"第{stage['position']}階段")
+        for item in sections['s5_advice']['items']:
+            targets[f"s5_advice_{item['position']}"] = (item, 'advice', f"建議-{item['name']}")
+        
+        adapted = llm_adapter.adapt_batch(
+            {key: obj[field] for key, (obj, field, _) in targets.items()}, question,
+            names={key: name for key, (_, _, name) in targets.items()}
+        )
+        for key, content in adapted.items():
+            obj, field, _ = targets[key]
+            obj[field] = content
+    
     # === A3/A4 預留接口 ===
-    def generate_a3(self, yao_values, question, questionnaire_data, llm_adapter=None):
+    def generate_a3(self, yao_values, question, questionnaire_data, llm_adapter=None, category=None):
         """A3 問卷版（預留）"""
-        result = self.generate_a2(yao_values, question, llm_adapter)
+        result = self.generate_a2(yao_values, question, llm_adapter, category)
         result['meta']['mode'] = 'A3'
         result['meta']['questionnaire'] = questionnaire_data
         return result
     
-    def generate_a4(self, yao_values, question, agent_context, llm_adapter=None):
+    def generate_a4(self, yao_values, question, agent_context, llm_adapter=None, category=None):
         """A4 Agent 版（預留）"""
-        result = self.generate_a2(yao_values, question, llm_adapter)
+        result = self.generate_a2(yao_values, question, llm_adapter, category)
         result['meta']['mode'] = 'A4'
         result['meta']['agent_context'] = agent_context
         return result
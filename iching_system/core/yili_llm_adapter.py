@@ -2,19 +2,34 @@
 易力決策 - LLM 微調適配器
 用於 A2 模式，將中性版文字根據問題進行微調
 支援漸進式載入：s1 → s2 → s6（個別呼叫）
+支援批次微調：一次呼叫處理整份解卦的多個段落（JSON 結構化輸出）
+支援串流微調：adapt_stream 逐段 yield 文字增量
+支援本地 LLM：OllamaLLMAdapter（Ollama / OpenAI 相容端點）
+支援非同步：aadapt / aadapt_stream / aadapt_batch（供 async API 使用，不佔用執行緒）
 """
 
 import os
-from anthropic import Anthropic
+import re
+import json
+import asyncio
+import weakref
+
+from ..llm.clients import get_anthropic_client, get_async_anthropic_client
+from ..llm.telemetry import llm_call, in_context
+
+
+# 一次批次呼叫最多幾段：每段輸出數百 tokens，整份 A2（約 15 段）一次送出
+# 會超過 max_tokens，JSON 被截斷後全部退回逐段呼叫
+BATCH_MAX_SECTIONS = int(os.environ.get('LLM_BATCH_MAX_SECTIONS', '6'))
 
 
 class ClaudeLLMAdapter:
     """Claude API 微調適配器"""
     
     def __init__(self, api_key=None, use_haiku=True):
-        if api_key is None:
-            api_key = os.environ.get('ANTHROPIC_API_KEY')
-        self.client = Anthropic(api_key=api_key)
+        # 共用連線池的客戶端（api_key 為 None 時讀取 ANTHROPIC_API_KEY）
+        self.api_key = api_key
+        self.client = get_anthropic_client(api_key)
         
         # Haiku 快又便宜，適合改寫任務
         if use_haiku:
@@ -34,7 +49,195 @@ class ClaudeLLMAdapter:
         Returns:
             微調後的文字
         """
-        prompt = f"""你是一位專業的易經解讀助手。
+        prompt = _build_prompt(content, question)
+
+        try:
+            with llm_call('claude', self.model, section=section_name) as call:
+                response = self.client.messages.create(
+                    model=self.model,
+                    max_tokens=500,
+                    messages=[{"role": "user", "content": prompt}]
+                )
+                call.set_usage(response.usage.input_tokens, response.usage.output_tokens)
+            return response.content[0].text.strip()
+        except Exception as e:
+            print(f"LLM 微調失敗（{section_name}）：{e}")
+            return content  # 失敗時返回原文
+    
+    def adapt_single(self, content, question, section_name):
+        """單獨微調一個段落（用於漸進式載入）"""
+        return self.adapt(content, question, section_name)
+    
+    def adapt_stream(self, content, question, section_name):
+        """
+        串流微調：邊生成邊 yield 文字增量
+        
+        Yields:
+            str 文字片段；全部串接即為微調後的文字
+            若尚未輸出任何片段就失敗，則 yield 原文；
+            已輸出部分片段後失敗則拋出例外，呼叫端應捨棄已收到的片段、改用原文
+        """
+        prompt = _build_prompt(content, question)
+        started = False
+        try:
+            with llm_call('claude', self.model, section=section_name) as call, \
+                    self.client.messages.stream(
+                        model=self.model,
+                        max_tokens=500,
+                        messages=[{"role": "user", "content": prompt}]
+                    ) as stream:
+                for text in stream.text_stream:
+                    if not started:
+                        # 與 adapt 一致：去掉開頭空白
+                        text = text.lstrip()
+                        if not text:
+                            continue
+                        started = True
+                        call.first_token()
+                    yield text
+                usage = stream.get_final_message().usage
+                call.set_usage(usage.input_tokens, usage.output_tokens)
+        except Exception as e:
+            print(f"LLM 串流微調失敗（{section_name}）：{e}")
+            if started:
+                raise  # 已輸出部分文字，交由呼叫端改用原文
+            yield content  # 失敗時返回原文
+    
+    def adapt_batch(self, sections, question, names=None):
+        """
+        批次微調：一次呼叫處理多個段落（超過 BATCH_MAX_SECTIONS 段時分批並行）
+        
+        Args:
+            sections: dict {段落 id: 中性版文字}
+            question: 用戶問題
+            names: dict {段落 id: 段落名稱}，逐段補齊時使用（預設為段落 id）
+        
+        Returns:
+            dict {段落 id: 微調後的文字}
+            JSON 解析失敗或缺少段落時，只對缺漏的段落逐段呼叫 adapt 補齊
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        
+        sections = {k: v for k, v in sections.items() if v}
+        if not sections:
+            return {}
+        
+        chunks = _chunk_sections(sections)
+        adapted = {}
+        if len(chunks) == 1:
+            adapted = self._batch_call(chunks[0], question)
+        else:
+            with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+                for result in pool.map(in_context(lambda chunk: self._batch_call(chunk, question)), chunks):
+                    adapted.update(result)
+        
+        # 解析失敗或缺漏的段落：逐段補齊
+        for key, content in sections.items():
+            if key not in adapted:
+                adapted[key] = self.adapt(content, question, _section_name(key, names))
+        
+        return adapted
+    
+    def _batch_call(self, sections, question):
+        """一次批次呼叫；失敗時回傳 {}，輸出被截斷時回傳已完整的段落"""
+        try:
+            with llm_call('claude', self.model, section='batch') as call:
+                response = self.client.messages.create(
+                    model=self.model,
+                    max_tokens=min(500 * len(sections), 4096),
+                    messages=[{"role": "user", "content": _build_batch_prompt(sections, question)}]
+                )
+                call.set_usage(response.usage.input_tokens, response.usage.output_tokens)
+            return _parse_batch_response(response.content[0].text, sections)
+        except Exception as e:
+            print(f"LLM 批次微調失敗，改為逐段微調：{e}")
+            return {}
+    
+    # === 非同步介面 ===
+    def _messages(self, prompt, max_tokens=500):
+        return dict(
+            model=self.model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    
+    async def aadapt(self, content, question, section_name):
+        """adapt 的非同步版本（AsyncAnthropic，等待期間不佔用執行緒）"""
+        prompt = _build_prompt(content, question)
+        
+        try:
+            client = get_async_anthropic_client(self.api_key)
+            with llm_call('claude', self.model, section=section_name) as call:
+                response = await client.messages.create(**self._messages(prompt))
+                call.set_usage(response.usage.input_tokens, response.usage.output_tokens)
+            return response.content[0].text.strip()
+        except Exception as e:
+            print(f"LLM 微調失敗（{section_name}）：{e}")
+            return content
+    
+    async def aadapt_stream(self, content, question, section_name):
+        """adapt_stream 的非同步版本"""
+        prompt = _build_prompt(content, question)
+        started = False
+        try:
+            client = get_async_anthropic_client(self.api_key)
+            with llm_call('claude', self.model, section=section_name) as call:
+                async with client.messages.stream(**self._messages(prompt)) as stream:
+                    async for text in stream.text_stream:
+                        if not started:
+                            text = text.lstrip()
+                            if not text:
+                                continue
+                            started = True
+                            call.first_token()
+                        yield text
+                    usage = (await stream.get_final_message()).usage
+                    call.set_usage(usage.input_tokens, usage.output_tokens)
+        except Exception as e:
+            print(f"LLM 串流微調失敗（{section_name}）：{e}")
+            if started:
+                raise
+            yield content
+    
+    async def aadapt_batch(self, sections, question, names=None):
+        """adapt_batch 的非同步版本；各批並行，缺漏的段落並行補齊"""
+        sections = {k: v for k, v in sections.items() if v}
+        if not sections:
+            return {}
+        
+        adapted = {}
+        for result in await asyncio.gather(*(
+            self._abatch_call(chunk, question) for chunk in _chunk_sections(sections)
+        )):
+            adapted.update(result)
+        
+        missing = [k for k in sections if k not in adapted]
+        if missing:
+            results = await asyncio.gather(*(
+                self.aadapt(sections[k], question, _section_name(k, names)) for k in missing
+            ))
+            adapted.update(zip(missing, results))
+        
+        return adapted
+    
+    async def _abatch_call(self, sections, question):
+        """_batch_call 的非同步版本"""
+        try:
+            client = get_async_anthropic_client(self.api_key)
+            with llm_call('claude', self.model, section='batch') as call:
+                response = await client.messages.create(**self._messages(
+                    _build_batch_prompt(sections, question), max_tokens=min(500 * len(sections), 4096)
+                ))
+                call.set_usage(response.usage.input_tokens, response.usage.output_tokens)
+            return _parse_batch_response(response.content[0].text, sections)
+        except Exception as e:
+            print(f"LLM 批次微調失敗，改為逐段微調：{e}")
+            return {}
+
+
+def _build_prompt(content, question):
+    """單段微調的 prompt"""
+    return f"""你是一位專業的易經解讀助手。
 
 用戶的問題是：「{question}」
 
@@ -53,27 +256,405 @@ class ClaudeLLMAdapter:
 
 修改後："""
 
+
+def _chunk_sections(sections, size=None):
+    """依 BATCH_MAX_SECTIONS 把 {段落 id: 原文} 切成多批"""
+    size = size or BATCH_MAX_SECTIONS
+    items = list(sections.items())
+    return [dict(items[i:i + size]) for i in range(0, len(items), size)]
+
+
+def _section_name(key, names):
+    """逐段補齊時的段落名稱（prompt 與遙測用）"""
+    return (names or {}).get(key, key)
+
+
+def _build_batch_prompt(sections, question):
+    """批次微調的 prompt（要求以 JSON 物件回傳）"""
+    payload = json.dumps(sections, ensure_ascii=False, indent=2)
+    return f"""你是一位專業的易經解讀助手。
+
+用戶的問題是：「{question}」
+
+以下是一份解卦的多個中性段落（JSON 物件，key 為段落 id，value 為原文），請根據用戶的問題，將每段描述中的抽象概念具體化，讓用戶能更容易理解這些話與他的問題的關聯。
+
+原文：
+{payload}
+
+要求：
+1. 保持每段原文的核心意涵和結構
+2. 將「你」的處境自然連結到用戶的問題情境
+3. 可適當加入與問題相關的具體比喻或情境
+4. 每段字數控制在該段原文的 1.0-1.3 倍之間
+5. 語氣保持溫和、鼓勵、中性
+6. 只輸出一個 JSON 物件，key 與原文完全相同，value 為修改後的文字，不要加任何說明
+
+修改後："""
+
+
+# JSON 物件中的一組 "key": "value"（字串可含跳脫字元）
+_JSON_PAIR_RE = re.compile(r'"((?:[^"\\]|\\.)*)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def _parse_batch_response(text, sections):
+    """
+    解析批次微調的 JSON 回應
+    
+    輸出超過 max_tokens 被截斷時，取出已完整輸出的段落，
+    只有缺漏的段落需要逐段補齊
+    
+    Returns:
+        dict，只包含 key 存在於 sections 且 value 為非空字串的段落
+    """
+    json_text = re.sub(r'```json\s*', '', text)
+    json_text = re.sub(r'```\s*', '', json_text).strip()
+    
+    # 容忍 JSON 前後夾雜說明文字
+    start, end = json_text.find('{'), json_text.rfind('}')
+    if start == -1:
+        return {}
+    
+    try:
+        data = json.loads(json_text[start:end + 1]) if end > start else None
+    except ValueError:
+        data = None
+    
+    if data is None:
+        data = {}
+        for match in _JSON_PAIR_RE.finditer(json_text, start):
+            try:
+                data[json.loads(f'"{match.group(1)}"')] = json.loads(f'"{match.group(2)}"')
+            except ValueError:
+                continue
+    
+    if not isinstance(data, dict):
+        return {}
+    
+    return {
+        k: v.strip() for k, v in data.items()
+        if k in sections and isinstance(v, str) and v.strip()
+    }
+
+
+class OllamaLLMAdapter:
+    """
+    本地 LLM 適配器（Ollama 或 OpenAI 相容端點）
+    
+    - 持久的 HTTP 連線池（httpx.Client，keep-alive）
+    - adapt_batch 先嘗試單一 JSON prompt，缺漏的段落再並行逐段呼叫
+    - 介面與 ClaudeLLMAdapter 相同，可直接給 YiliGenerator / app 使用
+    
+    Args:
+        model_name: 模型名稱
+        base_url: 端點，預設讀取 OLLAMA_BASE_URL（http://localhost:11434）
+        api: 'ollama'（/api/chat）或 'openai'（/v1/chat/completions，
+            適用 vLLM、llama.cpp server、LM Studio 等）
+        max_concurrency: 並行逐段呼叫的上限
+        batch: 是否先嘗試單一 prompt 批次微調
+    """
+    
+    def __init__(self, model_name="llama3.2:1b", base_url=None, api='ollama',
+                 max_concurrency=4, batch=True, timeout=120.0):
+        import httpx
+        
+        if api not in ('ollama', 'openai'):
+            raise ValueError(f"未知的 api: {api}，可用: ollama, openai")
+        
+        self.model_name = model_name
+        self.base_url = (base_url or os.environ.get('OLLAMA_BASE_URL', 'http://localhost:11434')).rstrip('/')
+        self.api = api
+        self.max_concurrency = max_concurrency
+        self.batch = batch
+        self.timeout = timeout
+        self.client = httpx.Client(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=self._limits()
+        )
+        # httpx.AsyncClient 綁定 event loop，每個 loop 一個（loop 回收後一併釋放）
+        self._async_clients = weakref.WeakKeyDictionary()
+    
+    def _limits(self):
+        import httpx
+        return httpx.Limits(
+            max_connections=self.max_concurrency * 2,
+            max_keepalive_connections=self.max_concurrency
+        )
+    
+    def _async_client(self):
+        import httpx
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self._limits())
+            self._async_clients[loop] = client
+        return client
+    
+    def close(self):
+        self.client.close()
+    
+    async def aclose(self):
+        """關閉目前 event loop 的非同步連線池"""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    # === HTTP ===
+    def _request_body(self, prompt, max_tokens, stream=False, json_mode=False):
+        messages = [{"role": "user", "content": prompt}]
+        if self.api == 'ollama':
+            body = {
+                "model": self.model_name,
+                "messages": messages,
+                "stream": stream,
+                "options": {"num_predict": max_tokens}
+            }
+            if json_mode:
+                body["format"] = "json"
+        else:
+            body = {
+                "model": self.model_name,
+                "messages": messages,
+                "stream": stream,
+                "max_tokens": max_tokens
+            }
+            if json_mode:
+                body["response_format"] = {"type": "json_object"}
+        return body
+    
+    @property
+    def _path(self):
+        return '/api/chat' if self.api == 'ollama' else '/v1/chat/completions'
+    
+    def _usage(self, data):
+        """從回應取出 (input, output) tokens"""
+        if self.api == 'ollama':
+            return data.get('prompt_eval_count'), data.get('eval_count')
+        usage = data.get('usage') or {}
+        return usage.get('prompt_tokens'), usage.get('completion_tokens')
+    
+    def _complete(self, prompt, max_tokens=500, json_mode=False, section=None):
+        with llm_call(self.api, self.model_name, section=section) as call:
+            response = self.client.post(self._path, json=self._request_body(prompt, max_tokens, json_mode=json_mode))
+            response.raise_for_status()
+            data = response.json()
+            call.set_usage(*self._usage(data))
+        return self._content(data)
+    
+    def _content(self, data):
+        if self.api == 'ollama':
+            return data['message']['content']
+        return data['choices'][0]['message']['content']
+    
+    def _parse_line(self, line):
+        """
+        解析串流的一行（Ollama：NDJSON；OpenAI：SSE）
+        
+        Returns:
+            (文字, usage 或 None, 是否結束)
+        """
+        if not line:
+            return '', None, False
+        if self.api == 'ollama':
+            chunk = json.loads(line)
+            usage = self._usage(chunk) if chunk.get('done') else None
+            return chunk.get('message', {}).get('content', ''), usage, bool(chunk.get('done'))
+        
+        if not line.startswith('data:'):
+            return '', None, False
+        payload = line[5:].strip()
+        if payload == '[DONE]':
+            return '', None, True
+        chunk = json.loads(payload)
+        usage = self._usage(chunk) if chunk.get('usage') else None
+        if not chunk.get('choices'):
+            return '', usage, False
+        return (chunk['choices'][0].get('delta') or {}).get('content') or '', usage, False
+    
+    def _stream(self, prompt, max_tokens=500, section=None):
+        """逐段 yield 文字"""
+        body = self._request_body(prompt, max_tokens, stream=True)
+        with llm_call(self.api, self.model_name, section=section) as call, \
+                self.client.stream('POST', self._path, json=body) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                text, usage, done = self._parse_line(line)
+                if usage:
+                    call.set_usage(*usage)
+                if text:
+                    call.first_token()
+                    yield text
+                if done:
+                    return
+    
+    async def _acomplete(self, prompt, max_tokens=500, json_mode=False, section=None):
+        client = self._async_client()
+        with llm_call(self.api, self.model_name, section=section) as call:
+            response = await client.post(self._path, json=self._request_body(prompt, max_tokens, json_mode=json_mode))
+            response.raise_for_status()
+            data = response.json()
+            call.set_usage(*self._usage(data))
+        return self._content(data)
+    
+    async def _astream(self, prompt, max_tokens=500, section=None):
+        body = self._request_body(prompt, max_tokens, stream=True)
+        client = self._async_client()
+        with llm_call(self.api, self.model_name, section=section) as call:
+            async with client.stream('POST', self._path, json=body) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    text, usage, done = self._parse_line(line)
+                    if usage:
+                        call.set_usage(*usage)
+                    if text:
+                        call.first_token()
+                        yield text
+                    if done:
+                        return
+    
+    # === 適配器介面 ===
+    def adapt(self, content, question, section_name):
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=500,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return response.content[0].text.strip()
+            return self._complete(_build_prompt(content, question), section=section_name).strip()
         except Exception as e:
-            print(f"LLM 微調失敗（{section_name}）：{e}")
+            print(f"本地 LLM 微調失敗（{section_name}）：{e}")
             return content  # 失敗時返回原文
     
     def adapt_single(self, content, question, section_name):
-        """單獨微調一個段落（用於漸進式載入）"""
         return self.adapt(content, question, section_name)
+    
+    def adapt_stream(self, content, question, section_name):
+        started = False
+        try:
+            for text in self._stream(_build_prompt(content, question), section=section_name):
+                if not started:
+                    text = text.lstrip()
+                    if not text:
+                        continue
+                    started = True
+                yield text
+        except Exception as e:
+            print(f"本地 LLM 串流微調失敗（{section_name}）：{e}")
+            if started:
+                raise
+            yield content
+    
+    def _batch_call(self, sections, question):
+        """一次批次 prompt；失敗時回傳 {}，輸出被截斷時回傳已完整的段落"""
+        try:
+            text = self._complete(
+                _build_batch_prompt(sections, question),
+                max_tokens=min(500 * len(sections), 4096),
+                json_mode=True,
+                section='batch'
+            )
+            return _parse_batch_response(text, sections)
+        except Exception as e:
+            print(f"本地 LLM 批次微調失敗，改為逐段微調：{e}")
+            return {}
+    
+    def adapt_batch(self, sections, question, names=None):
+        """
+        先嘗試批次 prompt（每批最多 BATCH_MAX_SECTIONS 段）；
+        缺漏的段落以連線池並行逐段微調（names 為逐段呼叫時的段落名稱）
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        
+        sections = {k: v for k, v in sections.items() if v}
+        if not sections:
+            return {}
+        
+        adapted = {}
+        if self.batch and len(sections) > 1:
+            chunks = _chunk_sections(sections)
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(chunks))) as pool:
+                for result in pool.map(in_context(lambda chunk: self._batch_call(chunk, question)), chunks):
+                    adapted.update(result)
+        
+        missing = [k for k in sections if k not in adapted]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(missing))) as pool:
+                results = pool.map(in_context(lambda k: self.adapt(sections[k], question, _section_name(k, names))), missing)
+                adapted.update(zip(missing, results))
+        
+        return adapted
+    
+    async def aadapt(self, content, question, section_name):
+        try:
+            return (await self._acomplete(_build_prompt(content, question), section=section_name)).strip()
+        except Exception as e:
+            print(f"本地 LLM 微調失敗（{section_name}）：{e}")
+            return content
+    
+    async def aadapt_stream(self, content, question, section_name):
+        started = False
+        try:
+            async for text in self._astream(_build_prompt(content, question), section=section_name):
+                if not started:
+                    text = text.lstrip()
+                    if not text:
+                        continue
+                    started = True
+                yield text
+        except Exception as e:
+            print(f"本地 LLM 串流微調失敗（{section_name}）：{e}")
+            if started:
+                raise
+            yield content
+    
+    async def _abatch_call(self, sections, question):
+        try:
+            text = await self._acomplete(
+                _build_batch_prompt(sections, question),
+                max_tokens=min(500 * len(sections), 4096),
+                json_mode=True,
+                section='batch'
+            )
+            return _parse_batch_response(text, sections)
+        except Exception as e:
+            print(f"本地 LLM 批次微調失敗，改為逐段微調：{e}")
+            return {}
+    
+    async def aadapt_batch(self, sections, question, names=None):
+        sections = {k: v for k, v in sections.items() if v}
+        if not sections:
+            return {}
+        
+        # 與同步版相同的並行上限
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def bounded(call):
+            async with semaphore:
+                return await call
+        
+        adapted = {}
+        if self.batch and len(sections) > 1:
+            for result in await asyncio.gather(*(
+                bounded(self._abatch_call(chunk, question)) for chunk in _chunk_sections(sections)
+            )):
+                adapted.update(result)
+        
+        missing = [k for k in sections if k not in adapted]
+        if missing:
+            results = await asyncio.gather(*(
+                bounded(self.aadapt(sections[k], question, _section_name(k, names))) for k in missing
+            ))
+            adapted.update(zip(missing, results))
+        
+        return adapted
 
 
-class OllamaLLMAdapter:
-    """Ollama 本地 LLM 適配器（預留）"""
-    
-    def __init__(self, model_name="llama3.2:1b"):
-        self.model_name = model_name
+def create_adapter():
+    """
+    依環境變數建立適配器
     
-    def adapt(self, content, question, section_name):
-        return content
+    YILI_LLM_ADAPTER=claude（預設）| ollama | openai
+    ollama / openai 使用 OLLAMA_BASE_URL 與 OLLAMA_MODEL
+    """
+    backend = os.environ.get('YILI_LLM_ADAPTER', 'claude').lower()
+    if backend in ('ollama', 'openai'):
+        return OllamaLLMAdapter(
+            model_name=os.environ.get('OLLAMA_MODEL', 'llama3.2:1b'),
+            api=backend
+        )
+    return ClaudeLLMAdapter()
@@ -9,7 +9,7 @@ YiliRenderer: 將六點解卦資料渲染成各種格式
     - MarkdownRenderer: Markdown 格式
 """
 
-import json
+from ..utils.serialization import dumps, dumps_indent
 
 
 class YiliRenderer:
@@ -214,10 +214,26 @@ class HTMLRenderer(YiliRenderer):
 
 
 class JSONRenderer(YiliRenderer):
-    """JSON 渲染（API 用）"""
+    """
+    JSON 渲染（API 用）
+    
+    有安裝 orjson / msgspec 時使用較快的後端，輸出內容與標準庫相同
+    
+    Args:
+        compact: True 時輸出不含空白的緊湊格式
+    """
+    
+    def __init__(self, compact=False):
+        self.compact = compact
     
     def render(self, result):
-        return json.dumps(result, ensure_ascii=False, indent=2)
+        if self.compact:
+            return dumps(result).decode('utf-8')
+        return dumps_indent(result)
+    
+    def render_bytes(self, result):
+        """緊湊格式的 UTF-8 位元組（直接作為 HTTP 回應內容）"""
+        return dumps(result)
 
 
 class MarkdownRenderer(YiliRenderer):
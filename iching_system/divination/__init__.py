@@ -34,7 +34,8 @@ from .a3_questionnaire import (
 
 from .a4_agent import (
     agent_divination_a4_1,
-    quick_agent_divination
+    quick_agent_divination,
+    aanalyze_outer
 )
 
 __all__ = [
@@ -59,5 +60,6 @@ __all__ = [
     
     # A4
     'agent_divination_a4_1',
-    'quick_agent_divination'
+    'quick_agent_divination',
+    'aanalyze_outer'
 ]
@@ -19,14 +19,28 @@ import os
 import re
 import json
 import time
-from typing import Dict, List, Optional
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from ..core.dayan import score_to_yao, get_yao_name
 from ..core.calculator import compute_b_stage
+from ..llm.clients import get_gemini_model
+from ..llm.rate_limit import TokenBucket, call_with_retry, acall_with_retry
+from ..llm.telemetry import llm_call
 
 
-# API 延遲控制
-_last_api_call = 0
+GEMINI_MODEL = 'gemini-3-pro-preview'
+
+# API 延遲控制（token bucket：每 _api_delay 秒一次，可跨程序共用）
 _api_delay = 1  # 秒
+_api_deadline = 60  # 單次呼叫（含限流等待與重試）的時間上限，秒
+# 同步版本（Streamlit、CLI、執行緒池）單次等待的上限，秒；需要等更久時放棄並使用中性結果，
+# 不讓執行緒長時間 sleep。伺服器程式使用 _acall_gemini
+_sync_max_wait = 2 * _api_delay
+_gemini_bucket = TokenBucket(
+    rate=1 / _api_delay,
+    capacity=1,
+    state_file=os.getenv('A4_RATE_LIMIT_FILE')
+)
 
 
 # 問卷題目（與 A3 一致，根據問題類型選用）
@@ -90,51 +104,86 @@ def _classify_question(question: str) -> str:
 
 
 def _get_gemini_model():
-    """取得 Gemini 模型"""
-    api_key = os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
-    
-    if not api_key:
-        raise ValueError("未設定 GEMINI_API_KEY 環境變數")
-    
-    import google.generativeai as genai
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel('gemini-3-pro-preview')
+    """取得 Gemini 模型（程序內共用，重用連線）"""
+    return get_gemini_model(GEMINI_MODEL)
 
 
-def _call_gemini(prompt: str, max_retries: int = 3) -> str:
-    """
-    調用 Gemini API（含延遲和重試機制）
+def _record_usage(record, response):
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        record.set_usage(usage.prompt_token_count, usage.candidates_token_count)
+
+
+def _call_gemini(prompt: str, max_retries: int = 3, deadline: Optional[float] = None,
+                 section: Optional[str] = None) -> str:
     """
-    global _last_api_call
+    調用 Gemini API（含限流和重試機制）
     
-    # 確保間隔足夠
-    elapsed = time.time() - _last_api_call
-    if elapsed < _api_delay:
-        time.sleep(_api_delay - elapsed)
+    Args:
+        max_retries: 總嘗試次數（含第一次）
+        deadline: time.time() 截止時間，預設為 _api_deadline 秒後
+        section: 用途標記（寫入遙測）
     
+    限流或退避需要等待超過 _sync_max_wait 時拋出 RateLimitTimeout
+    """
+    if deadline is None:
+        deadline = time.time() + _api_deadline
     model = _get_gemini_model()
     
-    for attempt in range(max_retries):
-        try:
+    with llm_call('gemini', GEMINI_MODEL, section=section) as record:
+        def call():
             response = model.generate_content(prompt)
-            _last_api_call = time.time()
+            _record_usage(record, response)
             return response.text.strip()
+        
+        try:
+            text, attempts = call_with_retry(call, bucket=_gemini_bucket, deadline=deadline,
+                                             max_attempts=max_retries, max_wait=_sync_max_wait)
         except Exception as e:
-            if '429' in str(e) or 'quota' in str(e).lower():
-                wait = 20 * (attempt + 1)
-                print(f"    ⏳ API 限制，等待 {wait} 秒...")
-                time.sleep(wait)
-            else:
-                raise e
+            record.retries = max(0, getattr(e, 'attempts', 1) - 1)
+            raise
+        record.retries = attempts - 1
+        return text
+
+
+async def _acall_gemini(prompt: str, max_retries: int = 3, deadline: Optional[float] = None,
+                        section: Optional[str] = None) -> str:
+    """_call_gemini 的 asyncio 版本（等待限流與退避時不佔用執行緒，不受 _sync_max_wait 限制）"""
+    if deadline is None:
+        deadline = time.time() + _api_deadline
+    model = _get_gemini_model()
     
-    raise Exception("API 調用失敗")
+    with llm_call('gemini', GEMINI_MODEL, section=section) as record:
+        async def call():
+            response = await model.generate_content_async(prompt)
+            _record_usage(record, response)
+            return response.text.strip()
+        
+        try:
+            text, attempts = await acall_with_retry(call, bucket=_gemini_bucket, deadline=deadline,
+                                                    max_attempts=max_retries)
+        except Exception as e:
+            record.retries = max(0, getattr(e, 'attempts', 1) - 1)
+            raise
+        record.retries = attempts - 1
+        return text
+
+
+# ============================================================================
+# Prompt 與解析（同步 / 非同步版本共用）
+# ============================================================================
+
+_EMPTY_CONTEXT = {
+    "industry": "",
+    "position": "",
+    "skills": "",
+    "concerns": "",
+    "keywords": []
+}
 
 
-def _extract_context_info(description: str) -> Dict:
-    """
-    從用戶描述中提取關鍵資訊
-    """
-    prompt = f"""
+def _context_prompt(description: str) -> str:
+    return f"""
 請從以下描述中提取關鍵資訊：
 
 描述：{description}
@@ -150,30 +199,17 @@ def _extract_context_info(description: str) -> Dict:
 
 只輸出 JSON，不要其他文字。
 """
-    
-    try:
-        response = _call_gemini(prompt)
-        
-        # 清理 JSON
-        json_text = re.sub(r'```json\s*', '', response)
-        json_text = re.sub(r'```\s*', '', json_text)
-        
-        return json.loads(json_text)
-    except:
-        return {
-            "industry": "",
-            "position": "",
-            "skills": "",
-            "concerns": "",
-            "keywords": []
-        }
 
 
-def _generate_market_info(query: str) -> str:
-    """
-    使用 Gemini 生成市場資訊
-    """
-    prompt = f"""
+def _parse_context(response: str) -> Dict:
+    # 清理 JSON
+    json_text = re.sub(r'```json\s*', '', response)
+    json_text = re.sub(r'```\s*', '', json_text)
+    return json.loads(json_text)
+
+
+def _market_prompt(query: str) -> str:
+    return f"""
 請提供關於「{query}」的最新資訊（2024-2025）。
 
 請包含：
@@ -184,21 +220,10 @@ def _generate_market_info(query: str) -> str:
 
 以 3-5 句話簡短回答。
 """
-    
-    try:
-        return _call_gemini(prompt)
-    except:
-        return ""
 
 
-def _analyze_and_score(aspect: str, data: str, question: str) -> int:
-    """
-    分析資料並評分
-    """
-    if not data:
-        return 5  # 無資料返回中性分數
-    
-    prompt = f"""
+def _score_prompt(aspect: str, data: str, question: str) -> str:
+    return f"""
 基於以下資訊評估「{aspect}」的狀況：
 
 問題：{question}
@@ -212,19 +237,121 @@ def _analyze_and_score(aspect: str, data: str, question: str) -> int:
 
 請只回答一個數字（0-10）：
 """
+
+
+def _parse_score(response: str) -> int:
+    numbers = re.findall(r'\d+', response)
+    if numbers:
+        score = int(numbers[0])
+        if 0 <= score <= 10:
+            return score
+    return 5
+
+
+def _extract_context_info(description: str) -> Dict:
+    """
+    從用戶描述中提取關鍵資訊
+    """
+    try:
+        return _parse_context(_call_gemini(_context_prompt(description), section='a4_context'))
+    except:
+        return dict(_EMPTY_CONTEXT)
+
+
+def _generate_market_info(query: str) -> str:
+    """
+    使用 Gemini 生成市場資訊
+    """
+    try:
+        return _call_gemini(_market_prompt(query), section='a4_market')
+    except:
+        return ""
+
+
+def _analyze_and_score(aspect: str, data: str, question: str) -> int:
+    """
+    分析資料並評分
+    """
+    if not data:
+        return 5  # 無資料返回中性分數
     
     try:
-        response = _call_gemini(prompt)
-        numbers = re.findall(r'\d+', response)
-        if numbers:
-            score = int(numbers[0])
-            if 0 <= score <= 10:
-                return score
-        return 5
+        return _parse_score(_call_gemini(_score_prompt(aspect, data, question), section='a4_score'))
     except:
         return 5
 
 
+async def _aextract_context_info(description: str) -> Dict:
+    """_extract_context_info 的 asyncio 版本"""
+    try:
+        return _parse_context(await _acall_gemini(_context_prompt(description), section='a4_context'))
+    except Exception:
+        return dict(_EMPTY_CONTEXT)
+
+
+async def _agenerate_market_info(query: str) -> str:
+    """_generate_market_info 的 asyncio 版本"""
+    try:
+        return await _acall_gemini(_market_prompt(query), section='a4_market')
+    except Exception:
+        return ""
+
+
+async def _aanalyze_and_score(aspect: str, data: str, question: str) -> int:
+    """_analyze_and_score 的 asyncio 版本"""
+    if not data:
+        return 5
+    try:
+        return _parse_score(await _acall_gemini(_score_prompt(aspect, data, question), section='a4_score'))
+    except Exception:
+        return 5
+
+
+async def aanalyze_outer(question: str, description: Optional[str] = None,
+                         progress: Optional[Callable[..., Awaitable[None]]] = None) -> Tuple[Dict, List[int]]:
+    """
+    外三爻 AI 分析（asyncio 版本）：三個面向並行收集資料與評分
+
+    agent_divination_a4_1 的 Step 2 依序執行，每次呼叫間隔 _api_delay；
+    這裡三個面向同時進行（仍受同一個 token bucket 限流），逐爻回報進度
+
+    Args:
+        question: 問題
+        description: 背景描述（None 時以問題代替）
+        progress: 進度回報，await progress(step, **data)，例如
+            progress('line', line=4, status='scored', score=7, yao=7, yao_name='少陽')
+
+    Returns:
+        (context, 外三爻分數)
+    """
+    async def report(step, **data):
+        if progress is not None:
+            await progress(step, **data)
+
+    description = description or question
+    full_context = f"{question}\n{description}" if description != question else question
+    outer_aspects = QUESTION_ASPECTS[_classify_question(question)]['outer']
+
+    await report('context', status='running')
+    context = await _aextract_context_info(full_context)
+    keywords = context.get('keywords', [question[:10]])
+    await report('context', status='done', keywords=keywords)
+
+    async def line(i, aspect):
+        number = i + 4
+        await report('line', line=number, aspect=aspect, status='collecting')
+        query = f"{keywords[0] if keywords else question[:10]} {aspect[:10]}"
+        data = await _agenerate_market_info(query)
+        await report('line', line=number, status='scoring', has_data=bool(data))
+        score = await _aanalyze_and_score(aspect, data, question)
+        yao = score_to_yao(score)
+        await report('line', line=number, status='scored', score=score, yao=yao, yao_name=get_yao_name(yao))
+        return score
+
+    scores = await asyncio.gather(*(line(i, aspect) for i, aspect in enumerate(outer_aspects)))
+    return context, list(scores)
+
+
 def agent_divination_a4_1(
     question: str,
     description: Optional[str] = None,
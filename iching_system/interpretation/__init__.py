@@ -1 +1 @@
-from .interpreter import interpret, quick_interpret
+from .interpreter import interpret, interpret_stream, quick_interpret
@@ -5,7 +5,10 @@
 
 import os
 import copy
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterator, Optional, Tuple
+
+from ..llm.router import get_default_router
 
 # 載入環境變數（本地）
 from dotenv import load_dotenv
@@ -85,42 +88,15 @@ def _fix_hex_data(hex_obj: Dict) -> Dict:
 # LLM 工具
 # ============================================================================
 
-def _get_llm_client():
-    """取得 LLM 客戶端"""
-    # 優先使用 Claude（因為環境變數設定較穩定）
-    anthropic_key = os.getenv('ANTHROPIC_API_KEY')
-    if anthropic_key:
-        from anthropic import Anthropic
-        return Anthropic(api_key=anthropic_key), 'claude'
-    
-    # 備用 Gemini
-    gemini_key = os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
-    if gemini_key:
-        import google.generativeai as genai
-        genai.configure(api_key=gemini_key)
-        return genai.GenerativeModel('gemini-2.0-flash-exp'), 'gemini'
-    
-    return None, None
-
-
-def _call_llm(prompt: str, max_tokens: int = 500) -> str:
-    """調用 LLM"""
-    client, provider = _get_llm_client()
+def _call_llm(prompt: str, max_tokens: int = 500, section: Optional[str] = None) -> str:
+    """調用 LLM（Claude 優先；變慢時對沖到 Gemini，失敗時改用 Gemini）"""
+    router = get_default_router()
     
-    if not client:
+    if not router:
         return "[需要設定 GEMINI_API_KEY 或 ANTHROPIC_API_KEY]"
     
     try:
-        if provider == 'gemini':
-            response = client.generate_content(prompt)
-            return response.text.strip()
-        else:  # claude
-            response = client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=max_tokens,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return response.content[0].text
+        return router.call(prompt, max_tokens=max_tokens, section=section)
     except Exception as e:
         return f"[LLM 錯誤: {str(e)[:50]}]"
 
@@ -180,7 +156,7 @@ def generate_hex_summary(question: str, hex_obj: Dict, context: str = "現況")
 不要使用傳統易經術語。
 直接輸出內容，不要有標題。
 """
-    return _call_llm(prompt)
+    return _call_llm(prompt, section='1_現況')
 
 
 def generate_transition_summary(question: str, hex_from: Dict, hex_to: Dict) -> str:
@@ -215,7 +191,7 @@ def generate_transition_summary(question: str, hex_from: Dict, hex_to: Dict) ->
 不要使用傳統易經術語。
 直接輸出內容，不要有標題。
 """
-    return _call_llm(prompt)
+    return _call_llm(prompt, section='2_變化趨勢')
 
 
 def generate_process_summary(question: str, hex_trans: Dict, hex_from: Dict, hex_to: Dict) -> str:
@@ -247,7 +223,7 @@ def generate_process_summary(question: str, hex_trans: Dict, hex_from: Dict, hex
 不要使用傳統易經術語。
 直接輸出內容，不要有標題。
 """
-    return _call_llm(prompt)
+    return _call_llm(prompt, section='3_變化過程')
 
 
 def generate_six_lines(question: str, hex_trans: Dict, hex_from: Dict = None, hex_to: Dict = None, part3_content: str = "") -> str:
@@ -286,7 +262,7 @@ def generate_six_lines(question: str, hex_trans: Dict, hex_from: Dict = None, he
 
 不要使用傳統易經術語。
 """
-    return _call_llm(prompt, max_tokens=2000)
+    return _call_llm(prompt, max_tokens=2000, section='4_六爻境遇')
 
 
 def generate_advice(question: str, hex_now: Dict) -> str:
@@ -313,7 +289,7 @@ def generate_advice(question: str, hex_now: Dict) -> str:
 不要使用傳統易經術語。
 直接輸出內容，不要有標題。
 """
-    return _call_llm(prompt)
+    return _call_llm(prompt, section='5_建議')
 
 
 def generate_prospect(question: str, hex_target: Dict, advice_text: str) -> str:
@@ -342,15 +318,55 @@ def generate_prospect(question: str, hex_target: Dict, advice_text: str) -> str:
 不要使用傳統易經術語。
 直接輸出內容，不要有標題。
 """
-    return _call_llm(prompt)
+    return _call_llm(prompt, section='6_展望')
 
 
 # ============================================================================
 # 主函數
 # ============================================================================
 
+# 六點的 key（依顯示順序）
+POINT_KEYS = ['1_現況', '2_變化趨勢', '3_變化過程', '4_六爻境遇', '5_建議', '6_展望']
+
+# 六點生成共用的執行緒池（LLM 呼叫為 I/O，彼此獨立）
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="interpret")
+
+
+def interpret_stream(question: str, hexagrams: Dict) -> Iterator[Tuple[str, str]]:
+    """
+    並行解卦，依完成順序逐點 yield
+    
+    依賴關係：第 1-5 點彼此獨立，同時開始；
+    第 6 點（展望）需要第 5 點的建議，第 5 點完成後立即開始。
+    
+    Yields:
+        (key, text)，key 為 POINT_KEYS 之一
+    """
+    hex_now = _fix_hex_data(hexagrams['本卦'])
+    hex_target = _fix_hex_data(hexagrams['之卦'])
+    hex_trans = _fix_hex_data(hexagrams['轉移卦'])
+    
+    pending = {
+        _executor.submit(generate_hex_summary, question, hex_now, "現況"): '1_現況',
+        _executor.submit(generate_transition_summary, question, hex_now, hex_target): '2_變化趨勢',
+        _executor.submit(generate_process_summary, question, hex_trans, hex_now, hex_target): '3_變化過程',
+        _executor.submit(generate_six_lines, question, hex_trans, hex_now, hex_target): '4_六爻境遇',
+        _executor.submit(generate_advice, question, hex_now): '5_建議',
+    }
+    
+    while pending:
+        done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        for future in done:
+            key = pending.pop(future)
+            text = future.result()
+            if key == '5_建議':
+                # 先送出第 6 點，再交回結果
+                pending[_executor.submit(generate_prospect, question, hex_target, text)] = '6_展望'
+            yield key, text
+
+
 def interpret(question: str, hexagrams: Dict, show_original: bool = False, display: bool = True) -> Dict:
-    """統一解卦（核心函數）"""
+    """統一解卦（核心函數，六點並行生成，約兩次 LLM 往返的時間）"""
     hex_now = _fix_hex_data(hexagrams['本卦'])
     hex_target = _fix_hex_data(hexagrams['之卦'])
     hex_trans = _fix_hex_data(hexagrams['轉移卦'])
@@ -362,51 +378,26 @@ def interpret(question: str, hexagrams: Dict, show_original: bool = False, displ
     target_name = hex_target.get('name', '未知')
     trans_name = hex_trans.get('name', '未知')
     
-    result = {}
-    
-    # 1. 現況
-    if display:
-        print(f"\n【1. 現況】：{now_name}卦 ({now_code})")
-    result['1_現況'] = generate_hex_summary(question, hex_now, "現況")
-    if display:
-        print(result['1_現況'])
+    headers = {
+        '1_現況': f"\n【1. 現況】：{now_name}卦 ({now_code})",
+        '2_變化趨勢': f"\n【2. 變化趨勢】：{now_name}→{target_name}",
+        '3_變化過程': f"\n【3. 變化過程】：{trans_name}卦",
+        '4_六爻境遇': "\n【4. 各階段境遇】",
+        '5_建議': "\n【5. 建議】",
+        '6_展望': f"\n【6. 展望】：{target_name}卦",
+    }
     
-    # 2. 變化趨勢
-    if display:
-        print(f"\n【2. 變化趨勢】：{now_name}→{target_name}")
-    result['2_變化趨勢'] = generate_transition_summary(question, hex_now, hex_target)
-    if display:
-        print(result['2_變化趨勢'])
+    results = {}
+    printed = 0
+    for key, text in interpret_stream(question, hexagrams):
+        results[key] = text
+        # 依順序顯示：前面的點都完成了才印出
+        while display and printed < len(POINT_KEYS) and POINT_KEYS[printed] in results:
+            print(headers[POINT_KEYS[printed]])
+            print(results[POINT_KEYS[printed]])
+            printed += 1
     
-    # 3. 變化過程
-    if display:
-        print(f"\n【3. 變化過程】：{trans_name}卦")
-    result['3_變化過程'] = generate_process_summary(question, hex_trans, hex_now, hex_target)
-    if display:
-        print(result['3_變化過程'])
-    
-    # 4. 六爻境遇
-    if display:
-        print(f"\n【4. 各階段境遇】")
-    result['4_六爻境遇'] = generate_six_lines(question, hex_trans, hex_from=hex_now, hex_to=hex_target)
-    if display:
-        print(result['4_六爻境遇'])
-    
-    # 5. 建議
-    if display:
-        print("\n【5. 建議】")
-    result['5_建議'] = generate_advice(question, hex_now)
-    if display:
-        print(result['5_建議'])
-    
-    # 6. 展望
-    if display:
-        print(f"\n【6. 展望】：{target_name}卦")
-    result['6_展望'] = generate_prospect(question, hex_target, result['5_建議'])
-    if display:
-        print(result['6_展望'])
-    
-    return result
+    return {key: results[key] for key in POINT_KEYS}
 
 
 def quick_interpret(question: str, hexagrams: Dict) -> Dict:
@@ -0,0 +1,90 @@
+"""
+LLM 基礎設施模組
+================
+
+包含：
+- semantic_cache: 近似問題的微調結果快取
+- clients: 共用的 LLM 客戶端（連線重用）
+- router: 供應商路由與對沖請求
+- rate_limit: token bucket 限流與退避重試
+- telemetry: 每次 LLM 呼叫的耗時、tokens、快取狀態
+- cassette: 錄製 / 重播 LLM 回應（離線壓測）
+"""
+
+from .semantic_cache import (
+    SemanticCache,
+    CachedLLMAdapter,
+    normalize_question
+)
+
+from .clients import (
+    get_anthropic_client,
+    get_async_anthropic_client,
+    get_gemini_model,
+    close_async_clients,
+    reset_clients
+)
+
+from .router import (
+    ProviderRouter,
+    ClaudeProvider,
+    GeminiProvider,
+    get_default_router
+)
+
+from .rate_limit import (
+    TokenBucket,
+    RateLimitTimeout,
+    call_with_retry,
+    acall_with_retry
+)
+
+from .telemetry import (
+    llm_call,
+    recent_calls,
+    summary
+)
+
+from .cassette import (
+    Cassette,
+    CassetteMiss,
+    get_cassette,
+    set_cassette
+)
+
+__all__ = [
+    # semantic_cache
+    'SemanticCache',
+    'CachedLLMAdapter',
+    'normalize_question',
+    
+    # clients
+    'get_anthropic_client',
+    'get_async_anthropic_client',
+    'get_gemini_model',
+    'close_async_clients',
+    'reset_clients',
+    
+    # router
+    'ProviderRouter',
+    'ClaudeProvider',
+    'GeminiProvider',
+    'get_default_router',
+    
+    # rate_limit
+    'TokenBucket',
+    'RateLimitTimeout',
+    'call_with_retry',
+    'acall_with_retry',
+    
+    # telemetry
+    'llm_call',
+    'recent_calls',
+    'summary',
+    
+    # cassette
+    'Cassette',
+    'CassetteMiss',
+    'get_cassette',
+    'set_cassette'
+]
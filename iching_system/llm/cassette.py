@@ -0,0 +1,510 @@
+# iching_system/llm/cassette.py
+"""
+LLM 錄製 / 重播（cassette）
+===========================
+把真實的 LLM 回應連同時間剖面錄下來，之後離線重播，
+用來在沒有網路的環境壓測 A2 / A3 / A4 完整流程
+
+掛在 clients 註冊表上，ClaudeLLMAdapter、interpreter._call_llm（經 router）
+與 A4 的 Gemini 呼叫都不需要改動：
+- record：照常呼叫真實 API，並把每次請求/回應/耗時附加到 JSONL 檔
+- replay：不連網，依請求內容找出錄製結果，依時間剖面注入延遲後回傳
+
+環境變數：
+    LLM_CASSETTE_MODE=record|replay   未設定則不啟用
+    LLM_CASSETTE_PATH=cassettes/llm.jsonl
+    LLM_CASSETTE_LATENCY=recorded     依錄製耗時重播（預設）
+                        =0.5          錄製耗時 × 倍率
+                        =fixed:0.2    固定秒數（串流時平均分配到各片段）
+                        =none         不注入延遲
+    LLM_CASSETTE_MISS=error|synthetic 重播時找不到錄製結果的處理方式
+                                      synthetic：回傳固定佔位文字（用於沒有錄製檔的壓測）
+
+同一個請求錄了多次時，重播依序輪流取用，每個請求鍵各自計數，
+因此同樣的呼叫順序會得到同樣的結果
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+
+DEFAULT_PATH = 'cassettes/llm.jsonl'
+
+# synthetic 模式沒有錄製耗時可用時的預設延遲（秒）
+SYNTHETIC_LATENCY = 1.0
+SYNTHETIC_CHUNKS = 8
+
+
+class CassetteMiss(LookupError):
+    """重播時找不到對應的錄製結果"""
+
+
+def _jsonable(value):
+    """請求參數中非 JSON 型別的物件（例如 GenerationConfig）以其屬性參與請求鍵"""
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    if hasattr(value, '__dict__'):
+        return vars(value)
+    return repr(value)
+
+
+def request_key(provider: str, model: str, payload) -> str:
+    """請求鍵：供應商 + 模型 + 請求內容（prompt / messages / max_tokens / generation_config）"""
+    raw = json.dumps([provider, model, payload], ensure_ascii=False, sort_keys=True, default=_jsonable)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def _gemini_key(model: str, prompt, kwargs: Dict) -> str:
+    """Gemini 請求鍵；generation_config 等參數不同（例如 max_output_tokens）視為不同請求"""
+    return request_key('gemini', model, [prompt, kwargs] if kwargs else prompt)
+
+
+def _parse_latency(spec: str):
+    spec = (spec or 'recorded').strip().lower()
+    if spec in ('recorded', ''):
+        return ('scale', 1.0)
+    if spec in ('none', '0', 'off'):
+        return ('scale', 0.0)
+    if spec.startswith('fixed:'):
+        return ('fixed', float(spec[6:]))
+    return ('scale', float(spec))
+
+
+class Cassette:
+    """
+    一個錄製檔（JSONL，一行一筆）
+
+    每筆記錄：
+        {
+            'key': '...', 'provider': 'claude', 'model': '...',
+            'text': '...', 'usage': [input_tokens, output_tokens],
+            'duration': 1.83,          # 整體耗時
+            'chunks': [[0.41, '...'], ...]  # 串流片段與相對開始時間（非串流為空）
+        }
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, mode: str = 'replay',
+                 latency: str = 'recorded', on_miss: str = 'error'):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"未知的 cassette 模式：{mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = _parse_latency(latency)
+        self.on_miss = on_miss
+        self._entries: Dict[str, List[dict]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry['key'], []).append(entry)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def has_provider(self, provider: str) -> bool:
+        """錄製檔中是否有此供應商的記錄（synthetic 模式視為都有）"""
+        if self.on_miss == 'synthetic':
+            return True
+        return any(e[0]['provider'] == provider for e in self._entries.values())
+
+    def record(self, key: str, provider: str, model: str, text: str,
+               usage, duration: float, chunks: Optional[list] = None):
+        entry = {
+            'key': key,
+            'provider': provider,
+            'model': model,
+            'text': text,
+            'usage': list(usage) if usage else None,
+            'duration': round(duration, 4),
+            'chunks': [[round(t, 4), c] for t, c in (chunks or [])]
+        }
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def lookup(self, key: str, provider: str, model: str) -> dict:
+        with self._lock:
+            entries = self._entries.get(key)
+            if entries:
+                index = self._cursor.get(key, 0)
+                self._cursor[key] = index + 1
+                return entries[index % len(entries)]
+
+        if self.on_miss == 'synthetic':
+            return self._synthetic(key, provider, model)
+        raise CassetteMiss(f"cassette 中沒有此請求的錄製結果（{provider}/{model} {key}）")
+
+    def _synthetic(self, key: str, provider: str, model: str) -> dict:
+        text = f"[cassette:{provider}] {key[:8]}"
+        step = SYNTHETIC_LATENCY / SYNTHETIC_CHUNKS
+        size = max(1, len(text) // SYNTHETIC_CHUNKS + 1)
+        chunks = [[step * (i + 1), text[i * size:(i + 1) * size]] for i in range(SYNTHETIC_CHUNKS)]
+        return {
+            'key': key, 'provider': provider, 'model': model, 'text': text,
+            'usage': [0, 0], 'duration': SYNTHETIC_LATENCY,
+            'chunks': [c for c in chunks if c[1]]
+        }
+
+    # ------------------------------------------------------------
+    # 延遲注入
+    # ------------------------------------------------------------
+
+    def duration(self, entry: dict) -> float:
+        kind, value = self.latency
+        if kind == 'fixed':
+            return value
+        return entry['duration'] * value
+
+    def chunk_schedule(self, entry: dict) -> List[tuple]:
+        """
+        串流重播的 (等待秒數, 片段) 清單
+
+        非串流錄製的回應沒有片段時間，整段文字在最後一次送出
+        """
+        chunks = entry.get('chunks') or [[entry['duration'], entry['text']]]
+        kind, value = self.latency
+        if kind == 'fixed':
+            step = value / len(chunks)
+            return [(step, text) for _, text in chunks]
+
+        schedule = []
+        previous = 0.0
+        for offset, text in chunks:
+            schedule.append((max(0.0, offset - previous) * value, text))
+            previous = offset
+        return schedule
+
+
+# ================================================================
+# 全域設定
+# ================================================================
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """依 LLM_CASSETTE_* 環境變數取得目前的 cassette（未啟用回傳 None）"""
+    global _cassette
+    mode = os.getenv('LLM_CASSETTE_MODE')
+    if not mode:
+        return None
+    if _cassette is not None:
+        return _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(
+                path=os.getenv('LLM_CASSETTE_PATH', DEFAULT_PATH),
+                mode=mode,
+                latency=os.getenv('LLM_CASSETTE_LATENCY', 'recorded'),
+                on_miss=os.getenv('LLM_CASSETTE_MISS', 'error')
+            )
+    return _cassette
+
+
+def set_cassette(cassette: Optional[Cassette]):
+    """直接指定 cassette（壓測腳本使用；None 表示改回依環境變數）"""
+    global _cassette
+    with _cassette_lock:
+        _cassette = cassette
+
+
+def is_replaying() -> bool:
+    cassette = get_cassette()
+    return cassette is not None and cassette.replaying
+
+
+# ================================================================
+# Anthropic 包裝
+# ================================================================
+
+def _anthropic_payload(kwargs: dict) -> dict:
+    return {k: kwargs.get(k) for k in ('messages', 'system', 'max_tokens', 'temperature')
+            if kwargs.get(k) is not None}
+
+
+def _anthropic_response(entry: dict):
+    usage = entry.get('usage') or [0, 0]
+    return SimpleNamespace(
+        content=[SimpleNamespace(type='text', text=entry['text'])],
+        usage=SimpleNamespace(input_tokens=usage[0], output_tokens=usage[1]),
+        model=entry['model'],
+        stop_reason='end_turn'
+    )
+
+
+class _RecordingStream:
+    """包住真實的 MessageStream，邊轉發邊記錄片段時間"""
+
+    def __init__(self, cassette: Cassette, key: str, model: str, manager):
+        self._cassette = cassette
+        self._key = key
+        self._model = model
+        self._manager = manager
+        self._stream = None
+        self._chunks = []
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self._stream = self._manager.__enter__()
+        return self
+
+    @property
+    def text_stream(self):
+        for text in self._stream.text_stream:
+            self._chunks.append((time.perf_counter() - self._start, text))
+            yield text
+
+    def get_final_message(self):
+        return self._stream.get_final_message()
+
+    def __exit__(self, exc_type, exc, tb):
+        result = self._manager.__exit__(exc_type, exc, tb)
+        if exc_type is None:
+            message = self._stream.get_final_message()
+            usage = (message.usage.input_tokens, message.usage.output_tokens)
+            self._cassette.record(
+                self._key, 'claude', self._model, ''.join(c for _, c in self._chunks),
+                usage, time.perf_counter() - self._start, self._chunks
+            )
+        return result
+
+
+class _ReplayStream:
+    def __init__(self, cassette: Cassette, entry: dict):
+        self._cassette = cassette
+        self._entry = entry
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    @property
+    def text_stream(self):
+        for delay, text in self._cassette.chunk_schedule(self._entry):
+            if delay > 0:
+                time.sleep(delay)
+            yield text
+
+    def get_final_message(self):
+        return _anthropic_response(self._entry)
+
+
+class _AsyncReplayStream(_ReplayStream):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    @property
+    async def text_stream(self):
+        for delay, text in self._cassette.chunk_schedule(self._entry):
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield text
+
+    async def get_final_message(self):
+        return _anthropic_response(self._entry)
+
+
+class _AsyncRecordingStream:
+    def __init__(self, cassette: Cassette, key: str, model: str, manager):
+        self._cassette = cassette
+        self._key = key
+        self._model = model
+        self._manager = manager
+        self._stream = None
+        self._chunks = []
+        self._start = 0.0
+
+    async def __aenter__(self):
+        self._start = time.perf_counter()
+        self._stream = await self._manager.__aenter__()
+        return self
+
+    @property
+    async def text_stream(self):
+        async for text in self._stream.text_stream:
+            self._chunks.append((time.perf_counter() - self._start, text))
+            yield text
+
+    async def get_final_message(self):
+        return await self._stream.get_final_message()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        result = await self._manager.__aexit__(exc_type, exc, tb)
+        if exc_type is None:
+            message = await self._stream.get_final_message()
+            usage = (message.usage.input_tokens, message.usage.output_tokens)
+            self._cassette.record(
+                self._key, 'claude', self._model, ''.join(c for _, c in self._chunks),
+                usage, time.perf_counter() - self._start, self._chunks
+            )
+        return result
+
+
+class _CassetteMessages:
+    def __init__(self, cassette: Cassette, real):
+        self._cassette = cassette
+        self._real = real
+
+    def _key(self, kwargs):
+        return request_key('claude', kwargs.get('model', ''), _anthropic_payload(kwargs))
+
+    def create(self, **kwargs):
+        key = self._key(kwargs)
+        model = kwargs.get('model', '')
+        if self._cassette.replaying:
+            entry = self._cassette.lookup(key, 'claude', model)
+            delay = self._cassette.duration(entry)
+            if delay > 0:
+                time.sleep(delay)
+            return _anthropic_response(entry)
+
+        start = time.perf_counter()
+        response = self._real.messages.create(**kwargs)
+        self._cassette.record(
+            key, 'claude', model, response.content[0].text,
+            (response.usage.input_tokens, response.usage.output_tokens),
+            time.perf_counter() - start
+        )
+        return response
+
+    def stream(self, **kwargs):
+        key = self._key(kwargs)
+        model = kwargs.get('model', '')
+        if self._cassette.replaying:
+            return _ReplayStream(self._cassette, self._cassette.lookup(key, 'claude', model))
+        return _RecordingStream(self._cassette, key, model, self._real.messages.stream(**kwargs))
+
+
+class _AsyncCassetteMessages(_CassetteMessages):
+    async def create(self, **kwargs):
+        key = self._key(kwargs)
+        model = kwargs.get('model', '')
+        if self._cassette.replaying:
+            entry = self._cassette.lookup(key, 'claude', model)
+            delay = self._cassette.duration(entry)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return _anthropic_response(entry)
+
+        start = time.perf_counter()
+        response = await self._real.messages.create(**kwargs)
+        self._cassette.record(
+            key, 'claude', model, response.content[0].text,
+            (response.usage.input_tokens, response.usage.output_tokens),
+            time.perf_counter() - start
+        )
+        return response
+
+    def stream(self, **kwargs):
+        key = self._key(kwargs)
+        model = kwargs.get('model', '')
+        if self._cassette.replaying:
+            return _AsyncReplayStream(self._cassette, self._cassette.lookup(key, 'claude', model))
+        return _AsyncRecordingStream(self._cassette, key, model, self._real.messages.stream(**kwargs))
+
+
+class CassetteAnthropic:
+    """
+    Anthropic / AsyncAnthropic 客戶端的替身
+
+    只實作本專案用到的 messages.create 與 messages.stream；
+    replay 模式下 real 為 None，不需要 API Key
+    """
+
+    def __init__(self, cassette: Cassette, real=None, is_async: bool = False):
+        self._real = real
+        messages_cls = _AsyncCassetteMessages if is_async else _CassetteMessages
+        self.messages = messages_cls(cassette, real)
+
+    def close(self):
+        if self._real is not None:
+            self._real.close()
+
+
+# ================================================================
+# Gemini 包裝
+# ================================================================
+
+def _gemini_response(entry: dict):
+    usage = entry.get('usage') or [0, 0]
+    return SimpleNamespace(
+        text=entry['text'],
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=usage[0],
+            candidates_token_count=usage[1]
+        )
+    )
+
+
+def _gemini_usage(response):
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return None
+    return (usage.prompt_token_count, usage.candidates_token_count)
+
+
+class CassetteGeminiModel:
+    """
+    GenerativeModel 的替身（generate_content / generate_content_async）
+    """
+
+    def __init__(self, cassette: Cassette, model_name: str, real=None):
+        self._cassette = cassette
+        self._real = real
+        self.model_name = model_name
+
+    def generate_content(self, prompt, **kwargs):
+        key = _gemini_key(self.model_name, prompt, kwargs)
+        if self._cassette.replaying:
+            entry = self._cassette.lookup(key, 'gemini', self.model_name)
+            delay = self._cassette.duration(entry)
+            if delay > 0:
+                time.sleep(delay)
+            return _gemini_response(entry)
+
+        start = time.perf_counter()
+        response = self._real.generate_content(prompt, **kwargs)
+        self._cassette.record(key, 'gemini', self.model_name, response.text,
+                              _gemini_usage(response), time.perf_counter() - start)
+        return response
+
+    async def generate_content_async(self, prompt, **kwargs):
+        key = _gemini_key(self.model_name, prompt, kwargs)
+        if self._cassette.replaying:
+            entry = self._cassette.lookup(key, 'gemini', self.model_name)
+            delay = self._cassette.duration(entry)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return _gemini_response(entry)
+
+        start = time.perf_counter()
+        response = await self._real.generate_content_async(prompt, **kwargs)
+        self._cassette.record(key, 'gemini', self.model_name, response.text,
+                              _gemini_usage(response), time.perf_counter() - start)
+        return response
@@ -0,0 +1,197 @@
+# iching_system/llm/clients.py
+"""
+LLM 客戶端註冊表
+================
+整個程序共用一份 provider 客戶端，重用 HTTP 連線（keep-alive）
+
+原本每次 _call_llm / _call_gemini 都重建客戶端，每次呼叫都要重新
+建立 TLS 連線；改由此處建立一次後重用：
+- Anthropic：同一把 key 共用一個 httpx 連線池（執行緒安全）
+- AsyncAnthropic：每個 event loop 一個（httpx 非同步連線池綁定 loop），
+  以 loop 物件為弱引用 key（loop 回收後一併釋放，不會因 id 重複拿到舊 loop 的客戶端）；
+  程序結束前以 close_async_clients() 關閉目前 loop 的連線池
+- Gemini：genai.configure 只在 key 改變時呼叫，GenerativeModel 依名稱快取
+
+端點可用 ANTHROPIC_BASE_URL（SDK 內建）與 GEMINI_BASE_URL 指向本地測試伺服器
+設定 LLM_CASSETTE_MODE 時回傳錄製 / 重播的替身（見 cassette.py）
+"""
+
+import os
+import asyncio
+import weakref
+import threading
+from typing import Dict, Optional, Tuple
+
+from .cassette import get_cassette, CassetteAnthropic, CassetteGeminiModel
+
+
+# 連線池設定
+POOL_MAX_CONNECTIONS = int(os.getenv('LLM_POOL_MAX_CONNECTIONS', '100'))
+POOL_MAX_KEEPALIVE = int(os.getenv('LLM_POOL_MAX_KEEPALIVE', '20'))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv('LLM_POOL_KEEPALIVE_EXPIRY', '60'))
+
+_lock = threading.Lock()
+_anthropic_clients: Dict[str, object] = {}
+# event loop -> {api_key: AsyncAnthropic}
+_async_anthropic_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, object]]' = \
+    weakref.WeakKeyDictionary()
+_gemini_models: Dict[Tuple[str, str], object] = {}
+_gemini_configured_key: Optional[str] = None
+
+
+def _pool_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY
+    )
+
+
+def get_anthropic_api_key() -> Optional[str]:
+    return os.getenv('ANTHROPIC_API_KEY')
+
+
+def get_gemini_api_key() -> Optional[str]:
+    return os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
+
+
+def get_anthropic_client(api_key: Optional[str] = None):
+    """
+    取得共用的 Anthropic 客戶端
+    
+    Args:
+        api_key: 預設讀取 ANTHROPIC_API_KEY
+    """
+    cassette = get_cassette()
+    if cassette is not None:
+        if cassette.replaying:
+            return CassetteAnthropic(cassette)
+        return CassetteAnthropic(cassette, _anthropic_client(api_key))
+    return _anthropic_client(api_key)
+
+
+def _anthropic_client(api_key: Optional[str]):
+    api_key = api_key or get_anthropic_api_key()
+    client = _anthropic_clients.get(api_key)
+    if client is not None:
+        return client
+    
+    with _lock:
+        client = _anthropic_clients.get(api_key)
+        if client is None:
+            from anthropic import Anthropic, DefaultHttpxClient
+            client = Anthropic(
+                api_key=api_key,
+                http_client=DefaultHttpxClient(limits=_pool_limits())
+            )
+            _anthropic_clients[api_key] = client
+    return client
+
+
+def get_async_anthropic_client(api_key: Optional[str] = None):
+    """
+    取得目前 event loop 共用的 AsyncAnthropic 客戶端
+    
+    必須在 event loop 中呼叫
+    """
+    cassette = get_cassette()
+    if cassette is not None:
+        if cassette.replaying:
+            return CassetteAnthropic(cassette, is_async=True)
+        return CassetteAnthropic(cassette, _async_anthropic_client(api_key), is_async=True)
+    return _async_anthropic_client(api_key)
+
+
+def _async_anthropic_client(api_key: Optional[str]):
+    api_key = api_key or get_anthropic_api_key()
+    loop = asyncio.get_running_loop()
+    client = _async_anthropic_clients.get(loop, {}).get(api_key)
+    if client is not None:
+        return client
+    
+    with _lock:
+        clients = _async_anthropic_clients.setdefault(loop, {})
+        client = clients.get(api_key)
+        if client is None:
+            from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+            client = AsyncAnthropic(
+                api_key=api_key,
+                http_client=DefaultAsyncHttpxClient(limits=_pool_limits())
+            )
+            clients[api_key] = client
+    return client
+
+
+async def close_async_clients():
+    """關閉目前 event loop 的 AsyncAnthropic 連線池（API lifespan / worker 結束時呼叫）"""
+    with _lock:
+        clients = _async_anthropic_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"關閉 LLM 客戶端失敗：{e}")
+
+
+def get_gemini_model(model_name: str, api_key: Optional[str] = None):
+    """
+    取得共用的 Gemini GenerativeModel
+    
+    Args:
+        model_name: 如 'gemini-2.0-flash-exp'
+        api_key: 預設讀取 GEMINI_API_KEY / GOOGLE_API_KEY
+    """
+    cassette = get_cassette()
+    if cassette is not None:
+        if cassette.replaying:
+            return CassetteGeminiModel(cassette, model_name)
+        return CassetteGeminiModel(cassette, model_name, _gemini_model(model_name, api_key))
+    return _gemini_model(model_name, api_key)
+
+
+def _gemini_model(model_name: str, api_key: Optional[str]):
+    global _gemini_configured_key
+    
+    api_key = api_key or get_gemini_api_key()
+    if not api_key:
+        raise ValueError("未設定 GEMINI_API_KEY 環境變數")
+    
+    key = (api_key, model_name)
+    model = _gemini_models.get(key)
+    if model is not None:
+        return model
+    
+    with _lock:
+        model = _gemini_models.get(key)
+        if model is None:
+            import google.generativeai as genai
+            if _gemini_configured_key != api_key:
+                base_url = os.getenv('GEMINI_BASE_URL')
+                if base_url:
+                    # 指向本地測試伺服器（REST）
+                    genai.configure(api_key=api_key, transport='rest',
+                                    client_options={'api_endpoint': base_url})
+                else:
+                    genai.configure(api_key=api_key)
+                _gemini_configured_key = api_key
+                # configure 會換掉底層連線，舊 key 的模型不再可用
+                _gemini_models.clear()
+            model = genai.GenerativeModel(model_name)
+            _gemini_models[key] = model
+    return model
+
+
+def reset_clients():
+    """清除所有已建立的客戶端（更換 API Key 或測試時使用）"""
+    global _gemini_configured_key
+    with _lock:
+        for client in _anthropic_clients.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        _anthropic_clients.clear()
+        _async_anthropic_clients.clear()
+        _gemini_models.clear()
+        _gemini_configured_key = None
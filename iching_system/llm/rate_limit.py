@@ -0,0 +1,208 @@
+# iching_system/llm/rate_limit.py
+"""
+Token bucket 限流與重試
+=======================
+取代 a4_agent 的全域 _last_api_call + time.sleep：
+
+- TokenBucket：執行緒安全；asyncio 版本等待時不佔用執行緒
+- 可選擇以本地檔案（fcntl 檔案鎖）在多個程序間共用同一個 bucket
+- 重試：指數退避 + full jitter，且不超過呼叫端給的截止時間；
+  回傳實際呼叫次數（max_attempts 為含第一次的總次數）
+- 同步版本可設定 max_wait：單次等待（限流或退避）超過時直接放棄，
+  不讓執行緒池的執行緒長時間 sleep；伺服器程式應使用 asyncio 版本
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Callable, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：只支援單一程序
+    fcntl = None
+
+
+class RateLimitTimeout(Exception):
+    """在截止時間前拿不到額度，或重試超過截止時間"""
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """判斷是否為供應商的限流錯誤（HTTP 429 / quota）"""
+    text = str(e).lower()
+    return '429' in text or 'quota' in text or 'resource exhausted' in text or 'rate limit' in text
+
+
+class TokenBucket:
+    """
+    Token bucket 限流器
+    
+    Args:
+        rate: 每秒補充的 token 數
+        capacity: bucket 容量（允許的瞬間爆量）
+        state_file: 共用狀態檔路徑（可選）；設定後同一台機器上的
+            所有程序共用額度
+    """
+    
+    def __init__(self, rate: float, capacity: float = 1.0, state_file: Optional[str] = None):
+        if rate <= 0:
+            raise ValueError("rate 必須大於 0")
+        self.rate = rate
+        self.capacity = capacity
+        self.state_file = state_file if fcntl else None
+        self._tokens = capacity
+        self._updated = time.time()
+        self._lock = threading.Lock()
+    
+    def _take(self, tokens: float, now: float) -> float:
+        """嘗試取出 token；成功回傳 0，否則回傳還需等待的秒數"""
+        elapsed = max(0.0, now - self._updated)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+    
+    def _take_shared(self, tokens: float, now: float) -> float:
+        """跨程序：在檔案鎖內讀取、更新、寫回狀態"""
+        fd = os.open(self.state_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.read(fd, 4096)
+            try:
+                state = json.loads(raw) if raw else {}
+                self._tokens = float(state['tokens'])
+                self._updated = float(state['updated'])
+            except (ValueError, KeyError, TypeError):
+                self._tokens, self._updated = self.capacity, now
+            wait = self._take(tokens, now)
+            data = json.dumps({'tokens': self._tokens, 'updated': self._updated}).encode()
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, data)
+            return wait
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+    
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        非阻塞嘗試
+        
+        Returns:
+            0 表示已取得；否則為建議等待秒數
+        """
+        with self._lock:
+            now = time.time()
+            if self.state_file:
+                return self._take_shared(tokens, now)
+            return self._take(tokens, now)
+    
+    def acquire(self, tokens: float = 1.0, deadline: Optional[float] = None,
+                max_wait: Optional[float] = None):
+        """
+        阻塞等待（同步程式使用）
+        
+        Args:
+            deadline: time.time() 的截止時間
+            max_wait: 單次等待的上限（秒）；需要等更久時直接放棄
+        
+        Raises:
+            RateLimitTimeout: 截止前拿不到額度，或需要等待超過 max_wait
+        """
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            if deadline is not None and time.time() + wait > deadline:
+                raise RateLimitTimeout("等待限流額度會超過截止時間")
+            if max_wait is not None and wait > max_wait:
+                raise RateLimitTimeout(f"限流額度需要等待 {wait:.1f} 秒")
+            time.sleep(wait)
+    
+    async def acquire_async(self, tokens: float = 1.0, deadline: Optional[float] = None):
+        """非阻塞等待（asyncio 使用，等待期間不佔用執行緒）"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            if deadline is not None and time.time() + wait > deadline:
+                raise RateLimitTimeout("等待限流額度會超過截止時間")
+            await asyncio.sleep(wait)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """指數退避 + full jitter：uniform(0, min(cap, base * 2^attempt))"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def call_with_retry(fn: Callable, bucket: Optional[TokenBucket] = None,
+                    deadline: Optional[float] = None, max_attempts: int = 3,
+                    retry_on: Callable[[Exception], bool] = is_rate_limit_error,
+                    base: float = 1.0, cap: float = 30.0,
+                    max_wait: Optional[float] = None) -> Tuple[Any, int]:
+    """
+    同步重試：每次呼叫前先取得限流額度，遇到限流錯誤就退避重試
+    
+    Args:
+        max_attempts: 總呼叫次數上限（含第一次）
+        max_wait: 單次等待（限流或退避）的上限；超過時不在本執行緒 sleep，直接放棄
+    
+    Returns:
+        (fn 的結果, 實際呼叫次數)
+    
+    Raises:
+        RateLimitTimeout: 等待會超過截止時間或 max_wait
+        原始例外：非限流錯誤，或重試次數用盡
+        拋出的例外帶有 attempts 屬性（已呼叫次數）
+    """
+    attempts = 0
+    try:
+        while True:
+            if bucket:
+                bucket.acquire(deadline=deadline, max_wait=max_wait)
+            attempts += 1
+            try:
+                return fn(), attempts
+            except Exception as e:
+                if not retry_on(e) or attempts >= max_attempts:
+                    raise
+                delay = backoff_delay(attempts - 1, base, cap)
+                if deadline is not None and time.time() + delay > deadline:
+                    raise RateLimitTimeout(f"重試會超過截止時間：{e}") from e
+                if max_wait is not None and delay > max_wait:
+                    raise RateLimitTimeout(f"重試需要等待 {delay:.1f} 秒：{e}") from e
+                print(f"    ⏳ API 限制，{delay:.1f} 秒後重試...")
+                time.sleep(delay)
+    except Exception as e:
+        e.attempts = attempts
+        raise
+
+
+async def acall_with_retry(fn: Callable, bucket: Optional[TokenBucket] = None,
+                           deadline: Optional[float] = None, max_attempts: int = 3,
+                           retry_on: Callable[[Exception], bool] = is_rate_limit_error,
+                           base: float = 1.0, cap: float = 30.0) -> Tuple[Any, int]:
+    """call_with_retry 的 asyncio 版本；fn 為回傳 awaitable 的函數，等待期間不佔用執行緒"""
+    attempts = 0
+    try:
+        while True:
+            if bucket:
+                await bucket.acquire_async(deadline=deadline)
+            attempts += 1
+            try:
+                return await fn(), attempts
+            except Exception as e:
+                if not retry_on(e) or attempts >= max_attempts:
+                    raise
+                delay = backoff_delay(attempts - 1, base, cap)
+                if deadline is not None and time.time() + delay > deadline:
+                    raise RateLimitTimeout(f"重試會超過截止時間：{e}") from e
+                await asyncio.sleep(delay)
+    except Exception as e:
+        e.attempts = attempts
+        raise
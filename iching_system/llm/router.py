@@ -0,0 +1,309 @@
+# iching_system/llm/router.py
+"""
+LLM 供應商路由（含對沖請求）
+============================
+追蹤各供應商最近的延遲與錯誤率，依此選擇主要供應商；
+主要供應商超過自己的 p90 延遲仍未回應時，對次要供應商發出
+對沖（hedged）請求，取先回來的答案。
+
+- 每個請求有成本上限（估算美元），超過上限不發對沖請求
+- 主要供應商直接失敗時，改用次要供應商（同樣受成本上限約束）
+- 取得結果後，尚未開始的對沖請求取消、已在執行的不再等待（結果丟棄）
+- 各供應商的輸出統一在 ProviderRouter 去除前後空白
+- 供應商端點可用 ANTHROPIC_BASE_URL / GEMINI_BASE_URL 指向本地測試伺服器
+
+使用方式:
+    router = ProviderRouter([ClaudeProvider(), GeminiProvider()])
+    text = router.call(prompt, max_tokens=500)
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Optional
+
+from .clients import get_anthropic_client, get_gemini_model, get_anthropic_api_key, get_gemini_api_key
+from .cassette import get_cassette
+from .telemetry import llm_call
+from ..utils.metrics import REGISTRY
+
+
+# 對沖的預設參數
+DEFAULT_HEDGE_DELAY = 3.0     # 樣本不足時，等待多久才對沖（秒）
+MIN_SAMPLES = 10              # 至少幾筆樣本才使用 p90
+WINDOW_SIZE = 100             # 滾動視窗大小
+UNHEALTHY_ERROR_RATE = 0.5    # 錯誤率超過此值視為不健康，降為次要
+
+LLM_HEDGES = REGISTRY.counter('llm_hedged_requests_total', '對沖請求次數', ['provider'])
+LLM_FAILOVERS = REGISTRY.counter('llm_failovers_total', '失敗後改用其他供應商的次數', ['provider'])
+
+
+class RequestAbandoned(Exception):
+    """對沖請求在開始前就已有其他供應商回應"""
+
+
+class ProviderStats:
+    """單一供應商的滾動延遲與錯誤率"""
+    
+    def __init__(self, window: int = WINDOW_SIZE):
+        self._samples = deque(maxlen=window)  # (latency, ok)
+        self._lock = threading.Lock()
+    
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._samples.append((latency, ok))
+    
+    def _latencies(self):
+        with self._lock:
+            return sorted(lat for lat, ok in self._samples if ok)
+    
+    def percentile(self, p: float) -> Optional[float]:
+        latencies = self._latencies()
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        index = min(int(len(latencies) * p), len(latencies) - 1)
+        return latencies[index]
+    
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+    
+    def count(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+
+class LLMProvider:
+    """供應商基類"""
+    
+    name = 'base'
+    input_price = 0.0   # 美元 / 百萬 input tokens
+    output_price = 0.0  # 美元 / 百萬 output tokens
+    
+    def __init__(self):
+        self.stats = ProviderStats()
+    
+    def complete(self, prompt: str, max_tokens: int, section: Optional[str] = None) -> str:
+        """回傳模型輸出的原始文字（最多 max_tokens 個 output tokens）"""
+        raise NotImplementedError
+    
+    def estimate_cost(self, prompt: str, max_tokens: int) -> float:
+        """粗估單次呼叫成本（中文約 1 字 1 token，以 max_tokens 估 output）"""
+        return (len(prompt) * self.input_price + max_tokens * self.output_price) / 1_000_000
+
+
+class ClaudeProvider(LLMProvider):
+    name = 'claude'
+    input_price = 3.0
+    output_price = 15.0
+    
+    def __init__(self, model: str = "claude-sonnet-4-20250514", api_key: Optional[str] = None):
+        super().__init__()
+        self.model = model
+        self.api_key = api_key
+    
+    def complete(self, prompt: str, max_tokens: int, section: Optional[str] = None) -> str:
+        client = get_anthropic_client(self.api_key)
+        with llm_call(self.name, self.model, section=section) as call:
+            response = client.messages.create(
+                model=self.model,
+                max_tokens=max_tokens,
+                messages=[{"role": "user", "content": prompt}]
+            )
+            call.set_usage(response.usage.input_tokens, response.usage.output_tokens)
+        return response.content[0].text
+
+
+class GeminiProvider(LLMProvider):
+    name = 'gemini'
+    input_price = 0.10
+    output_price = 0.40
+    
+    def __init__(self, model: str = 'gemini-2.0-flash-exp', api_key: Optional[str] = None):
+        super().__init__()
+        self.model = model
+        self.api_key = api_key
+    
+    def complete(self, prompt: str, max_tokens: int, section: Optional[str] = None) -> str:
+        model = get_gemini_model(self.model, self.api_key)
+        with llm_call(self.name, self.model, section=section) as call:
+            response = model.generate_content(
+                prompt,
+                generation_config={'max_output_tokens': max_tokens}
+            )
+            usage = getattr(response, 'usage_metadata', None)
+            if usage is not None:
+                call.set_usage(usage.prompt_token_count, usage.candidates_token_count)
+        return response.text
+
+
+class ProviderRouter:
+    """
+    依滾動統計選擇供應商，並在主要供應商變慢時發出對沖請求
+    
+    Args:
+        providers: 依偏好排序的供應商（統計不足時以此順序為準）
+        hedge: 是否啟用對沖
+        budget: 每個請求的成本上限（美元，None 表示不限）
+    """
+    
+    def __init__(self, providers: List[LLMProvider], hedge: bool = True,
+                 budget: Optional[float] = None, max_workers: int = 16):
+        if not providers:
+            raise ValueError("至少需要一個 LLM 供應商")
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.budget = budget
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+    
+    def ranked(self) -> List[LLMProvider]:
+        """
+        健康的在前；全部供應商都有足夠樣本時依 p50 延遲排序，
+        否則維持偏好順序
+        """
+        all_sampled = all(p.stats.percentile(0.5) is not None for p in self.providers)
+        
+        def sort_key(item):
+            order, provider = item
+            unhealthy = (provider.stats.count() >= MIN_SAMPLES
+                         and provider.stats.error_rate() > UNHEALTHY_ERROR_RATE)
+            if all_sampled:
+                return (unhealthy, provider.stats.percentile(0.5), order)
+            return (unhealthy, order)
+        
+        return [p for _, p in sorted(enumerate(self.providers), key=sort_key)]
+    
+    def hedge_delay(self, provider: LLMProvider) -> float:
+        p90 = provider.stats.percentile(0.9)
+        return p90 if p90 is not None else DEFAULT_HEDGE_DELAY
+    
+    def _run(self, provider: LLMProvider, prompt: str, max_tokens: int, section: Optional[str],
+             finished: threading.Event) -> str:
+        if finished.is_set():
+            # 排隊期間其他供應商已回應：不再送出（不計費、不計入統計）
+            raise RequestAbandoned(provider.name)
+        start = time.perf_counter()
+        try:
+            text = provider.complete(prompt, max_tokens, section=section)
+        except Exception:
+            provider.stats.record(time.perf_counter() - start, False)
+            raise
+        provider.stats.record(time.perf_counter() - start, True)
+        # 在本執行緒取下一個工作前標記完成，排隊中的對沖請求就不會送出
+        finished.set()
+        return text.strip()
+    
+    def call(self, prompt: str, max_tokens: int = 500, section: Optional[str] = None) -> str:
+        """
+        呼叫 LLM，回傳最先成功的結果
+        
+        Args:
+            section: 用途標記（寫入遙測）
+        
+        Raises:
+            最後一個供應商的例外（全部失敗時）
+        """
+        ranked = self.ranked()
+        primary, backups = ranked[0], ranked[1:]
+        spent = 0.0
+        pending = {}
+        finished = threading.Event()
+        
+        def launch(provider):
+            """送出請求；第一個請求之外，超過成本上限就不送"""
+            nonlocal spent
+            cost = provider.estimate_cost(prompt, max_tokens)
+            if spent and self.budget is not None and spent + cost > self.budget:
+                return False
+            spent += cost
+            future = self._executor.submit(self._run, provider, prompt, max_tokens, section, finished)
+            pending[future] = provider
+            return True
+        
+        launch(primary)
+        timeout = self.hedge_delay(primary) if (self.hedge and backups) else None
+        
+        try:
+            return self._wait(pending, launch, backups, timeout)
+        finally:
+            # 對沖輸家：還在排隊的取消，執行中的無法中斷，結果直接丟棄
+            finished.set()
+            for future in pending:
+                future.cancel()
+    
+    def _wait(self, pending, launch, backups, timeout) -> str:
+        """等待最先成功的請求；主要供應商逾時時對沖、失敗時改用下一個供應商"""
+        last_error = None
+        while pending:
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            
+            if not done:
+                # 主要供應商超過 p90 仍未回應：對沖到下一個供應商
+                timeout = None
+                if launch(backups[0]):
+                    LLM_HEDGES.inc(provider=backups.pop(0).name)
+                continue
+            
+            for future in done:
+                pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+            
+            # 全部失敗且沒有進行中的請求：依序改用下一個供應商
+            while backups and not pending:
+                provider = backups.pop(0)
+                if not launch(provider):
+                    break
+                LLM_FAILOVERS.inc(provider=provider.name)
+        
+        raise last_error or RuntimeError("沒有可用的 LLM 供應商")
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def get_default_router() -> Optional[ProviderRouter]:
+    """
+    依已設定的 API Key 建立預設路由（Claude 優先、Gemini 次之）
+    
+    對沖與成本上限可用環境變數設定：
+        LLM_HEDGE=0 關閉對沖
+        LLM_REQUEST_BUDGET=0.02 每請求成本上限（美元）
+    """
+    global _default_router
+    if _default_router is not None:
+        return _default_router
+    
+    with _default_router_lock:
+        if _default_router is None:
+            providers = []
+            cassette = get_cassette()
+            replaying = cassette is not None and cassette.replaying
+            # 重播時不需要 API Key，改看錄製檔裡有哪些供應商
+            if get_anthropic_api_key() or (replaying and cassette.has_provider('claude')):
+                providers.append(ClaudeProvider())
+            if get_gemini_api_key() or (replaying and cassette.has_provider('gemini')):
+                providers.append(GeminiProvider())
+            if not providers:
+                return None
+            budget = os.getenv('LLM_REQUEST_BUDGET')
+            _default_router = ProviderRouter(
+                providers,
+                hedge=os.getenv('LLM_HEDGE', '1') != '0',
+                budget=float(budget) if budget else None
+            )
+    return _default_router
+
+
+def reset_default_router():
+    """清除預設路由（API Key 變更後使用）"""
+    global _default_router
+    with _default_router_lock:
+        _default_router = None
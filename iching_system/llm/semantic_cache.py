@@ -0,0 +1,372 @@
+# iching_system/llm/semantic_cache.py
+"""
+語意快取
+========
+同一份解卦、意思相近的問題，重用已微調過的段落
+
+例如「該不該跳槽」與「要不要換工作」抽到同一卦時，
+s1/s2/s6 的微調結果幾乎相同，不必再呼叫一次 LLM。
+
+做法（完全離線，不需 embedding API）：
+1. 問題正規化：全半形、標點、贅詞、常見同義詞
+2. 字元 1-gram + 2-gram 計數向量，cosine 相似度
+3. 以「段落原文 + 段落 id」為 key，每個 key 下存多個問題
+   （段落名稱「現況」、Streamlit 的 's1' 都對應到 's1_status'）
+4. 相似度超過門檻、問題類型相同，且兩個問題不同的字只有虛詞時才命中：
+   「該不該求婚」與「該不該分手」、「是否辭職創業」與「是否辭職」
+   n-gram 相似度都很高但意思不同，多出或換掉的實詞一律不命中
+"""
+
+import re
+import math
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from ..divination.a3_questionnaire import classify_question
+from ..utils.metrics import REGISTRY
+from .telemetry import cache_status, llm_call
+
+
+# 常見同義說法（正規化後才比對 n-gram）
+SYNONYMS = [
+    ('應不應該', '是否'),
+    ('該不該', '是否'),
+    ('要不要', '是否'),
+    ('能不能', '是否'),
+    ('可不可以', '是否'),
+    ('適不適合', '是否'),
+    ('會不會', '是否'),
+    ('跳槽', '換工作'),
+    ('轉職', '換工作'),
+    ('轉換跑道', '換工作'),
+    ('離職', '辭職'),
+    ('另一半', '伴侶'),
+    ('男朋友', '伴侶'),
+    ('女朋友', '伴侶'),
+    ('男友', '伴侶'),
+    ('女友', '伴侶'),
+]
+
+# 不影響語意的贅詞
+FILLERS = ['請問', '想問', '我', '嗎', '呢', '吧', '啊', '呀', '現在', '目前']
+
+# 兩個問題只差這些字時仍視為同一個意思（語助、副詞）
+PARTICLES = set('的了還也都很就再得該')
+
+# 同一段落在各呼叫端的稱呼：Streamlit 的短 id、/api/adapt/stream 與逐段微調的段落名稱、
+# YiliGenerator 的段落 id；快取 key 一律使用段落 id
+SECTION_ALIASES = {
+    's1': 's1_status', '現況': 's1_status',
+    's2': 's2_trend', '變化趨勢': 's2_trend',
+    's3': 's3_process', '變化過程': 's3_process',
+    's6': 's6_outlook', '展望': 's6_outlook',
+}
+
+_PUNCT_RE = re.compile(r'[\s\W_]+', re.UNICODE)
+
+CACHE_LOOKUPS = REGISTRY.counter('llm_semantic_cache_lookups_total', '語意快取查詢次數', ['section', 'result'])
+
+
+def normalize_question(question: str) -> str:
+    """
+    問題正規化
+    
+    Example:
+        >>> normalize_question("請問：我該不該跳槽？")
+        '是否換工作'
+    """
+    text = unicodedata.normalize('NFKC', question or '').lower()
+    text = _PUNCT_RE.sub('', text)
+    for src, dst in SYNONYMS:
+        text = text.replace(src, dst)
+    for filler in FILLERS:
+        text = text.replace(filler, '')
+    return text
+
+
+def section_id(section_name: str) -> str:
+    """段落名稱或短 id 轉為 YiliGenerator 的段落 id（未知的名稱原樣回傳）"""
+    return SECTION_ALIASES.get(section_name, section_name)
+
+
+def same_content(a: str, b: str) -> bool:
+    """
+    兩個正規化後的問題是否只差虛詞（語序可以不同）
+    
+    Example:
+        >>> same_content('是否辭職創業', '是否辭職')
+        False
+    """
+    a_chars, b_chars = Counter(a), Counter(b)
+    differing = (a_chars - b_chars) + (b_chars - a_chars)
+    return all(char in PARTICLES for char in differing)
+
+
+def _vectorize(text: str) -> Tuple[Counter, float]:
+    """字元 1-gram + 2-gram 計數向量與其長度"""
+    grams = Counter(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    norm = math.sqrt(sum(v * v for v in grams.values()))
+    return grams, norm
+
+
+def _cosine(a: Counter, a_norm: float, b: Counter, b_norm: float) -> float:
+    if not a_norm or not b_norm:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(v * b.get(k, 0) for k, v in a.items())
+    return dot / (a_norm * b_norm)
+
+
+class SemanticCache:
+    """
+    記憶體內的近似問題索引
+    
+    key 為 (段落原文, 段落 id) 的雜湊，代表「某份解卦的某一段」；
+    每個 key 最多保留 max_per_key 個問題，整體最多 max_keys 個 key（LRU）
+    """
+    
+    def __init__(self, threshold: float = 0.8, max_keys: int = 4096, max_per_key: int = 32):
+        self.threshold = threshold
+        self.max_keys = max_keys
+        self.max_per_key = max_per_key
+        self._index: 'OrderedDict[str, List[Dict]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(content: str, section_name: str) -> str:
+        return hashlib.sha1(f"{section_id(section_name)}\n{content}".encode('utf-8')).hexdigest()
+    
+    def get(self, key: str, question: str) -> Optional[str]:
+        """查詢：回傳最相似且超過門檻的微調結果，否則 None"""
+        normalized = normalize_question(question)
+        vec, norm = _vectorize(normalized)
+        category = classify_question(normalized)
+        
+        best_score, best_text = 0.0, None
+        with self._lock:
+            entries = self._index.get(key)
+            if entries:
+                self._index.move_to_end(key)
+                for entry in entries:
+                    if entry['category'] != category or not same_content(entry['normalized'], normalized):
+                        continue
+                    if entry['normalized'] == normalized:
+                        best_score, best_text = 1.0, entry['text']
+                        break
+                    score = _cosine(vec, norm, entry['vec'], entry['norm'])
+                    if score > best_score:
+                        best_score, best_text = score, entry['text']
+            
+            if best_text is not None and best_score >= self.threshold:
+                self.hits += 1
+                return best_text
+            self.misses += 1
+            return None
+    
+    def put(self, key: str, question: str, text: str):
+        """寫入一筆微調結果"""
+        normalized = normalize_question(question)
+        vec, norm = _vectorize(normalized)
+        entry = {
+            'normalized': normalized,
+            'category': classify_question(normalized),
+            'vec': vec,
+            'norm': norm,
+            'text': text
+        }
+        with self._lock:
+            entries = self._index.setdefault(key, [])
+            self._index.move_to_end(key)
+            entries[:] = [e for e in entries if e['normalized'] != normalized]
+            entries.append(entry)
+            del entries[:-self.max_per_key]
+            while len(self._index) > self.max_keys:
+                self._index.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._index.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'keys': len(self._index),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+
+class CachedLLMAdapter:
+    """
+    為任一 LLM 適配器加上語意快取
+    
+    介面與 ClaudeLLMAdapter 相同（adapt / adapt_single / adapt_stream / adapt_batch，
+    以及非同步的 aadapt / aadapt_stream / aadapt_batch），
+    失敗時 adapter 會回傳原文，原文不寫入快取；串流只有完整結束才寫入
+    
+    被包裝的 adapter 沒有非同步方法時，改在執行緒中呼叫同步版本
+    """
+    
+    def __init__(self, adapter, cache: Optional[SemanticCache] = None):
+        self.adapter = adapter
+        self.cache = cache or SemanticCache()
+    
+    def _remember(self, key, question, content, text):
+        if text and text != content:
+            self.cache.put(key, question, text)
+    
+    def _lookup(self, key, question, section_name):
+        """查詢快取並記錄命中 / 未命中"""
+        section_name = section_id(section_name)
+        cached = self.cache.get(key, question)
+        CACHE_LOOKUPS.inc(section=section_name, result='miss' if cached is None else 'hit')
+        if cached is not None:
+            # 命中視同一次零成本的 LLM 呼叫，方便在遙測中比較
+            with llm_call('cache', section=section_name, cache='hit'):
+                pass
+        return cached
+    
+    def adapt(self, content, question, section_name):
+        key = self.cache.make_key(content, section_name)
+        cached = self._lookup(key, question, section_name)
+        if cached is not None:
+            return cached
+        with cache_status('miss'):
+            text = self.adapter.adapt(content, question, section_name)
+        self._remember(key, question, content, text)
+        return text
+    
+    def adapt_single(self, content, question, section_name):
+        return self.adapt(content, question, section_name)
+    
+    async def aclose(self):
+        """關閉被包裝 adapter 在目前 event loop 的連線池（若有）"""
+        if hasattr(self.adapter, 'aclose'):
+            await self.adapter.aclose()
+    
+    def adapt_stream(self, content, question, section_name):
+        key = self.cache.make_key(content, section_name)
+        cached = self._lookup(key, question, section_name)
+        if cached is not None:
+            yield cached
+            return
+        # 只有串流完整結束才寫入快取；中途失敗或呼叫端提前關閉時，半段文字不可被重用
+        parts = []
+        stream = self.adapter.adapt_stream(content, question, section_name)
+        try:
+            while True:
+                # 標記只套用在取下一段的期間，不外洩到呼叫端
+                with cache_status('miss'):
+                    text = next(stream, None)
+                if text is None:
+                    break
+                parts.append(text)
+                yield text
+        finally:
+            stream.close()
+        self._remember(key, question, content, ''.join(parts))
+    
+    def adapt_batch(self, sections, question, names=None):
+        result, missing = {}, {}
+        for section_id, content in sections.items():
+            if not content:
+                continue
+            cached = self._lookup(self.cache.make_key(content, section_id), question, section_id)
+            if cached is not None:
+                result[section_id] = cached
+            else:
+                missing[section_id] = content
+        
+        if missing:
+            with cache_status('miss'):
+                if hasattr(self.adapter, 'adapt_batch'):
+                    adapted = self.adapter.adapt_batch(missing, question, names=names)
+                else:
+                    adapted = {k: self.adapter.adapt(v, question, (names or {}).get(k, k))
+                               for k, v in missing.items()}
+            for section_id, text in adapted.items():
+                key = self.cache.make_key(missing[section_id], section_id)
+                self._remember(key, question, missing[section_id], text)
+            result.update(adapted)
+        
+        return result
+    
+    async def aadapt(self, content, question, section_name):
+        key = self.cache.make_key(content, section_name)
+        cached = self._lookup(key, question, section_name)
+        if cached is not None:
+            return cached
+        with cache_status('miss'):
+            if hasattr(self.adapter, 'aadapt'):
+                text = await self.adapter.aadapt(content, question, section_name)
+            else:
+                text = await asyncio.to_thread(self.adapter.adapt, content, question, section_name)
+        self._remember(key, question, content, text)
+        return text
+    
+    async def aadapt_stream(self, content, question, section_name):
+        key = self.cache.make_key(content, section_name)
+        cached = self._lookup(key, question, section_name)
+        if cached is not None:
+            yield cached
+            return
+        if not hasattr(self.adapter, 'aadapt_stream'):
+            text = await self.aadapt(content, question, section_name)
+            yield text
+            return
+        parts = []
+        stream = self.adapter.aadapt_stream(content, question, section_name)
+        try:
+            while True:
+                with cache_status('miss'):
+                    try:
+                        text = await stream.__anext__()
+                    except StopAsyncIteration:
+                        break
+                parts.append(text)
+                yield text
+        finally:
+            await stream.aclose()
+        self._remember(key, question, content, ''.join(parts))
+    
+    async def aadapt_batch(self, sections, question, names=None):
+        result, missing = {}, {}
+        for section_id, content in sections.items():
+            if not content:
+                continue
+            cached = self._lookup(self.cache.make_key(content, section_id), question, section_id)
+            if cached is not None:
+                result[section_id] = cached
+            else:
+                missing[section_id] = content
+        
+        if missing:
+            with cache_status('miss'):
+                if hasattr(self.adapter, 'aadapt_batch'):
+                    adapted = await self.adapter.aadapt_batch(missing, question, names=names)
+                elif hasattr(self.adapter, 'adapt_batch'):
+                    adapted = await asyncio.to_thread(self.adapter.adapt_batch, missing, question, names=names)
+                else:
+                    texts = await asyncio.gather(*(
+                        asyncio.to_thread(self.adapter.adapt, v, question, (names or {}).get(k, k))
+                        for k, v in missing.items()
+                    ))
+                    adapted = dict(zip(missing, texts))
+            for section_id, text in adapted.items():
+                key = self.cache.make_key(missing[section_id], section_id)
+                self._remember(key, question, missing[section_id], text)
+            result.update(adapted)
+        
+        return result
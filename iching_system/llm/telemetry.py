@@ -0,0 +1,186 @@
+# iching_system/llm/telemetry.py
+"""
+LLM 呼叫遙測
+============
+記錄每一次 LLM 呼叫：供應商、模型、段落、耗時、首字延遲（TTFT）、
+input / output tokens、重試次數、快取狀態；
+寫入 utils.metrics 的全域註冊表（可由 /metrics 匯出），
+並保留最近的呼叫紀錄，方便找出最耗時、最花錢的段落。
+
+使用方式:
+    with llm_call('claude', model, section='s1') as call:
+        response = client.messages.create(...)
+        call.set_usage(response.usage.input_tokens, response.usage.output_tokens)
+
+語意快取未命中時，包裝層以 cache_status('miss') 標記其中的實際呼叫:
+    with cache_status('miss'):
+        text = adapter.adapt(...)
+"""
+
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from ..utils.metrics import REGISTRY
+
+
+TOKEN_BUCKETS = (10, 50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+_LABELS = ('provider', 'model', 'section', 'cache')
+
+LLM_CALLS = REGISTRY.counter(
+    'llm_calls_total', 'LLM 呼叫次數', _LABELS + ('status',))
+LLM_DURATION = REGISTRY.histogram(
+    'llm_call_duration_seconds', 'LLM 呼叫耗時（秒）', _LABELS)
+LLM_TTFT = REGISTRY.histogram(
+    'llm_time_to_first_token_seconds', 'LLM 首字延遲（秒，串流呼叫）', _LABELS)
+LLM_TOKENS = REGISTRY.histogram(
+    'llm_call_tokens', '每次呼叫的 tokens 數', _LABELS + ('direction',), buckets=TOKEN_BUCKETS)
+LLM_TOKENS_TOTAL = REGISTRY.counter(
+    'llm_tokens_total', 'LLM tokens 總數', _LABELS + ('direction',))
+LLM_RETRIES = REGISTRY.counter(
+    'llm_retries_total', 'LLM 重試次數', _LABELS)
+
+# 最近的呼叫紀錄
+_recent = deque(maxlen=1000)
+_recent_lock = threading.Lock()
+
+# 未指定 cache 的 llm_call 採用的快取狀態
+_cache_status = contextvars.ContextVar('llm_cache_status', default='none')
+
+
+@contextmanager
+def cache_status(status: str):
+    """區塊內建立、未指定 cache 的 llm_call 標記為 status"""
+    token = _cache_status.set(status)
+    try:
+        yield
+    finally:
+        _cache_status.reset(token)
+
+
+def in_context(fn):
+    """
+    包裝交給執行緒池的函式，讓工作執行緒沿用呼叫端的快取狀態
+    
+    每個工作各自複製一份 context（同一個 Context 不能同時在多個執行緒進入）
+    """
+    ctx = contextvars.copy_context()
+    return lambda *args: ctx.copy().run(fn, *args)
+
+
+class LLMCall:
+    """單次呼叫的紀錄（由 llm_call 建立）"""
+    
+    def __init__(self, provider: str, model: str, section: Optional[str], cache: str):
+        self.provider = provider
+        self.model = model or ''
+        self.section = section or ''
+        self.cache = cache
+        self.start = time.perf_counter()
+        self.wall_time = None
+        self.ttft = None
+        self.input_tokens = None
+        self.output_tokens = None
+        self.retries = 0
+        self.status = 'ok'
+    
+    def first_token(self):
+        """串流收到第一段文字時呼叫"""
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+    
+    def set_usage(self, input_tokens: Optional[int], output_tokens: Optional[int]):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+    
+    def to_dict(self) -> Dict:
+        return {
+            'provider': self.provider,
+            'model': self.model,
+            'section': self.section,
+            'cache': self.cache,
+            'status': self.status,
+            'wall_time': self.wall_time,
+            'ttft': self.ttft,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'retries': self.retries
+        }
+
+
+class llm_call:
+    """
+    記錄一次 LLM 呼叫的 context manager
+    
+    Args:
+        provider: 'claude' | 'gemini' | 'ollama' | 'cache' ...
+        model: 模型名稱
+        section: 段落或用途（如 's1'、'1_現況'、'a4_score'）
+        cache: 'none' | 'hit' | 'miss'；None 則採用 cache_status 的設定（預設 'none'）
+    """
+    
+    def __init__(self, provider: str, model: str = '', section: Optional[str] = None,
+                 cache: Optional[str] = None):
+        self.call = LLMCall(provider, model, section, cache or _cache_status.get())
+    
+    def __enter__(self) -> LLMCall:
+        return self.call
+    
+    def __exit__(self, exc_type, exc, tb):
+        call = self.call
+        call.wall_time = time.perf_counter() - call.start
+        if exc_type is GeneratorExit:
+            call.status = 'cancelled'  # 串流被呼叫端中止
+        elif exc_type is not None:
+            call.status = 'error'
+        record(call)
+        return False
+
+
+def record(call: LLMCall):
+    """寫入指標註冊表與最近紀錄"""
+    labels = dict(provider=call.provider, model=call.model, section=call.section, cache=call.cache)
+    LLM_CALLS.inc(status=call.status, **labels)
+    LLM_DURATION.observe(call.wall_time or 0.0, **labels)
+    if call.ttft is not None:
+        LLM_TTFT.observe(call.ttft, **labels)
+    for direction, tokens in (('input', call.input_tokens), ('output', call.output_tokens)):
+        if tokens is not None:
+            LLM_TOKENS.observe(tokens, direction=direction, **labels)
+            LLM_TOKENS_TOTAL.inc(tokens, direction=direction, **labels)
+    if call.retries:
+        LLM_RETRIES.inc(call.retries, **labels)
+    with _recent_lock:
+        _recent.append(call.to_dict())
+
+
+def recent_calls(limit: int = 100) -> List[Dict]:
+    """最近的呼叫紀錄（新的在後）"""
+    with _recent_lock:
+        return list(_recent)[-limit:]
+
+
+def summary() -> Dict[str, Dict]:
+    """
+    依段落彙總最近的呼叫：次數、總耗時、平均耗時、tokens
+    
+    Returns:
+        {section: {...}}，依總耗時由大到小排序
+    """
+    groups: Dict[str, Dict] = {}
+    for item in recent_calls(limit=_recent.maxlen):
+        g = groups.setdefault(item['section'] or '-', {
+            'calls': 0, 'wall_time': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'cache_hits': 0
+        })
+        g['calls'] += 1
+        g['wall_time'] += item['wall_time'] or 0.0
+        g['input_tokens'] += item['input_tokens'] or 0
+        g['output_tokens'] += item['output_tokens'] or 0
+        g['cache_hits'] += item['cache'] == 'hit'
+    for g in groups.values():
+        g['avg_wall_time'] = g['wall_time'] / g['calls']
+    return dict(sorted(groups.items(), key=lambda kv: kv[1]['wall_time'], reverse=True))
@@ -0,0 +1,134 @@
+# precompute_variants.py
+"""
+離線預生成問題分類版本
+======================
+將 s1（64 個現況）、s2（4096 個趨勢）、s6（64 個展望）依問題分類
+（career / relationship / general）各微調一份，存成 data/yili_variants.json。
+線上 A2/A3/A4 直接取用，LLM 即時微調變成可選的額外個人化。
+
+- 使用 adapter.adapt_batch 一次微調多段（預設 8 段一批）
+- 可中斷續跑：已存在的段落會略過；每完成 --save-every 批（預設 10）寫回檔案一次，
+  中斷時最多重跑最後未寫回的幾批
+
+執行：
+    python -m iching_system.precompute_variants
+    python -m iching_system.precompute_variants --sections s1 s6 --categories career
+    YILI_LLM_ADAPTER=ollama python -m iching_system.precompute_variants --workers 4
+"""
+
+import os
+import json
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .core.yili_generator import YiliGenerator, VARIANTS_FILENAME, VARIANT_CATEGORIES
+from .core.yili_llm_adapter import create_adapter
+
+
+# 每個分類用來微調的「代表問題」
+CATEGORY_QUESTIONS = {
+    'career': '關於職涯與工作的決定（例如：該不該跳槽、要不要轉職、適不適合創業）',
+    'relationship': '關於感情與關係的決定（例如：該不該繼續交往、要不要結婚、是否分手）',
+    'general': '關於人生中一個重要的決定（例如：要不要搬家、該不該做出改變）',
+}
+
+
+def collect_sources(generator):
+    """
+    收集所有需要預生成的中性原文
+    
+    Returns:
+        {'s1': {key: text}, 's2': {key: text}, 's6': {key: text}}
+    """
+    sources = {'s1': {}, 's2': {}, 's6': {}}
+    for num, template in generator.general.items():
+        text = template.get('卦解', '')
+        sources['s1'][num] = text
+        sources['s6'][num] = generator._adapt_text_for_section(text, 'outlook')
+    for key, trend in generator.trends.items():
+        sources['s2'][key] = trend.get('趨勢', '')
+    return sources
+
+
+def load_output(path):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {'meta': {}, 'sections': {'s1': {}, 's2': {}, 's6': {}}}
+
+
+def save_output(data, path):
+    data['meta'] = {
+        'categories': list(VARIANT_CATEGORIES),
+        'questions': CATEGORY_QUESTIONS,
+        'updated': datetime.now().isoformat()
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="離線預生成問題分類版本")
+    parser.add_argument('--sections', nargs='+', default=['s1', 's2', 's6'], choices=['s1', 's2', 's6'])
+    parser.add_argument('--categories', nargs='+', default=list(VARIANT_CATEGORIES), choices=VARIANT_CATEGORIES)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--limit', type=int, default=None, help='每個段落類型最多處理幾筆（試跑用）')
+    parser.add_argument('--save-every', type=int, default=10, help='每完成幾批寫回檔案一次')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+    
+    generator = YiliGenerator()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    output_path = args.output or os.path.join(base_dir, 'data', VARIANTS_FILENAME)
+    
+    data = load_output(output_path)
+    sources = collect_sources(generator)
+    adapter = create_adapter()
+    lock = threading.Lock()
+    
+    # 組成待辦批次：(段落類型, 分類, {key: 原文})
+    jobs = []
+    for section in args.sections:
+        items = list(sources[section].items())[:args.limit]
+        done = data['sections'].setdefault(section, {})
+        for category in args.categories:
+            todo = [(k, v) for k, v in items if v and category not in done.get(k, {})]
+            for i in range(0, len(todo), args.batch_size):
+                jobs.append((section, category, dict(todo[i:i + args.batch_size])))
+    
+    total = sum(len(batch) for _, _, batch in jobs)
+    print("=" * 60)
+    print(f"預生成：{len(jobs)} 批，共 {total} 段")
+    print("=" * 60)
+    
+    def run(job):
+        section, category, batch = job
+        return job, adapter.adapt_batch(batch, CATEGORY_QUESTIONS[category])
+    
+    finished = 0
+    batches = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for future in as_completed([pool.submit(run, job) for job in jobs]):
+            (section, category, batch), adapted = future.result()
+            with lock:
+                for key, text in adapted.items():
+                    # adapter 失敗時會回傳原文，不寫入
+                    if text and text != batch[key]:
+                        data['sections'][section].setdefault(key, {})[category] = text
+                batches += 1
+                if batches % args.save_every == 0:
+                    save_output(data, output_path)  # 定期寫回，方便中斷續跑
+            finished += len(batch)
+            print(f"  ✓ {section}/{category} {finished}/{total}")
+    
+    save_output(data, output_path)
+    print(f"✅ 已保存: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
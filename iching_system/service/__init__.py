@@ -0,0 +1,144 @@
+"""
+API 服務模組
+============
+
+api.py（FastAPI）使用的服務層，與框架無關，方便測試與重用
+
+包含：
+- reading: 問題 → 起卦 → 完整六點解卦（非同步微調）
+- batch: 批次解卦（去重、NDJSON 串流）
+- progressive: 漸進式解卦（制式段落立即送出，微調段落完成即送）
+- session: A3 / A4 互動起卦的 WebSocket session
+- admission: LLM 工作的准入控制（名額、排隊截止、客戶端限流、降級）
+- jobs: 背景工作佇列（A4 Agent 起卦；程序內 / SQLite 後端）
+- response_cache: 已序列化回應的 LRU / 共用快取與 ETag
+- compact: MessagePack 精簡回應與模板文字引用
+- singleflight: 合併相同的進行中請求
+- instrumentation: HTTP 與各階段耗時指標
+- warmup: 啟動預熱與就緒狀態
+"""
+
+from .reading import (
+    question_seed,
+    cast_for_question,
+    build_reading,
+    reading_payload,
+    render_reading,
+    validate_yao_values
+)
+
+from .progressive import (
+    progressive_reading,
+    IMMEDIATE_SECTIONS
+)
+
+from .session import DivinationSession
+
+from .admission import (
+    AdmissionController,
+    Admission,
+    ClientRateLimited,
+    get_admission,
+    admitted_reading
+)
+
+from .jobs import (
+    JobQueue,
+    JobWorker,
+    JobQueueFull,
+    MemoryJobBackend,
+    SQLiteJobBackend,
+    get_job_queue
+)
+
+from .batch import (
+    stream_batch,
+    MAX_BATCH_ITEMS
+)
+
+from .response_cache import (
+    ResponseCache,
+    get_response_cache,
+    cache_key,
+    etag_matches
+)
+
+from .compact import (
+    TemplateTable,
+    get_template_table,
+    wants_msgpack
+)
+
+from .singleflight import (
+    SingleFlight,
+    Flight
+)
+
+from .instrumentation import (
+    stage,
+    refresh_cache_ratios
+)
+
+from .warmup import (
+    WarmupState,
+    warm_up
+)
+
+__all__ = [
+    # reading
+    'question_seed',
+    'cast_for_question',
+    'build_reading',
+    'reading_payload',
+    'render_reading',
+    'validate_yao_values',
+    
+    # progressive
+    'progressive_reading',
+    'IMMEDIATE_SECTIONS',
+    
+    # session
+    'DivinationSession',
+    
+    # admission
+    'AdmissionController',
+    'Admission',
+    'ClientRateLimited',
+    'get_admission',
+    'admitted_reading',
+    
+    # jobs
+    'JobQueue',
+    'JobWorker',
+    'JobQueueFull',
+    'MemoryJobBackend',
+    'SQLiteJobBackend',
+    'get_job_queue',
+    
+    # batch
+    'stream_batch',
+    'MAX_BATCH_ITEMS',
+    
+    # response_cache
+    'ResponseCache',
+    'get_response_cache',
+    'cache_key',
+    'etag_matches',
+    
+    # compact
+    'TemplateTable',
+    'get_template_table',
+    'wants_msgpack',
+    
+    # singleflight
+    'SingleFlight',
+    'Flight',
+    
+    # instrumentation
+    'stage',
+    'refresh_cache_ratios',
+    
+    # warmup
+    'WarmupState',
+    'warm_up'
+]
@@ -0,0 +1,307 @@
+# iching_system/service/admission.py
+"""
+LLM 工作的准入控制
+==================
+突發流量時每個 A2 / A3 / A4 請求都在等 LLM，延遲無上限、也會超過供應商額度。
+需要 LLM 的工作（微調 s1/s2/s6、A4 Agent 分析）先經過准入：
+
+1. 每個客戶端一個 token bucket（LLM_CLIENT_RATE 每秒、LLM_CLIENT_BURST 瞬間上限）
+2. 同時執行的 LLM 工作上限（LLM_MAX_CONCURRENCY），其餘依先來後到排隊
+3. 排隊有截止時間：依目前佇列長度與平均執行時間估計等待時間，
+   估計會超過延遲預算（LLM_LATENCY_BUDGET 秒）或佇列已滿（LLM_MAX_QUEUE）時
+   不排隊；已排隊但超過預算仍未輪到時放棄
+   平均執行時間依工作種類（workload）分開估計：段落微調（adapt）約數秒，
+   A4 Agent 分析（agent）可達數十秒，混在一起會高估微調請求的等待時間；
+   估計等待時間時依執行中與排隊中工作的種類組成加權
+
+沒有取得准入時呼叫端降級：回傳不經 LLM 的解卦（中性版或預生成版本）並標記
+degraded: true；/api/ask 的客戶端限流則回傳 429。
+名額與限流狀態在程序內計算（serve.py 多 worker 時為每個 worker 各自的上限）
+
+用法：
+    async with get_admission().admit(client_id) as admission:
+        if admission.admitted:
+            ...  # LLM 工作
+        else:
+            ...  # 降級，admission.reason 說明原因
+"""
+
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from ..llm.rate_limit import TokenBucket
+from ..utils.metrics import REGISTRY
+from .reading import build_reading
+
+
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '32'))
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '256'))
+LLM_LATENCY_BUDGET = float(os.getenv('LLM_LATENCY_BUDGET', '8'))
+LLM_CLIENT_RATE = float(os.getenv('LLM_CLIENT_RATE', '0.5'))
+LLM_CLIENT_BURST = float(os.getenv('LLM_CLIENT_BURST', '5'))
+# 尚無量測值時假設的 LLM 工作耗時（秒）
+LLM_EXPECTED_SECONDS = float(os.getenv('LLM_EXPECTED_SECONDS', '3'))
+
+ADMISSIONS = REGISTRY.counter(
+    'llm_admission_total',
+    'LLM 工作准入結果（result=admitted|rate_limited|overloaded|queue_full|queue_timeout）', ('result',))
+ADMISSION_WAIT = REGISTRY.histogram(
+    'llm_admission_wait_seconds', '取得 LLM 執行名額前的排隊時間（秒）',
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+ADMISSION_ACTIVE = REGISTRY.gauge('llm_admission_active', '執行中的 LLM 工作數')
+ADMISSION_QUEUED = REGISTRY.gauge('llm_admission_queued', '排隊中的 LLM 工作數')
+
+
+class ClientRateLimited(Exception):
+    """客戶端超過 LLM 工作的限流額度"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"請求過於頻繁，請於 {retry_after:.1f} 秒後重試")
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class Admission:
+    """一次准入的結果"""
+
+    def __init__(self, admitted: bool, reason: Optional[str] = None,
+                 retry_after: Optional[float] = None, waited: float = 0.0):
+        self.admitted = admitted
+        self.reason = reason
+        self.retry_after = retry_after
+        self.waited = waited
+
+    @property
+    def degraded(self) -> bool:
+        return not self.admitted
+
+
+class AdmissionController:
+    """
+    LLM 工作的名額、排隊與客戶端限流（單一 event loop 內使用）
+
+    Args:
+        max_concurrency: 同時執行的 LLM 工作上限
+        max_queue: 排隊上限
+        latency_budget: 排隊等待的時間上限（秒）
+        client_rate: 每個客戶端每秒可開始的 LLM 工作數（0 表示不限）
+        client_burst: 每個客戶端的瞬間上限
+        max_clients: 保留限流狀態的客戶端數（LRU）
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 latency_budget: float = LLM_LATENCY_BUDGET, client_rate: float = LLM_CLIENT_RATE,
+                 client_burst: float = LLM_CLIENT_BURST, max_clients: int = 10000):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.latency_budget = latency_budget
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.max_clients = max_clients
+
+        self._active = 0
+        # 排隊中的 (future, 工作種類)
+        self._waiters: 'deque[Tuple[asyncio.Future, str]]' = deque()
+        self._clients: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        # 執行中的各種類工作數
+        self._running: Dict[str, int] = {}
+        # 各種類 LLM 工作的平均耗時（EWMA），用來估計排隊時間
+        self._service_times: Dict[str, float] = {}
+
+    # === 客戶端限流 ===
+    def _take_client(self, client_id: Optional[str]) -> float:
+        if not client_id or self.client_rate <= 0:
+            return 0.0
+        bucket = self._clients.get(client_id)
+        if bucket is None:
+            bucket = self._clients[client_id] = TokenBucket(self.client_rate, self.client_burst)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(client_id)
+        return bucket.try_acquire()
+
+    def check_client(self, client_id: Optional[str]):
+        """
+        先行扣除客戶端額度（之後以 admit(None) 取得名額）
+
+        single-flight 的 leader 在開始計算前呼叫；合併到進行中計算的請求不扣額度
+
+        Raises:
+            ClientRateLimited: 超過限流額度
+        """
+        retry_after = self._take_client(client_id)
+        if retry_after > 0:
+            self._record(Admission(False, 'rate_limited', retry_after=retry_after))
+            raise ClientRateLimited(retry_after)
+
+    # === 名額與排隊 ===
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter, _ in self._waiters if not waiter.done())
+
+    def service_time(self, workload: str) -> float:
+        """該種類工作的平均耗時（尚無量測值時為 LLM_EXPECTED_SECONDS）"""
+        return self._service_times.get(workload, LLM_EXPECTED_SECONDS)
+
+    def estimated_wait(self) -> float:
+        """新請求預估的排隊秒數（名額釋出的速度取決於執行中與排隊中的工作種類）"""
+        queued = [workload for waiter, workload in self._waiters if not waiter.done()]
+        if self._active < self.max_concurrency and not queued:
+            return 0.0
+        jobs = list(queued)
+        for workload, count in self._running.items():
+            jobs += [workload] * count
+        mean = sum(self.service_time(w) for w in jobs) / len(jobs) if jobs else LLM_EXPECTED_SECONDS
+        return (len(queued) + 1) / self.max_concurrency * mean
+
+    def _start(self, workload: str):
+        self._running[workload] = self._running.get(workload, 0) + 1
+
+    def _release(self, workload: str):
+        self._running[workload] -= 1
+        # 名額直接交給下一個仍在等待的請求
+        while self._waiters:
+            waiter, next_workload = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                self._start(next_workload)
+                ADMISSION_QUEUED.set(self.queued)
+                return
+        self._active -= 1
+        ADMISSION_ACTIVE.set(self._active)
+
+    async def _acquire(self, timeout: float, workload: str) -> bool:
+        if self._active < self.max_concurrency and not self.queued:
+            self._active += 1
+            self._start(workload)
+            ADMISSION_ACTIVE.set(self._active)
+            return True
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((waiter, workload))
+        ADMISSION_QUEUED.set(self.queued)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            return True
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # 逾時的同時剛好輪到
+                return True
+            waiter.cancel()
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(workload)
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            ADMISSION_QUEUED.set(self.queued)
+
+    def _record(self, admission: Admission) -> Admission:
+        ADMISSIONS.inc(result='admitted' if admission.admitted else admission.reason)
+        return admission
+
+    @asynccontextmanager
+    async def admit(self, client_id: Optional[str] = None, budget: Optional[float] = None,
+                    workload: str = 'adapt'):
+        """
+        取得一個 LLM 工作名額，離開時歸還
+
+        Args:
+            client_id: 客戶端識別（None 不做客戶端限流）
+            budget: 本次可接受的排隊秒數（預設 latency_budget）
+            workload: 工作種類（'adapt' 段落微調、'agent' A4 Agent 分析），
+                各自估計平均耗時
+
+        Yields:
+            Admission；admitted 為 False 時呼叫端應降級
+        """
+        budget = self.latency_budget if budget is None else budget
+
+        retry_after = self._take_client(client_id)
+        if retry_after > 0:
+            yield self._record(Admission(False, 'rate_limited', retry_after=retry_after))
+            return
+        if self.queued >= self.max_queue:
+            yield self._record(Admission(False, 'queue_full', retry_after=self.estimated_wait()))
+            return
+        estimate = self.estimated_wait()
+        if estimate > budget:
+            yield self._record(Admission(False, 'overloaded', retry_after=estimate))
+            return
+
+        start = time.perf_counter()
+        if not await self._acquire(budget, workload):
+            ADMISSION_WAIT.observe(time.perf_counter() - start)
+            yield self._record(Admission(False, 'queue_timeout', retry_after=self.estimated_wait()))
+            return
+        waited = time.perf_counter() - start
+        ADMISSION_WAIT.observe(waited)
+
+        started = time.perf_counter()
+        try:
+            yield self._record(Admission(True, waited=waited))
+        finally:
+            elapsed = time.perf_counter() - started
+            self._service_times[workload] = 0.8 * self.service_time(workload) + 0.2 * elapsed
+            self._release(workload)
+
+    def stats(self):
+        return {
+            'active': self._active,
+            'queued': self.queued,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'latency_budget': self.latency_budget,
+            'estimated_wait': round(self.estimated_wait(), 3),
+            'service_time': {workload: round(seconds, 3) for workload, seconds in self._service_times.items()},
+        }
+
+
+_admission: Optional[AdmissionController] = None
+
+
+def get_admission() -> AdmissionController:
+    """程序共用的准入控制（依環境變數設定）"""
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController()
+    return _admission
+
+
+def mark_degraded(payload: Dict, reason: Optional[str]) -> Dict:
+    """標記為降級回應（未經 LLM 微調）"""
+    payload['degraded'] = True
+    payload['degraded_reason'] = reason
+    return payload
+
+
+async def admitted_reading(question: Optional[str], generator, adapter=None,
+                           yao_values: Optional[List[int]] = None,
+                           hexagrams: Optional[Dict] = None,
+                           client_id: Optional[str] = None) -> Dict:
+    """
+    build_reading 加上准入控制
+
+    需要微調時先取得 LLM 名額；未取得時回傳不微調的解卦並標記 degraded
+    （client_id 為 None 時不做客戶端限流，例如已由 check_client 扣除）
+    """
+    if adapter is None or question is None:
+        return await build_reading(question, generator, None, yao_values, hexagrams)
+
+    async with get_admission().admit(client_id) as admission:
+        if admission.admitted:
+            return await build_reading(question, generator, adapter, yao_values, hexagrams)
+
+    payload = await build_reading(question, generator, None, yao_values, hexagrams)
+    return mark_degraded(payload, admission.reason)
@@ -0,0 +1,112 @@
+# iching_system/service/batch.py
+"""
+批次解卦
+========
+一次請求處理多個問題 / 六爻，結果以 NDJSON 逐行串流回傳
+
+- 相同輸入只計算一次（問題去頭尾空白後比對），結果序列化一次後
+  依原始位置各輸出一行
+- 同一組六爻的 compute_b_stage 在整批中只算一次
+- 不微調時依輸入順序輸出；微調時以 BATCH_CONCURRENCY 為上限並行，
+  先完成的先輸出（每行帶 index，客戶端依 index 對應）
+- 微調的批次在開始前整批扣一次客戶端額度（api.py 以 check_client 檢查，
+  超過時回 429）；各筆只受 LLM 同時執行上限與排隊預算限制（admission.py），
+  未取得名額的那筆回傳不微調的版本，result 帶 degraded: true 與 degraded_reason
+
+每行格式：
+    {"index": 0, "result": {...}}      # 同 /api/ask 的回應
+    {"index": 3, "error": "..."}        # 單筆錯誤不影響其他筆
+"""
+
+import os
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from ..core.calculator import compute_b_stage
+from ..utils.serialization import dumps
+from .reading import render_reading, cast_for_question, validate_yao_values
+from .admission import admitted_reading
+from .instrumentation import stage
+
+
+MAX_BATCH_ITEMS = int(os.getenv('API_MAX_BATCH', '500'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '16'))
+
+
+def batch_key(question: Optional[str], yao_values: Optional[List[int]]) -> Tuple:
+    """去重用的輸入鍵"""
+    question = question.strip() if question else None
+    return (question, tuple(yao_values) if yao_values else None)
+
+
+def _line(index: int, body: bytes, field: str = 'result') -> bytes:
+    return b'{"index":%d,"%s":%s}\n' % (index, field.encode(), body)
+
+
+async def stream_batch(items: List[Dict], generator, adapter=None) -> AsyncIterator[bytes]:
+    """
+    批次解卦
+    
+    Args:
+        items: [{'question': ..., 'yao_values': [...]}, ...]（至少提供其一）
+        generator: YiliGenerator
+        adapter: LLM 微調適配器（None 則不微調；客戶端額度由呼叫端先行扣除）
+    
+    Yields:
+        NDJSON 的每一行（bytes）
+    """
+    # 1. 去重：key -> 原始位置
+    positions: Dict[Tuple, List[int]] = {}
+    for index, item in enumerate(items):
+        key = batch_key(item.get('question'), item.get('yao_values'))
+        positions.setdefault(key, []).append(index)
+    
+    # 2. 每組六爻的卦象只算一次
+    hexagram_cache: Dict[Tuple, Dict] = {}
+    
+    async def compute(key) -> bytes:
+        question, yao = key
+        if yao is None:
+            if question is None:
+                raise ValueError("需要 question 或 yao_values")
+            with stage('cast'):
+                yao = tuple(cast_for_question(question))
+        else:
+            validate_yao_values(list(yao))
+        hexagrams = hexagram_cache.get(yao)
+        if hexagrams is None:
+            with stage('compute_b_stage'):
+                hexagrams = hexagram_cache[yao] = compute_b_stage(list(yao))
+        result = await admitted_reading(question, generator, adapter, list(yao), hexagrams)
+        return render_reading(result)
+    
+    async def run(key):
+        try:
+            return key, await compute(key), 'result'
+        except Exception as e:
+            return key, dumps(str(e)), 'error'
+    
+    def lines(key, body, field):
+        return b''.join(_line(i, body, field) for i in positions[key])
+    
+    if adapter is None:
+        # 純查表：依序計算與輸出，每筆之間讓出 event loop
+        for key in positions:
+            yield lines(*await run(key))
+            await asyncio.sleep(0)
+        return
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def bounded(key):
+        async with semaphore:
+            return await run(key)
+    
+    tasks = [asyncio.ensure_future(bounded(key)) for key in positions]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield lines(*await task)
+    finally:
+        # 客戶端中斷時取消尚未完成的微調
+        for task in tasks:
+            task.cancel()
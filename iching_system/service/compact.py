@@ -0,0 +1,131 @@
+# iching_system/service/compact.py
+"""
+精簡二進位回應（行動版 PWA）
+============================
+解卦 JSON 約 6 KB，大部分是固定的模板文字（卦解、六階段、建議）。
+客戶端送 Accept: application/msgpack 時改以 MessagePack 編碼同一份結構，
+並可宣告已快取的模板文字，這些字串改以編號引用：
+
+1. GET /api/templates                  目前版本與分組數
+   GET /api/templates/{version}/{n}    第 n 組文字（0 共用、1-64 各卦），內容不變，可長期快取
+2. 請求帶 X-Yili-Templates: <version>:<已快取分組的位元遮罩（十六進位）>
+   例如 <version>:1ffffffffffffffff 表示 65 組都已快取（第 n 組為第 n 個位元）
+3. 已快取分組中的字串編碼為 MessagePack extension（type 1，資料 2 bytes：
+   [分組, 序號]），取代數百 bytes 的 UTF-8 文字；
+   版本不符時不引用，回應的 X-Yili-Templates-Version 告知目前版本
+
+LLM 微調過的段落、問題等不在模板中的文字照常以字串送出。
+需要安裝 msgpack 或 msgspec；都未安裝時一律回應 JSON
+"""
+
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from ..utils.serialization import dumps, msgpack_dumps, msgpack_ext, MSGPACK_BACKEND
+from .instrumentation import stage
+
+
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, 'application/x-msgpack', 'application/vnd.msgpack')
+
+# 模板引用的 MessagePack extension type
+TEMPLATE_EXT_TYPE = 1
+# 引用本身佔 4 bytes（fixext 2），更短的字串直接送出
+MIN_REFERENCE_BYTES = 5
+
+
+def _accept_quality(accept: str) -> Dict[str, float]:
+    qualities = {}
+    for item in accept.split(','):
+        media_type, *params = [part.strip() for part in item.split(';')]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type:
+            qualities[media_type.lower()] = max(q, qualities.get(media_type.lower(), 0.0))
+    return qualities
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    """
+    Accept 明確列出 MessagePack 且偏好不低於 application/json 時回傳 True
+    （萬用字元不算；未安裝編碼器時一律 False）
+    """
+    if not accept or MSGPACK_BACKEND is None:
+        return False
+    qualities = _accept_quality(accept)
+    msgpack_q = max(qualities.get(t, 0.0) for t in MSGPACK_MEDIA_TYPES)
+    return msgpack_q > 0 and msgpack_q >= qualities.get('application/json', 0.0)
+
+
+class TemplateTable:
+    """
+    模板文字表與 MessagePack 編碼
+
+    Args:
+        chunks: YiliGenerator.template_chunks() 的分組文字（每組最多 256 個）
+    """
+
+    def __init__(self, chunks: List[List[str]]):
+        if len(chunks) > 256 or any(len(texts) > 256 for texts in chunks):
+            raise ValueError("模板分組與每組文字數不可超過 256")
+        self.chunks = chunks
+        self.version = hashlib.sha256(dumps(chunks)).hexdigest()[:12]
+        self._references: Dict[str, Tuple[int, int]] = {}
+        for chunk, texts in enumerate(chunks):
+            for index, text in enumerate(texts):
+                if len(text.encode('utf-8')) >= MIN_REFERENCE_BYTES:
+                    self._references.setdefault(text, (chunk, index))
+
+    def cached_chunks(self, header: Optional[str]) -> int:
+        """由 X-Yili-Templates 取得客戶端已快取的分組（位元遮罩）；版本不符或格式錯誤為 0"""
+        if not header:
+            return 0
+        version, _, mask = header.strip().partition(':')
+        if version != self.version:
+            return 0
+        try:
+            return int(mask, 16) & ((1 << len(self.chunks)) - 1)
+        except ValueError:
+            return 0
+
+    def _compact(self, obj, cached: int):
+        if isinstance(obj, str):
+            reference = self._references.get(obj)
+            if reference is not None and cached >> reference[0] & 1:
+                return msgpack_ext(TEMPLATE_EXT_TYPE, bytes(reference))
+            return obj
+        if isinstance(obj, dict):
+            return {key: self._compact(value, cached) for key, value in obj.items()}
+        if isinstance(obj, list):
+            return [self._compact(value, cached) for value in obj]
+        return obj
+
+    def encode(self, payload, cached: int = 0) -> bytes:
+        """MessagePack 編碼；cached 中分組的模板文字改為引用"""
+        with stage('render_msgpack'):
+            return msgpack_dumps(self._compact(payload, cached) if cached else payload)
+
+    def describe(self) -> Dict:
+        return {
+            'version': self.version,
+            'chunks': len(self.chunks),
+            'ext_type': TEMPLATE_EXT_TYPE,
+            'url': f'/api/templates/{self.version}/{{n}}'
+        }
+
+
+_template_table: Optional[TemplateTable] = None
+
+
+def get_template_table(generator) -> TemplateTable:
+    """程序共用的模板文字表（由 YiliGenerator 的資料建立一次）"""
+    global _template_table
+    if _template_table is None:
+        _template_table = TemplateTable(generator.template_chunks())
+    return _template_table
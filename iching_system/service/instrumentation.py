@@ -0,0 +1,60 @@
+# iching_system/service/instrumentation.py
+"""
+API 指標
+========
+以共用的 REGISTRY 記錄，GET /metrics 以 Prometheus 文字格式輸出：
+
+- http_request_duration_seconds{method,route,status}：每個路由的延遲分布
+  （串流回應記錄到回應標頭送出為止）
+- http_requests_in_flight{route}：處理中的請求數
+- api_stage_duration_seconds{stage}：單一請求內各階段耗時
+    cast            問題 → 六爻
+    compute_b_stage 卦象計算
+    generate        YiliGenerator 查表組裝（含預生成版本）
+    llm_adapt       s1/s2/s6 的 LLM 微調
+    render          序列化回應
+- cache_hit_ratio{cache}：回應快取與語意快取的命中率（/metrics 讀取時更新）
+"""
+
+from ..utils.metrics import REGISTRY
+
+
+# 查表階段為數十微秒，LLM 階段為數秒
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HTTP_DURATION = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP 請求耗時（秒）', ('method', 'route', 'status'))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    'http_requests_in_flight', '處理中的 HTTP 請求數', ('route',))
+STAGE_DURATION = REGISTRY.histogram(
+    'api_stage_duration_seconds', '解卦各階段耗時（秒）', ('stage',), buckets=STAGE_BUCKETS)
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    'cache_hit_ratio', '快取命中率（0-1）', ('cache',))
+
+
+def stage(name: str):
+    """記錄一個階段的耗時：with stage('compute_b_stage'): ..."""
+    return STAGE_DURATION.time(stage=name)
+
+
+def observe_stage(name: str, seconds: float):
+    """直接記錄一個階段的耗時（階段跨越 yield 時，只計算實際工作的時間）"""
+    STAGE_DURATION.observe(seconds, stage=name)
+
+
+def _hit_ratio(counter, hit_results) -> float:
+    totals = counter.sum_by('result')
+    lookups = sum(totals.values())
+    if not lookups:
+        return 0.0
+    return sum(totals.get(r, 0.0) for r in hit_results) / lookups
+
+
+def refresh_cache_ratios():
+    """由查詢次數計算命中率（輸出 /metrics 前呼叫）"""
+    from .response_cache import CACHE_LOOKUPS as RESPONSE_LOOKUPS
+    from ..llm.semantic_cache import CACHE_LOOKUPS as SEMANTIC_LOOKUPS
+    
+    CACHE_HIT_RATIO.set(_hit_ratio(RESPONSE_LOOKUPS, ('hit', 'shared_hit')), cache='response')
+    CACHE_HIT_RATIO.set(_hit_ratio(SEMANTIC_LOOKUPS, ('hit',)), cache='semantic')
@@ -0,0 +1,758 @@
+# iching_system/service/jobs.py
+"""
+背景工作佇列（A4 Agent 起卦）
+============================
+agent_divination_a4_1 先呼叫一次 Gemini 擷取背景，再對外三爻各呼叫兩次
+（資料收集、評分），每次間隔 _api_delay、失敗時重試可達一分鐘——不適合在
+web 請求內等待。改為背景工作：
+
+1. POST /api/jobs/a4 建立工作，立即回傳 job id（202）
+2. worker 取出工作執行 Agent 流程，逐步寫入事件：
+       status    {"status": "queued"|"running"|"succeeded"|"failed"|"cancelled"}
+       progress  {"step": "context"|"line"|"reading", "status", ...}
+                 例如 {"step": "line", "line": 4, "status": "scored", "score": 7}
+       scores    {"inner", "outer"}
+3. 客戶端輪詢 GET /api/jobs/{id}?after=N，或以 SSE 訂閱 GET /api/jobs/{id}/events
+4. 完成時 result 為完整解卦（與 /api/ask 相同結構）加上 agent 欄位（背景、分數）
+
+後端依 JOB_QUEUE_URL 選擇（提供相同的 async 方法即可替換）：
+- 未設定或 memory://     程序內佇列；worker 在 API 程序內以 asyncio task 執行
+                         （測試與單一程序；serve.py 多個 API worker 時不可使用，
+                         未設定 JOB_QUEUE_URL 會自動改用 SQLite）
+- sqlite:///path/jobs.db  SQLite（WAL），API 與 worker 程序共用；worker 以
+                         `python worker.py` 或 `serve.py --job-workers N` 啟動，
+                         API 程序不執行 Agent 工作
+
+worker 定期更新 heartbeat；worker 程序異常結束時，超過 JOB_STALE_SECONDS
+沒有 heartbeat 的工作重新排入佇列（最多執行 JOB_MAX_ATTEMPTS 次）
+"""
+
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import threading
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from ..core.dayan import score_to_yao
+from ..divination.a4_agent import aanalyze_outer
+from ..utils.metrics import REGISTRY
+from ..utils.serialization import dumps, loads
+from .admission import admitted_reading
+
+
+JOB_QUEUE_URL = os.getenv('JOB_QUEUE_URL', 'memory://')
+JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', '4'))
+JOB_MAX_QUEUED = int(os.getenv('JOB_MAX_QUEUED', '1000'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '0.5'))
+JOB_HEARTBEAT = float(os.getenv('JOB_HEARTBEAT', '10'))
+JOB_STALE_SECONDS = float(os.getenv('JOB_STALE_SECONDS', '300'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '2'))
+# 完成的工作保留秒數
+JOB_TTL = float(os.getenv('JOB_TTL', '86400'))
+
+FINISHED = ('succeeded', 'failed', 'cancelled')
+
+JOBS = REGISTRY.counter(
+    'jobs_total', '背景工作結束次數（status=succeeded|failed|cancelled|requeued）', ('kind', 'status'))
+JOB_DURATION = REGISTRY.histogram(
+    'job_duration_seconds', '背景工作執行時間（秒）', ('kind',),
+    buckets=(1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0))
+JOB_QUEUE_WAIT = REGISTRY.histogram(
+    'job_queue_wait_seconds', '背景工作開始執行前的排隊時間（秒）', ('kind',),
+    buckets=(0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+JOBS_RUNNING = REGISTRY.gauge('jobs_running', '本程序執行中的背景工作數')
+
+
+class JobQueueFull(Exception):
+    """排隊中的工作超過 JOB_MAX_QUEUED"""
+
+
+def _new_job(kind: str, params: Dict) -> Dict:
+    return {
+        'id': uuid.uuid4().hex,
+        'kind': kind,
+        'status': 'queued',
+        'params': params,
+        'result': None,
+        'error': None,
+        'attempts': 0,
+        'worker': None,
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+        'heartbeat_at': None,
+    }
+
+
+def public_job(job: Dict) -> Dict:
+    """回傳給客戶端的工作內容（不含 worker、heartbeat 等內部欄位）"""
+    return {name: job[name] for name in ('id', 'kind', 'status', 'params', 'result', 'error', 'attempts',
+                                         'created_at', 'started_at', 'finished_at')}
+
+
+# ============================================================================
+# 後端
+# ============================================================================
+
+class MemoryJobBackend:
+    """
+    程序內後端（單一 event loop 內使用）
+
+    工作與事件只存在本程序，worker 必須在同一程序內執行（in_process = True）
+    """
+
+    in_process = True
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict] = {}
+        self._events: Dict[str, List[Dict]] = {}
+        self._queue: 'deque[str]' = deque()
+        self._changed: Optional[asyncio.Event] = None
+
+    def _notify(self):
+        if self._changed is not None:
+            changed, self._changed = self._changed, None
+            changed.set()
+
+    def _record(self, job_id: str, event: Dict) -> int:
+        events = self._events[job_id]
+        seq = len(events) + 1
+        events.append({'seq': seq, **event})
+        self._notify()
+        return seq
+
+    def _set_status(self, job: Dict, status: str, **data):
+        job['status'] = status
+        self._record(job['id'], {'type': 'status', 'status': status, **data})
+
+    async def submit(self, kind: str, params: Dict) -> Dict:
+        job = _new_job(kind, params)
+        self._jobs[job['id']] = job
+        self._events[job['id']] = []
+        self._queue.append(job['id'])
+        self._set_status(job, 'queued')
+        return dict(job)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def events(self, job_id: str, after: int = 0) -> List[Dict]:
+        return list(self._events.get(job_id, ())[after:])
+
+    async def append_event(self, job_id: str, event: Dict) -> int:
+        return self._record(job_id, event)
+
+    async def claim(self, worker: str) -> Optional[Dict]:
+        while self._queue:
+            job = self._jobs.get(self._queue.popleft())
+            if job is None or job['status'] != 'queued':
+                continue
+            now = time.time()
+            job.update(worker=worker, started_at=now, heartbeat_at=now, attempts=job['attempts'] + 1)
+            self._set_status(job, 'running', attempt=job['attempts'])
+            return dict(job)
+        return None
+
+    async def heartbeat(self, job_ids: Iterable[str]) -> List[str]:
+        stopped = []
+        for job_id in job_ids:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] != 'running':
+                stopped.append(job_id)
+            else:
+                job['heartbeat_at'] = time.time()
+        return stopped
+
+    async def finish(self, job_id: str, status: str, result=None, error: Optional[str] = None):
+        job = self._jobs.get(job_id)
+        if job is None or job['status'] != 'running':
+            return
+        job.update(result=result, error=error, finished_at=time.time())
+        self._set_status(job, status, **({'error': error} if error else {}))
+
+    async def requeue(self, job_id: str, reason: str):
+        job = self._jobs.get(job_id)
+        if job is None or job['status'] != 'running':
+            return
+        job['attempts'] = max(0, job['attempts'] - 1)
+        self._queue.appendleft(job_id)
+        self._set_status(job, 'queued', reason=reason)
+
+    async def cancel(self, job_id: str) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job['status'] not in FINISHED:
+            job['finished_at'] = time.time()
+            self._set_status(job, 'cancelled')
+        return dict(job)
+
+    async def queued(self) -> int:
+        return sum(1 for job in self._jobs.values() if job['status'] == 'queued')
+
+    async def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job['status']] = counts.get(job['status'], 0) + 1
+        return counts
+
+    async def purge(self, before: float) -> int:
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['status'] in FINISHED and job['finished_at'] < before]
+        for job_id in expired:
+            del self._jobs[job_id]
+            del self._events[job_id]
+        return len(expired)
+
+    async def wait(self, timeout: float):
+        """等到有工作或事件變動（最多 timeout 秒）"""
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class SQLiteJobBackend:
+    """
+    SQLite 後端（WAL 模式），同一台機器上的 API 與 worker 程序共用
+
+    阻塞的資料庫操作在執行緒池執行，不佔用 event loop；
+    沒有跨程序通知，訂閱與 worker 以 poll_interval 輪詢
+
+    Args:
+        path: 資料庫檔案路徑
+        poll_interval: 輪詢間隔（秒）
+        stale_seconds: 超過此秒數沒有 heartbeat 的執行中工作視為 worker 已結束
+        max_attempts: 每個工作最多執行次數
+    """
+
+    in_process = False
+
+    def __init__(self, path: str, poll_interval: float = JOB_POLL_INTERVAL,
+                 stale_seconds: float = JOB_STALE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # fork 後的子程序不沿用父程序的連線
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    async def _call(self, fn, *args):
+        return await asyncio.to_thread(fn, *args)
+
+    @staticmethod
+    def _job(row) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = loads(job['params'])
+        job['result'] = loads(job['result']) if job['result'] is not None else None
+        return job
+
+    @staticmethod
+    def _record(conn, job_id: str, event: Dict) -> int:
+        cursor = conn.execute(
+            'INSERT INTO job_events (job_id, seq, data, created_at) '
+            'SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM job_events WHERE job_id = ?',
+            (job_id, dumps(event).decode('utf-8'), time.time(), job_id))
+        return conn.execute('SELECT seq FROM job_events WHERE rowid = ?', (cursor.lastrowid,)).fetchone()[0]
+
+    def _set_status(self, conn, job_id: str, status: str, **data):
+        conn.execute('UPDATE jobs SET status = ? WHERE id = ?', (status, job_id))
+        self._record(conn, job_id, {'type': 'status', 'status': status, **data})
+
+    # --- 同步實作 ---
+    def _submit(self, kind: str, params: Dict) -> Dict:
+        job = _new_job(kind, params)
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, kind, status, params, created_at) VALUES (?, ?, ?, ?, ?)',
+                (job['id'], kind, 'queued', dumps(params).decode('utf-8'), job['created_at']))
+            self._record(conn, job['id'], {'type': 'status', 'status': 'queued'})
+        return job
+
+    def _get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._job(row)
+
+    def _events(self, job_id: str, after: int) -> List[Dict]:
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq',
+                (job_id, after)).fetchall()
+        return [{'seq': row['seq'], **loads(row['data'])} for row in rows]
+
+    def _append_event(self, job_id: str, event: Dict) -> int:
+        with self._transaction() as conn:
+            return self._record(conn, job_id, event)
+
+    def _recover_stale(self, conn, now: float):
+        """worker 沒有 heartbeat 的工作重新排隊，超過執行次數上限則標記失敗"""
+        rows = conn.execute(
+            "SELECT id, attempts FROM jobs WHERE status = 'running' AND heartbeat_at < ?",
+            (now - self.stale_seconds,)).fetchall()
+        for row in rows:
+            if row['attempts'] >= self.max_attempts:
+                error = "worker 無回應，已達執行次數上限"
+                conn.execute('UPDATE jobs SET error = ?, finished_at = ? WHERE id = ?', (error, now, row['id']))
+                self._set_status(conn, row['id'], 'failed', error=error)
+            else:
+                self._set_status(conn, row['id'], 'queued', reason='stale')
+
+    def _claim(self, worker: str) -> Optional[Dict]:
+        now = time.time()
+        with self._transaction() as conn:
+            self._recover_stale(conn, now)
+            row = conn.execute(
+                "SELECT id, attempts FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                'UPDATE jobs SET worker = ?, started_at = ?, heartbeat_at = ?, attempts = attempts + 1 '
+                'WHERE id = ?', (worker, now, now, row['id']))
+            self._set_status(conn, row['id'], 'running', attempt=row['attempts'] + 1)
+            return self._job(conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone())
+
+    def _heartbeat(self, job_ids: List[str]) -> List[str]:
+        if not job_ids:
+            return []
+        with self._transaction() as conn:
+            marks = ','.join('?' * len(job_ids))
+            conn.execute(f"UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND id IN ({marks})",
+                         (time.time(), *job_ids))
+            running = {row['id'] for row in conn.execute(
+                f"SELECT id FROM jobs WHERE status = 'running' AND id IN ({marks})", job_ids)}
+        return [job_id for job_id in job_ids if job_id not in running]
+
+    def _finish(self, job_id: str, status: str, result, error: Optional[str]):
+        with self._transaction() as conn:
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None or row['status'] != 'running':
+                return
+            conn.execute('UPDATE jobs SET result = ?, error = ?, finished_at = ? WHERE id = ?',
+                         (dumps(result).decode('utf-8') if result is not None else None,
+                          error, time.time(), job_id))
+            self._set_status(conn, job_id, status, **({'error': error} if error else {}))
+
+    def _requeue(self, job_id: str, reason: str):
+        with self._transaction() as conn:
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is not None and row['status'] == 'running':
+                conn.execute('UPDATE jobs SET attempts = MAX(attempts - 1, 0) WHERE id = ?', (job_id,))
+                self._set_status(conn, job_id, 'queued', reason=reason)
+
+    def _cancel(self, job_id: str) -> Optional[Dict]:
+        with self._transaction() as conn:
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row['status'] not in FINISHED:
+                conn.execute('UPDATE jobs SET finished_at = ? WHERE id = ?', (time.time(), job_id))
+                self._set_status(conn, job_id, 'cancelled')
+            return self._job(conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+    def _counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connect().execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def _purge(self, before: float) -> int:
+        marks = ','.join('?' * len(FINISHED))
+        with self._transaction() as conn:
+            ids = [row['id'] for row in conn.execute(
+                f'SELECT id FROM jobs WHERE status IN ({marks}) AND finished_at < ?', (*FINISHED, before))]
+            for job_id in ids:
+                conn.execute('DELETE FROM job_events WHERE job_id = ?', (job_id,))
+                conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+        return len(ids)
+
+    # --- async 介面 ---
+    async def submit(self, kind: str, params: Dict) -> Dict:
+        return await self._call(self._submit, kind, params)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await self._call(self._get, job_id)
+
+    async def events(self, job_id: str, after: int = 0) -> List[Dict]:
+        return await self._call(self._events, job_id, after)
+
+    async def append_event(self, job_id: str, event: Dict) -> int:
+        return await self._call(self._append_event, job_id, event)
+
+    async def claim(self, worker: str) -> Optional[Dict]:
+        return await self._call(self._claim, worker)
+
+    async def heartbeat(self, job_ids: Iterable[str]) -> List[str]:
+        return await self._call(self._heartbeat, list(job_ids))
+
+    async def finish(self, job_id: str, status: str, result=None, error: Optional[str] = None):
+        await self._call(self._finish, job_id, status, result, error)
+
+    async def requeue(self, job_id: str, reason: str):
+        await self._call(self._requeue, job_id, reason)
+
+    async def cancel(self, job_id: str) -> Optional[Dict]:
+        return await self._call(self._cancel, job_id)
+
+    async def queued(self) -> int:
+        return (await self.counts()).get('queued', 0)
+
+    async def counts(self) -> Dict[str, int]:
+        return await self._call(self._counts)
+
+    async def purge(self, before: float) -> int:
+        return await self._call(self._purge, before)
+
+    async def wait(self, timeout: float):
+        await asyncio.sleep(min(timeout, self.poll_interval))
+
+
+def backend_from_url(url: str):
+    """memory:// 或 sqlite:///path/jobs.db"""
+    if not url or url.startswith('memory:'):
+        return MemoryJobBackend()
+    if url.startswith('sqlite://'):
+        path = url[len('sqlite://'):]
+        # sqlite:///tmp/jobs.db → /tmp/jobs.db；sqlite://jobs.db → 相對路徑
+        return SQLiteJobBackend(path[1:] if path.startswith('//') else path)
+    raise ValueError(f"不支援的 JOB_QUEUE_URL：{url}（可用 memory:// 或 sqlite:///path）")
+
+
+# ============================================================================
+# 工作種類
+# ============================================================================
+
+class JobContext:
+    """執行中的工作：回報事件，取得解卦元件"""
+
+    def __init__(self, job: Dict, backend, generator, adapter=None):
+        self.job = job
+        self.backend = backend
+        self.generator = generator
+        self.adapter = adapter
+
+    async def emit(self, event_type: str, **data):
+        await self.backend.append_event(self.job['id'], {'type': event_type, **data})
+
+
+def validate_a4_params(params: Dict) -> Dict:
+    """檢查 A4 工作參數，錯誤時拋出 ValueError"""
+    question = (params.get('question') or '').strip()
+    if not question:
+        raise ValueError("請輸入問題")
+    inner = params.get('inner_scores')
+    if inner is None:
+        inner = [5, 5, 5]
+    if (not isinstance(inner, list) or len(inner) != 3
+            or any(not isinstance(v, int) or isinstance(v, bool) or not 0 <= v <= 10 for v in inner)):
+        raise ValueError("inner_scores 需要 3 個 0-10 的整數")
+    description = (params.get('description') or '').strip() or None
+    return {'question': question, 'description': description, 'inner_scores': inner,
+            'adapt': bool(params.get('adapt', True))}
+
+
+async def run_a4(params: Dict, ctx: JobContext) -> Dict:
+    """A4-1：外三爻 AI 分析 → 起卦 → 解卦（與 agent_divination_a4_1 相同的流程，非互動）"""
+    question = params['question']
+    inner = params['inner_scores']
+
+    async def progress(step, **data):
+        await ctx.emit('progress', step=step, **data)
+
+    context, outer = await aanalyze_outer(question, params.get('description'), progress)
+    await ctx.emit('scores', inner=inner, outer=outer)
+
+    scores = inner + outer
+    yao_values = [score_to_yao(s) for s in scores]
+    await ctx.emit('progress', step='reading', status='running')
+    adapter = ctx.adapter if params.get('adapt', True) else None
+    # 與 /api/ask 相同經過准入控制；未取得 LLM 名額時回傳不微調的解卦
+    payload = await admitted_reading(question, ctx.generator, adapter, yao_values)
+    payload['reading']['meta'].update({'mode': 'A4', 'agent_context': context})
+    payload['agent'] = {
+        'method': 'A4-1',
+        'description': params.get('description') or question,
+        'context': context,
+        'inner_scores': inner,
+        'outer_scores': outer,
+        'scores': scores,
+    }
+    return payload
+
+
+# 工作種類 -> (參數檢查, 執行)
+JOB_KINDS: Dict[str, tuple] = {
+    'a4': (validate_a4_params, run_a4),
+}
+
+
+# ============================================================================
+# 佇列與 worker
+# ============================================================================
+
+class JobQueue:
+    """
+    建立、查詢、訂閱背景工作
+
+    Args:
+        backend: MemoryJobBackend / SQLiteJobBackend 或相同介面的後端
+        max_queued: 排隊上限（超過時 submit 拋出 JobQueueFull）
+    """
+
+    def __init__(self, backend, max_queued: int = JOB_MAX_QUEUED):
+        self.backend = backend
+        self.max_queued = max_queued
+
+    @property
+    def in_process(self) -> bool:
+        return getattr(self.backend, 'in_process', False)
+
+    async def submit(self, kind: str, params: Dict) -> Dict:
+        """
+        建立工作
+
+        Raises:
+            ValueError: 未知的工作種類或參數錯誤
+            JobQueueFull: 排隊中的工作過多
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"未知的工作種類: {kind}，可用種類: {list(JOB_KINDS)}")
+        validate, _ = JOB_KINDS[kind]
+        params = validate(params)
+        if await self.backend.queued() >= self.max_queued:
+            raise JobQueueFull(f"排隊中的工作已達上限 {self.max_queued}")
+        return await self.backend.submit(kind, params)
+
+    async def get(self, job_id: str, after: Optional[int] = 0) -> Optional[Dict]:
+        """工作內容與 seq 大於 after 的事件（輪詢用；after 為 None 時不含事件）"""
+        job = await self.backend.get(job_id)
+        if job is None:
+            return None
+        data = public_job(job)
+        if after is not None:
+            data['events'] = await self.backend.events(job_id, after)
+        return data
+
+    async def subscribe(self, job_id: str, after: int = 0) -> AsyncIterator[Dict]:
+        """依序產生 seq 大於 after 的事件，直到工作結束"""
+        while True:
+            # 先取狀態再讀事件：狀態已結束時，最後的事件一定已寫入
+            job = await self.backend.get(job_id)
+            if job is None:
+                return
+            for event in await self.backend.events(job_id, after):
+                after = event['seq']
+                yield event
+            if job['status'] in FINISHED:
+                return
+            await self.backend.wait(JOB_POLL_INTERVAL)
+
+    async def cancel(self, job_id: str) -> Optional[Dict]:
+        job = await self.backend.cancel(job_id)
+        return public_job(job) if job is not None else None
+
+    async def stats(self) -> Dict:
+        return {'backend': type(self.backend).__name__, 'counts': await self.backend.counts(),
+                'max_queued': self.max_queued}
+
+
+class JobWorker:
+    """
+    取出並執行背景工作
+
+    Agent 流程以 asyncio 等待 LLM，一個 worker 程序同時執行 concurrency 個工作
+
+    Args:
+        queue: JobQueue
+        get_generator: 取得 YiliGenerator 的函式
+        get_adapter: 取得 LLM 微調適配器的函式（可回傳 None）
+        concurrency: 同時執行的工作數
+        name: worker 名稱（寫入工作的 worker 欄位）
+    """
+
+    def __init__(self, queue: JobQueue, get_generator: Callable, get_adapter: Callable = lambda: None,
+                 concurrency: int = JOB_WORKER_CONCURRENCY, name: Optional[str] = None):
+        self.queue = queue
+        self.backend = queue.backend
+        self.get_generator = get_generator
+        self.get_adapter = get_adapter
+        self.concurrency = concurrency
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled = set()
+
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        """持續取出工作直到 stop 被設定（或被取消）；結束時未完成的工作重新排隊"""
+        stop = stop or asyncio.Event()
+        # 載入 JSON、匯入 SDK 不佔用 event loop
+        generator = await asyncio.to_thread(self.get_generator)
+        adapter = await asyncio.to_thread(self.get_adapter)
+        slots = asyncio.Semaphore(self.concurrency)
+        maintenance = asyncio.create_task(self._maintain(stop))
+        try:
+            while not stop.is_set():
+                if not await self._acquire(slots, stop):
+                    break
+                try:
+                    job = await self.backend.claim(self.name)
+                except Exception as e:
+                    print(f"取出背景工作失敗：{e}")
+                    job = None
+                if job is None:
+                    slots.release()
+                    await self.backend.wait(JOB_POLL_INTERVAL)
+                    continue
+                task = asyncio.create_task(self._execute(job, generator, adapter))
+                self._running[job['id']] = task
+
+                def done(task, job_id=job['id']):
+                    self._running.pop(job_id, None)
+                    slots.release()
+
+                task.add_done_callback(done)
+        finally:
+            maintenance.cancel()
+            running = list(self._running.values())
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    @staticmethod
+    async def _acquire(slots: asyncio.Semaphore, stop: asyncio.Event) -> bool:
+        """等待執行名額；名額都被佔用時 stop 仍可中斷等待（回傳 False）"""
+        acquire = asyncio.ensure_future(slots.acquire())
+        stopped = asyncio.ensure_future(stop.wait())
+        try:
+            await asyncio.wait((acquire, stopped), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stopped.cancel()
+            if not acquire.done():
+                acquire.cancel()
+        if acquire.done() and not acquire.cancelled():
+            if not stop.is_set():
+                return True
+            slots.release()
+        return False
+
+    async def _execute(self, job: Dict, generator, adapter):
+        job_id, kind = job['id'], job['kind']
+        JOB_QUEUE_WAIT.observe(max(0.0, job['started_at'] - job['created_at']), kind=kind)
+        JOBS_RUNNING.inc()
+        start = time.perf_counter()
+        try:
+            _, run = JOB_KINDS[kind]
+            result = await run(job['params'], JobContext(job, self.backend, generator, adapter))
+            await self.backend.finish(job_id, 'succeeded', result=result)
+            JOBS.inc(kind=kind, status='succeeded')
+        except asyncio.CancelledError:
+            if job_id in self._cancelled:
+                # 客戶端取消：狀態已是 cancelled
+                self._cancelled.discard(job_id)
+                JOBS.inc(kind=kind, status='cancelled')
+            else:
+                # worker 正常結束：交給其他 worker（不計入執行次數）
+                await asyncio.shield(self.backend.requeue(job_id, 'worker_shutdown'))
+                JOBS.inc(kind=kind, status='requeued')
+            raise
+        except Exception as e:
+            print(f"Job Error ({kind} {job_id}): {traceback.format_exc()}")
+            await self.backend.finish(job_id, 'failed', error=str(e))
+            JOBS.inc(kind=kind, status='failed')
+        finally:
+            JOB_DURATION.observe(time.perf_counter() - start, kind=kind)
+            JOBS_RUNNING.dec()
+
+    async def _maintain(self, stop: asyncio.Event):
+        """heartbeat、停止被取消的工作、清除過期的工作"""
+        last_purge = 0.0
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), JOB_HEARTBEAT)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                for job_id in await self.backend.heartbeat(list(self._running)):
+                    task = self._running.get(job_id)
+                    if task is not None:
+                        self._cancelled.add(job_id)
+                        task.cancel()
+                if time.time() - last_purge > 3600:
+                    last_purge = time.time()
+                    await self.backend.purge(last_purge - JOB_TTL)
+            except Exception as e:
+                print(f"背景工作維護失敗：{e}")
+
+
+_job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """程序共用的工作佇列（依 JOB_QUEUE_URL 選擇後端）"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(backend_from_url(JOB_QUEUE_URL))
+    return _job_queue
@@ -0,0 +1,240 @@
+# iching_system/service/progressive.py
+"""
+漸進式解卦（server-sent events）
+================================
+完整解卦要等 s1, s2, s6 的 LLM 微調完成（數秒），
+但 s3 過程、s4 階段、s5 建議只由六爻決定，查表即可（不到 1 ms）：
+
+1. reading   起卦結果與卦象（question, yao_values, hexagram, waveform, meta, order）
+2. section   s3_process, s4_stages, s5_advice 立即送出
+3. delta     s1_status, s2_trend, s6_outlook 的微調文字增量（三段並行，交錯送出）
+4. section   各段微調完成時送出完整段落（先完成先送）
+5. done      {'adapted': [...], 'cached': bool, 'degraded': bool}
+
+微調前先經過准入控制（admission.py）；未取得 LLM 名額時 s1, s2, s6 直接送出
+不微調的版本，done 帶 degraded: true 與 reason。
+微調在 single-flight 中執行（singleflight.py）：同一問題同時有多個串流或
+/api/ask 請求時只微調一次，後到的串流先重播已送出的 delta / section 再接續，
+done 帶 coalesced: true
+
+段落 id 與 YiliGenerator 相同，客戶端可用同一套渲染邏輯；
+沒有 LLM 微調時 s1, s2, s6 直接送出中性版或預生成版本。
+三段都微調成功時整份回應存入回應快取（與 /api/ask 相同的快取鍵），
+之後同一問題直接由快取送出全部段落。
+A3 / A4 的 WebSocket session（session.py）以指定六爻使用同一流程
+"""
+
+import time
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from ..core.calculator import compute_b_stage
+from ..divination.a3_questionnaire import classify_question
+from ..utils.serialization import loads
+from .reading import cast_for_question, reading_payload, render_reading
+from .response_cache import get_response_cache, make_etag
+from .admission import get_admission, mark_degraded, ClientRateLimited
+from .instrumentation import stage, observe_stage
+
+
+# 立即送出的段落（只由六爻決定）
+IMMEDIATE_SECTIONS = ('s3_process', 's4_stages', 's5_advice')
+
+
+def _reading_event(payload: Dict) -> Dict:
+    reading = payload['reading']
+    return {
+        'question': payload['question'],
+        'yao_values': payload['yao_values'],
+        'hexagram': payload['hexagram'],
+        'waveform': payload['waveform'],
+        'meta': reading['meta'],
+        'order': list(reading['sections'])
+    }
+
+
+def _section_event(payload: Dict, section_id: str) -> Dict:
+    return {'id': section_id, 'section': payload['reading']['sections'][section_id]}
+
+
+async def _adapt_section(adapter, content: str, question: str, section_id: str,
+                         queue: asyncio.Queue) -> str:
+    """微調單一段落；支援串流的 adapter 逐段放入 delta，回傳完整文字（失敗時回傳原文）"""
+    try:
+        # 以段落 id 作為名稱，與 /api/ask 的批次微調共用語意快取
+        if hasattr(adapter, 'aadapt_stream'):
+            parts = []
+            async for text in adapter.aadapt_stream(content, question, section_id):
+                parts.append(text)
+                await queue.put(('delta', {'id': section_id, 'text': text}))
+            return ''.join(parts) or content
+        if hasattr(adapter, 'aadapt'):
+            return await adapter.aadapt(content, question, section_id)
+        return await asyncio.to_thread(adapter.adapt, content, question, section_id)
+    except Exception as e:
+        print(f"漸進式解卦微調失敗（{section_id}）：{e}")
+        return content
+
+
+async def progressive_reading(question: str, generator, adapter=None,
+                              key: Optional[str] = None,
+                              yao_values: Optional[List[int]] = None,
+                              meta: Optional[Dict] = None,
+                              client_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    依序產生 (event, data)
+
+    Args:
+        question: 用戶問題
+        generator: YiliGenerator
+        adapter: LLM 微調適配器（None 則全部段落立即送出）
+        key: 回應快取鍵（None 不查詢也不存入）
+        yao_values: 指定六爻（A3 / A4 由分數換算）；None 則以問題為種子起卦
+        meta: 併入 reading['meta'] 的額外欄位（例如 mode、questionnaire）
+        client_id: 准入控制的客戶端識別
+    """
+    cache = get_response_cache()
+    if key is not None:
+        entry = await cache.get(key, route='/api/ask/stream')
+        if entry is not None:
+            payload = loads(entry[1])
+            yield 'reading', _reading_event(payload)
+            for section_id in payload['reading']['sections']:
+                yield 'section', _section_event(payload, section_id)
+            yield 'done', {'adapted': payload['reading']['meta'].get('adapted', []),
+                           'cached': True, 'degraded': False}
+            return
+
+    if yao_values is None:
+        with stage('cast'):
+            yao_values = cast_for_question(question)
+    with stage('compute_b_stage'):
+        hexagrams = compute_b_stage(yao_values)
+    with stage('generate'):
+        reading = generator.generate(yao_values, question, category=classify_question(question))
+    if meta:
+        reading['meta'].update(meta)
+    payload = reading_payload(question, yao_values, hexagrams, reading)
+    key_sections = [section_id for section_id, _ in generator.KEY_SECTIONS]
+
+    yield 'reading', _reading_event(payload)
+    for section_id in IMMEDIATE_SECTIONS:
+        yield 'section', _section_event(payload, section_id)
+
+    if adapter is None:
+        for section_id in key_sections:
+            yield 'section', _section_event(payload, section_id)
+        if key is not None:
+            await cache.put(key, payload, render_reading)
+        yield 'done', {'adapted': [], 'cached': False, 'degraded': False}
+        return
+
+    if cache.flights.get(key) is None:
+        # 會開始新計算的請求才扣客戶端額度；超過時直接降級，不開始共用的計算
+        try:
+            get_admission().check_client(client_id)
+        except ClientRateLimited:
+            for section_id in key_sections:
+                yield 'section', _section_event(payload, section_id)
+            yield 'done', {'adapted': [], 'cached': False, 'degraded': True, 'reason': 'rate_limited'}
+            return
+
+    flight, leader = cache.flights.run(
+        key, lambda flight: _adapt_flight(flight, payload, adapter, question, key_sections, key),
+        route='/api/ask/stream'
+    )
+    sent = set()
+    try:
+        async for event, data in flight.replay():
+            if event == 'section':
+                sent.add(data['id'])
+            yield event, data
+        _, result, _ = await flight.wait()
+    finally:
+        if key is None and not flight.future.done():
+            # 不共用的計算（A3 / A4 session）在客戶端斷線時取消
+            flight.task.cancel()
+
+    # 合併到 /api/ask 的計算時沒有過程事件，完成後一次送出
+    for section_id in key_sections:
+        if section_id not in sent:
+            yield 'section', _section_event(result, section_id)
+    done = {
+        'adapted': result['reading']['meta'].get('adapted', []),
+        'cached': False,
+        'degraded': bool(result.get('degraded')),
+        'coalesced': not leader
+    }
+    if result.get('degraded'):
+        done['reason'] = result.get('degraded_reason')
+    yield 'done', done
+
+
+async def _adapt_flight(flight, payload: Dict, adapter, question: str,
+                        key_sections: List[str], key: Optional[str]):
+    """
+    single-flight 的計算：取得 LLM 名額後微調，發布 delta / section
+
+    Returns:
+        ((etag, body), payload, stored)，與 ResponseCache.get_or_compute 的計算結果相同
+    """
+    async with get_admission().admit() as admission:
+        if admission.admitted:
+            events = _adapt_key_sections(payload, adapter, question, key_sections)
+            try:
+                async for event in events:
+                    flight.publish(event)
+            finally:
+                await events.aclose()
+
+    if not admission.admitted:
+        # 未取得 LLM 名額：送出不微調的版本
+        mark_degraded(payload, admission.reason)
+        for section_id in key_sections:
+            flight.publish(('section', _section_event(payload, section_id)))
+
+    # 微調失敗（回傳原文）或降級的結果不快取，下次重試
+    adapted = payload['reading']['meta'].get('adapted', [])
+    if key is not None and len(adapted) == len(key_sections):
+        return await get_response_cache().put(key, payload, render_reading), payload, True
+    body = render_reading(payload)
+    return (make_etag(body), body), payload, False
+
+
+async def _adapt_key_sections(payload: Dict, adapter, question: str,
+                              key_sections: List[str]) -> AsyncIterator[Tuple[str, Dict]]:
+    """並行微調 s1, s2, s6：依完成順序產生 delta / section，完成後更新 meta['adapted']"""
+    reading = payload['reading']
+    sections = reading['sections']
+    originals = {section_id: sections[section_id]['content'] for section_id in key_sections}
+    queue: asyncio.Queue = asyncio.Queue()
+    # llm_adapt 只計算微調本身（開始到最後一段完成），不含呼叫端處理 yield 的時間
+    started = time.perf_counter()
+    finished = []
+
+    async def run(section_id):
+        content = await _adapt_section(adapter, originals[section_id], question, section_id, queue)
+        finished.append(time.perf_counter())
+        await queue.put(('done', (section_id, content)))
+
+    tasks = [asyncio.create_task(run(section_id)) for section_id in key_sections]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event, data = await queue.get()
+            if event == 'delta':
+                yield event, data
+                continue
+            section_id, content = data
+            sections[section_id]['content'] = content
+            remaining -= 1
+            yield 'section', _section_event(payload, section_id)
+        if finished:
+            observe_stage('llm_adapt', max(finished) - started)
+    finally:
+        # 客戶端中途斷線時取消尚未完成的微調
+        for task in tasks:
+            task.cancel()
+
+    payload['interpretation']['text'] = sections['s1_status']['content']
+    reading['meta']['adapted'] = sorted(k for k in key_sections if sections[k]['content'] != originals[k])
@@ -0,0 +1,129 @@
+# iching_system/service/reading.py
+"""
+API 解卦流程
+============
+問題 → SHA-256 種子 → 六爻 → compute_b_stage → YiliGenerator 六點解卦
+
+同一個問題永遠得到同一卦（種子由問題決定），起卦方式與最初的 /api/ask 相同：
+hexagram.code 與 hexagram.changing 不因改為完整解卦而改變；
+s1, s2, s6 的 LLM 微調以 await 等待（YiliGenerator.aadapt_key_sections），
+單一程序可同時處理大量等待 LLM 的請求，不會耗盡執行緒池
+"""
+
+import random
+import hashlib
+from typing import Dict, List, Optional
+
+from ..core.calculator import compute_b_stage
+from ..divination.a3_questionnaire import classify_question
+from ..utils.serialization import dumps
+from .instrumentation import stage
+
+
+def question_seed(question: str) -> int:
+    """問題的 SHA-256 種子"""
+    return int(hashlib.sha256(question.encode()).hexdigest(), 16)
+
+
+def cast_for_question(question: str) -> List[int]:
+    """
+    以問題為種子起卦（同一問題結果固定）
+
+    沿用最初 /api/ask 的算法：種子初始化 random 後取六個 0/1 為本卦（初爻在左），
+    種子 % 7 為動爻位置（6 表示無動爻）；換算為 6/7/8/9 六爻，
+    本卦卦碼與動爻和原本的 hexagram.code / hexagram.changing 相同
+    """
+    seed = question_seed(question)
+    rng = random.Random(seed)
+    bits = [rng.randint(0, 1) for _ in range(6)]
+    changing = seed % 7
+    return [(9 if bit else 6) if i == changing else (7 if bit else 8) for i, bit in enumerate(bits)]
+
+
+def _waveform(hex_code: str) -> Dict:
+    return {
+        "amplitude": 0.5 + (int(hex_code, 2) / 64.0),
+        "frequency": 1.2
+    }
+
+
+def validate_yao_values(yao_values: List[int]):
+    """檢查六爻格式，錯誤時拋出 ValueError"""
+    if len(yao_values) != 6 or any(v not in (6, 7, 8, 9) for v in yao_values):
+        raise ValueError("yao_values 必須是 6 個 6/7/8/9 的值")
+
+
+async def build_reading(question: Optional[str], generator, adapter=None,
+                        yao_values: Optional[List[int]] = None,
+                        hexagrams: Optional[Dict] = None) -> Dict:
+    """
+    完整解卦回應
+    
+    Args:
+        question: 用戶問題（None 時必須指定 yao_values，回傳 A1 中性版）
+        generator: YiliGenerator
+        adapter: LLM 微調適配器（None 則回傳中性版或預生成版）
+        yao_values: 指定六爻（None 則以問題起卦）
+        hexagrams: 已算好的 compute_b_stage 結果（批次共用）
+    
+    Returns:
+        {
+            'question': ...,
+            'yao_values': [...],
+            'hexagram': {'code', 'name', 'changing', 'moving_lines'},
+            'waveform': {...},
+            'interpretation': {'text': s1 現況},
+            'reading': {'meta': ..., 'sections': ...}   # YiliGenerator 六點解卦
+        }
+    """
+    if yao_values is None:
+        if question is None:
+            raise ValueError("需要 question 或 yao_values")
+        with stage('cast'):
+            yao_values = cast_for_question(question)
+    
+    if hexagrams is None:
+        with stage('compute_b_stage'):
+            hexagrams = compute_b_stage(yao_values)
+    
+    with stage('generate'):
+        category = classify_question(question) if question is not None else None
+        reading = generator.generate(yao_values, question, category=category)
+    if question is not None and adapter is not None:
+        with stage('llm_adapt'):
+            await generator.aadapt_key_sections(reading, question, adapter)
+    
+    return reading_payload(question, yao_values, hexagrams, reading)
+
+
+def reading_payload(question: Optional[str], yao_values: List[int], hexagrams: Dict, reading: Dict) -> Dict:
+    """組成 build_reading 的回應結構（串流解卦共用）"""
+    hex_now = hexagrams['本卦']
+    moving = hexagrams['動爻']
+    return {
+        "question": question,
+        "yao_values": yao_values,
+        "hexagram": {
+            "code": hex_now['code'],
+            "name": hex_now.get('name', f"Unknown-{hex_now['code']}"),
+            # 舊欄位：動爻位置 0-5（無動爻為 None）；以問題起卦時最多一個動爻
+            "changing": moving[0] if moving else None,
+            "moving_lines": moving
+        },
+        "waveform": _waveform(hex_now['code']),
+        "interpretation": {
+            "text": reading['sections']['s1_status']['content']
+        },
+        "reading": reading
+    }
+
+
+def render_reading(payload: Dict) -> bytes:
+    """
+    序列化 build_reading 的回應（緊湊 UTF-8 JSON，orjson / msgspec 若已安裝）
+    
+    只由六爻決定的內容以整份回應為單位快取（response_cache），
+    不另外拼接段落片段：實測拼接比 orjson 整份序列化慢
+    """
+    with stage('render'):
+        return dumps(payload)
@@ -0,0 +1,225 @@
+# iching_system/service/response_cache.py
+"""
+回應快取（ETag / 條件式 GET）
+============================
+解卦結果是確定的：同一問題的種子固定，A1 只由六爻決定。
+回應序列化一次後以內容雜湊作為 ETag，連同位元組一起快取：
+
+- 程序內：有上限的 LRU（RESPONSE_CACHE_SIZE，預設 2048 筆）
+- 共用後端（可選）：RESPONSE_CACHE_URL=redis://... 時多個實例共用，
+  需要安裝 redis 套件（redis.asyncio）；未安裝或連線失敗時只用程序內快取
+
+重複的問題直接回傳快取的位元組；客戶端 / CDN 帶 If-None-Match 重新驗證時
+回 304，不需要重新計算或序列化。
+快取未命中時以 single-flight 合併相同鍵的進行中計算（singleflight.py）：
+同時湧入的相同請求只計算一次、只呼叫一次 LLM
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from ..utils.metrics import REGISTRY
+from ..utils.serialization import dumps
+from .instrumentation import stage
+from .singleflight import SingleFlight
+
+
+# 快取內容格式版本：回應結構或資料檔改變時調整，使舊的共用快取失效
+CACHE_VERSION = '2'
+
+DEFAULT_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_SIZE', '2048'))
+DEFAULT_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '86400'))
+
+CACHE_LOOKUPS = REGISTRY.counter(
+    'api_response_cache_total', '回應快取查詢次數（result=hit|shared_hit|miss|coalesced）', ('route', 'result'))
+
+
+def cache_key(*parts) -> str:
+    """由請求的正規化參數組成快取鍵"""
+    raw = json.dumps([CACHE_VERSION, *parts], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def make_etag(body: bytes) -> str:
+    """內容雜湊 ETag（強驗證）"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否符合（支援 *、多個值與弱驗證前綴 W/）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def serialize(data) -> bytes:
+    with stage('render'):
+        return dumps(data)
+
+
+class RedisBackend:
+    """redis.asyncio 共用後端；值為 etag + 換行 + 回應位元組"""
+
+    def __init__(self, url: str, ttl: int = DEFAULT_TTL, prefix: str = 'yili:resp:'):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        value = await self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        etag, _, body = value.partition(b'\n')
+        return etag.decode(), body
+
+    async def set(self, key: str, etag: str, body: bytes):
+        await self.client.set(self.prefix + key, etag.encode() + b'\n' + body, ex=self.ttl)
+
+
+class ResponseCache:
+    """
+    已序列化回應的 LRU 快取（可加共用後端）
+
+    Args:
+        max_entries: 程序內最多保留幾筆
+        backend: 共用後端（需有 async get / set），None 表示只用程序內快取
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, backend=None):
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries: 'OrderedDict[str, Tuple[str, bytes]]' = OrderedDict()
+        self._lock = threading.Lock()
+        # 進行中的計算（結果為 ((etag, body), data, stored)）
+        self.flights = SingleFlight()
+
+    def _get_local(self, key: str) -> Optional[Tuple[str, bytes]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _put_local(self, key: str, entry: Tuple[str, bytes]):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Dict]],
+                             route: str = '',
+                             cacheable: Optional[Callable[[Dict], bool]] = None,
+                             serializer: Callable[[Dict], bytes] = serialize) -> Tuple[str, bytes, bool]:
+        """
+        取得 (etag, 回應位元組, stored)；未命中時 await compute() 並序列化後存入
+
+        stored 為 False 表示結果未存入快取（cacheable 判斷為否），
+        呼叫端不應讓 CDN / 瀏覽器快取這份回應；合併到進行中計算的請求得到同一個值
+
+        Args:
+            cacheable: 判斷結果是否可存入（例如 LLM 微調失敗的降級結果不存）
+            serializer: 序列化函式（解卦回應用 reading.render_reading）
+
+        同一個鍵已在計算中時等待同一個結果，不重複呼叫 compute；
+        共用後端錯誤只印出訊息，不影響回應
+        """
+        entry = await self.get(key, route)
+        if entry is not None:
+            return (*entry, True)
+
+        flight, leader = self.flights.run(
+            key, lambda flight: self._compute(key, compute, cacheable, serializer), route=route
+        )
+        CACHE_LOOKUPS.inc(route=route, result='miss' if leader else 'coalesced')
+        entry, _, stored = await flight.wait()
+        return (*entry, stored)
+
+    async def _compute(self, key, compute, cacheable, serializer):
+        data = await compute()
+        if cacheable is not None and not cacheable(data):
+            body = serializer(data)
+            return (make_etag(body), body), data, False
+        return await self.put(key, data, serializer), data, True
+
+    def is_cached_or_pending(self, key: str) -> bool:
+        """程序內已快取或正在計算（不查詢共用後端，不計入查詢次數）"""
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.flights.get(key) is not None
+
+    async def get(self, key: str, route: str = '') -> Optional[Tuple[str, bytes]]:
+        """只查詢不計算：程序內 → 共用後端；未命中回傳 None（不計入 miss）"""
+        entry = self._get_local(key)
+        if entry is not None:
+            CACHE_LOOKUPS.inc(route=route, result='hit')
+            return entry
+
+        if self.backend is not None:
+            try:
+                entry = await self.backend.get(key)
+            except Exception as e:
+                print(f"共用回應快取讀取失敗：{e}")
+                entry = None
+            if entry is not None:
+                CACHE_LOOKUPS.inc(route=route, result='shared_hit')
+                self._put_local(key, entry)
+        return entry
+
+    async def put(self, key: str, data: Dict,
+                  serializer: Callable[[Dict], bytes] = serialize) -> Tuple[str, bytes]:
+        """序列化後存入程序內與共用後端，回傳 (etag, 回應位元組)"""
+        body = serializer(data)
+        entry = (make_etag(body), body)
+        self._put_local(key, entry)
+
+        if self.backend is not None:
+            try:
+                await self.backend.set(key, *entry)
+            except Exception as e:
+                print(f"共用回應快取寫入失敗：{e}")
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'shared': self.backend is not None
+            }
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """程序共用的回應快取（依 RESPONSE_CACHE_URL 決定是否加共用後端）"""
+    global _response_cache
+    if _response_cache is None:
+        backend = None
+        url = os.getenv('RESPONSE_CACHE_URL')
+        if url:
+            try:
+                backend = RedisBackend(url)
+            except ImportError:
+                print("未安裝 redis 套件，回應快取只使用程序內 LRU")
+        _response_cache = ResponseCache(backend=backend)
+    return _response_cache
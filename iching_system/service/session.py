@@ -0,0 +1,278 @@
+# iching_system/service/session.py
+"""
+互動起卦 session（WebSocket 協定）
+=================================
+Streamlit 版的 A3 問卷、A4 三步驟（show_a4_background → show_a4_inner →
+show_a4_outer）每次拉動滑桿都重跑整個腳本；這裡把流程拆成小訊息，
+一條連線一個 DivinationSession，只回傳變動的部分。
+
+客戶端 → 伺服器（JSON，type 區分）：
+    start       {"method": "A3"|"A4", "question": "..."}
+    score       {"index": i, "value": 0-10}       A3 六題 / A4 內三爻
+    scores      {"values": [...]}                 一次設定全部分數
+    background  {"description": "..."}            A4 背景描述
+    analyze     {}                                A4 外三爻 AI 分析（背景執行，期間仍可調整分數）
+    divine      {}                                起卦並解卦（背景執行；再次送出時取消上一次）
+
+伺服器 → 客戶端：
+    question    {"method", "question", "question_type", "aspects" | "inner"/"outer"}
+    score       {"index", "score", "yao", "yao_name"}
+    background  {"description"}
+    progress    {"step": "context"|"line"|"agent", "status", ...}   A4 Agent 進度
+                例如 {"step": "line", "line": 4, "status": "scored", "score": 7}
+    scores      {"inner", "outer", "degraded"}              A4 分析完成
+    reading / section / delta / done                        解卦段落（同 progressive.py）
+    error       {"detail"}
+
+錯誤的訊息只回傳 error，不中斷連線。
+LLM 工作（Agent 分析、段落微調）經過准入控制（admission.py）；
+未取得名額或 Agent 分析失敗時外三爻以中性分數代替、段落不微調，並標記 degraded
+（之後再送 analyze 會重新分析）
+"""
+
+import asyncio
+import traceback
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from ..core.dayan import score_to_yao, get_yao_name
+from ..divination.a3_questionnaire import get_aspects_for_question, classify_question
+from ..divination.a4_agent import (
+    QUESTION_ASPECTS,
+    _classify_question as a4_classify,
+    aanalyze_outer
+)
+from .progressive import progressive_reading
+from .admission import get_admission
+
+
+METHODS = ('A3', 'A4')
+
+# 分數預設值（與 Streamlit 版滑桿一致）
+DEFAULT_SCORE = 5
+
+
+def _validate_score(value) -> int:
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= 10:
+        raise ValueError("分數必須是 0-10 的整數")
+    return value
+
+
+class DivinationSession:
+    """
+    單一連線的 A3 / A4 起卦狀態
+
+    Args:
+        send: 傳送一則訊息（dict）的 coroutine function
+        generator: YiliGenerator
+        adapter: LLM 微調適配器（None 則解卦段落為中性版或預生成版本）
+        client_id: 准入控制的客戶端識別
+    """
+
+    def __init__(self, send: Callable[[Dict], Awaitable[None]], generator, adapter=None,
+                 client_id: Optional[str] = None):
+        self._send = send
+        self.client_id = client_id
+        self._send_lock = asyncio.Lock()
+        self.generator = generator
+        self.adapter = adapter
+
+        self.method: Optional[str] = None
+        self.question: Optional[str] = None
+        self.aspects: List[str] = []
+        self.scores: List[int] = []
+        self.description: Optional[str] = None
+        self.context: Optional[Dict] = None
+        self.outer_scores: Optional[List[int]] = None
+        self.degraded: Optional[str] = None
+        self._agent: Optional[asyncio.Task] = None
+        self._reading: Optional[asyncio.Task] = None
+
+        self._handlers = {
+            'start': self._start,
+            'score': self._score,
+            'scores': self._scores,
+            'background': self._background,
+            'analyze': self._analyze,
+            'divine': self._divine,
+        }
+
+    async def send(self, message_type: str, **data):
+        # Agent 背景任務與訊息處理可能同時傳送
+        async with self._send_lock:
+            await self._send({'type': message_type, **data})
+
+    async def handle(self, message: Dict):
+        """處理一則客戶端訊息；格式或狀態錯誤時回傳 error"""
+        handler = self._handlers.get(message.get('type')) if isinstance(message, dict) else None
+        if handler is None:
+            await self.send('error', detail=f"未知的訊息類型，可用類型: {list(self._handlers)}")
+            return
+        try:
+            await handler(message)
+        except ValueError as e:
+            await self.send('error', detail=str(e))
+        except Exception as e:
+            print(f"Session Error: {traceback.format_exc()}")
+            await self.send('error', detail=str(e))
+
+    async def close(self):
+        """連線結束（或問題、背景改變）時取消仍在執行的 Agent 分析與解卦"""
+        for task in (self._agent, self._reading):
+            if task is not None and not task.done():
+                task.cancel()
+
+    def _require(self, *methods):
+        if self.method is None:
+            raise ValueError("請先送出 start")
+        if self.method not in methods:
+            raise ValueError(f"{self.method} 不支援此訊息")
+
+    # === 問題 ===
+    async def _start(self, message):
+        method = message.get('method')
+        question = (message.get('question') or '').strip()
+        if method not in METHODS:
+            raise ValueError(f"method 必須是 {' / '.join(METHODS)}")
+        if not question:
+            raise ValueError("請輸入問題")
+
+        await self.close()
+        self.method = method
+        self.question = question
+        self.description = None
+        self.context = None
+        self.outer_scores = None
+        self.degraded = None
+        self._agent = None
+
+        if method == 'A3':
+            self.aspects = get_aspects_for_question(question)
+            self.scores = [DEFAULT_SCORE] * 6
+            await self.send('question', method=method, question=question,
+                            question_type=classify_question(question), aspects=self.aspects)
+        else:
+            q_type = a4_classify(question)
+            self.aspects = QUESTION_ASPECTS[q_type]['inner']
+            self.scores = [DEFAULT_SCORE] * 3
+            await self.send('question', method=method, question=question, question_type=q_type,
+                            inner=self.aspects, outer=QUESTION_ASPECTS[q_type]['outer'])
+
+    # === 分數 ===
+    async def _score(self, message):
+        self._require(*METHODS)
+        index = message.get('index')
+        if not isinstance(index, int) or not 0 <= index < len(self.scores):
+            raise ValueError(f"index 必須是 0-{len(self.scores) - 1}")
+        value = _validate_score(message.get('value'))
+        self.scores[index] = value
+        yao = score_to_yao(value)
+        await self.send('score', index=index, score=value, yao=yao, yao_name=get_yao_name(yao))
+
+    async def _scores(self, message):
+        self._require(*METHODS)
+        values = message.get('values')
+        if not isinstance(values, list) or len(values) != len(self.scores):
+            raise ValueError(f"values 需要 {len(self.scores)} 個分數")
+        self.scores = [_validate_score(v) for v in values]
+        for index, value in enumerate(self.scores):
+            yao = score_to_yao(value)
+            await self.send('score', index=index, score=value, yao=yao, yao_name=get_yao_name(yao))
+
+    # === A4 Agent ===
+    async def _background(self, message):
+        self._require('A4')
+        description = (message.get('description') or '').strip()
+        if not description:
+            raise ValueError("請輸入背景描述")
+        if description != self.description:
+            # 背景改變時重新分析外三爻
+            await self.close()
+            self._agent = None
+            self.outer_scores = None
+            self.degraded = None
+        self.description = description
+        await self.send('background', description=description)
+
+    async def _analyze(self, message):
+        self._require('A4')
+        if self._agent is None or (self._agent.done() and self.degraded):
+            # 第一次分析，或上次降級（未取得名額、分析失敗）時重試
+            self.context = None
+            self.outer_scores = None
+            self.degraded = None
+            self._agent = asyncio.create_task(self._run_agent())
+        elif self._agent.done() and self.outer_scores is not None:
+            # 已分析過（避免重複呼叫 API），直接回傳結果
+            await self.send('scores', inner=self.scores, outer=self.outer_scores,
+                            degraded=self.degraded is not None)
+
+    async def _run_agent(self):
+        """外三爻 AI 分析（需取得 LLM 名額；未取得時以中性分數代替）"""
+        async with get_admission().admit(self.client_id, workload='agent') as admission:
+            if admission.admitted:
+                await self._agent_lines()
+                return
+        await self._degrade(admission.reason)
+
+    async def _degrade(self, reason: str):
+        """外三爻以中性分數代替，divine 仍可進行"""
+        self.degraded = reason
+        self.context = {}
+        self.outer_scores = [DEFAULT_SCORE] * 3
+        await self.send('progress', step='agent', status='degraded', reason=reason)
+        await self.send('scores', inner=self.scores, outer=self.outer_scores, degraded=True)
+
+    async def _agent_lines(self):
+        """外三爻 AI 分析：三個面向並行收集資料與評分，逐爻回報進度"""
+        async def progress(step, **data):
+            await self.send('progress', step=step, **data)
+
+        try:
+            self.context, self.outer_scores = await aanalyze_outer(self.question, self.description, progress)
+            await self.send('scores', inner=self.scores, outer=self.outer_scores, degraded=False)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Session Agent Error: {traceback.format_exc()}")
+            await self.send('error', detail=f"外部環境分析失敗：{e}")
+            await self._degrade('agent_error')
+
+    # === 解卦 ===
+    async def _divine(self, message):
+        """
+        解卦在背景任務執行，等待 Agent 分析與段落微調期間仍可接收訊息
+        （斷線時 close 能立即取消）；分數以送出 divine 當下為準
+        """
+        self._require(*METHODS)
+        if self._reading is not None and not self._reading.done():
+            self._reading.cancel()
+        if self.method == 'A4' and self._agent is None:
+            self._agent = asyncio.create_task(self._run_agent())
+        self._reading = asyncio.create_task(self._run_reading(list(self.scores)))
+
+    async def _run_reading(self, scores: List[int]):
+        try:
+            if self.method == 'A3':
+                meta = {'mode': 'A3', 'questionnaire': {'aspects': self.aspects, 'scores': scores}}
+            else:
+                await asyncio.shield(self._agent)
+                if self.outer_scores is None:
+                    raise ValueError("外部環境分析未完成")
+                scores = scores + self.outer_scores
+                meta = {'mode': 'A4', 'agent_context': self.context}
+                if self.degraded:
+                    meta['agent_degraded'] = self.degraded
+
+            yao_values = [score_to_yao(s) for s in scores]
+            async for event, data in progressive_reading(
+                self.question, self.generator, self.adapter, yao_values=yao_values, meta=meta,
+                client_id=self.client_id
+            ):
+                await self.send(event, **data)
+        except asyncio.CancelledError:
+            raise
+        except ValueError as e:
+            await self.send('error', detail=str(e))
+        except Exception as e:
+            print(f"Session Reading Error: {traceback.format_exc()}")
+            await self.send('error', detail=str(e))
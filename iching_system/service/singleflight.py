@@ -0,0 +1,121 @@
+# iching_system/service/singleflight.py
+"""
+Single-flight：合併相同的進行中請求
+==================================
+同一問題的解卦是確定的；熱門問題同時湧入時，只讓第一個請求（leader）計算、
+呼叫 LLM，其餘相同的請求（follower）等待同一個結果。
+
+- 計算在獨立的 task 執行：leader 的客戶端中途斷線不會中斷計算，
+  follower 照樣拿到結果，結果也照樣存入回應快取
+- 除了最終結果，計算過程可以發布事件（串流解卦的 delta / section），
+  follower 加入時先重播已發布的事件，再接著收新的事件
+- 以快取鍵（正規化後的請求）區分；計算結束即移除，之後的請求改由回應快取命中
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..utils.metrics import REGISTRY
+
+
+FLIGHTS = REGISTRY.counter(
+    'singleflight_requests_total', '進行中請求合併（role=leader|follower）', ('route', 'role'))
+
+
+class Flight:
+    """一次進行中的計算：最終結果與過程中發布的事件"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future: asyncio.Future = loop.create_future()
+        self.events: List[Any] = []
+        self.followers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, event):
+        """發布一個過程事件（由計算本身呼叫）"""
+        self.events.append(event)
+        self._notify()
+
+    def _finish(self, task: asyncio.Task):
+        if task.cancelled():
+            self.future.cancel()
+        elif task.exception() is not None:
+            self.future.set_exception(task.exception())
+            # 沒有人等待時不印出「exception was never retrieved」
+            self.future.exception()
+        else:
+            self.future.set_result(task.result())
+        self._notify()
+
+    async def wait(self):
+        """等待最終結果（取消等待不會取消計算）"""
+        return await asyncio.shield(self.future)
+
+    async def replay(self) -> AsyncIterator[Any]:
+        """依序產生已發布與之後發布的事件，直到計算結束"""
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.future.done():
+                return
+            await changed.wait()
+
+
+class SingleFlight:
+    """以鍵合併進行中的計算（單一 event loop 內使用）"""
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+
+    def get(self, key: Optional[str]) -> Optional[Flight]:
+        """進行中的計算（沒有或屬於其他 event loop 時回傳 None）"""
+        if key is None:
+            return None
+        flight = self._flights.get(key)
+        if flight is None or flight.loop is not asyncio.get_running_loop() or flight.future.done():
+            return None
+        return flight
+
+    def run(self, key: Optional[str], fn: Callable[[Flight], Awaitable],
+            route: str = '') -> Tuple[Flight, bool]:
+        """
+        加入進行中的計算，或以 fn(flight) 開始新的計算
+
+        Args:
+            key: 正規化後的請求鍵；None 表示不合併（仍在獨立 task 執行）
+            fn: 計算函式，可用 flight.publish 發布過程事件
+
+        Returns:
+            (flight, 是否為 leader)
+        """
+        flight = self.get(key)
+        if flight is not None:
+            flight.followers += 1
+            FLIGHTS.inc(route=route, role='follower')
+            return flight, False
+
+        flight = Flight(asyncio.get_running_loop())
+        task = flight.task = asyncio.ensure_future(fn(flight))
+
+        def done(task):
+            if key is not None and self._flights.get(key) is flight:
+                del self._flights[key]
+            flight._finish(task)
+
+        task.add_done_callback(done)
+        if key is not None:
+            self._flights[key] = flight
+        FLIGHTS.inc(route=route, role='leader')
+        return flight, True
+
+    def __len__(self):
+        return len(self._flights)
@@ -0,0 +1,137 @@
+# iching_system/service/warmup.py
+"""
+啟動預熱
+========
+在接流量前完成第一個請求原本要付的成本：
+
+1. data        載入易經資料（含編碼修復與卦碼索引）
+2. generator   建立 YiliGenerator（三個 JSON 與預生成版本、卦碼索引）
+3. tables      走一次完整的起卦 → 卦象 → 解卦 → 序列化；
+               WARMUP_PRERENDER_A1=1 時預先產生全部 4096 組六爻的 A1 回應
+               放入回應快取（需 RESPONSE_CACHE_SIZE >= 4096）
+4. llm_client  建立 LLM 微調適配器（匯入 SDK、建立連線池）
+5. llm_connection  WARMUP_LLM=1 時先對供應商發一個輕量請求，建立 TLS 連線
+
+預熱在背景執行，存活檢查（liveness）立即可用；
+全部完成前就緒檢查（readiness）回傳未就緒
+"""
+
+import os
+import time
+import asyncio
+import itertools
+from typing import Callable, Dict, Optional
+
+from ..core.data_loader import load_data
+from ..core.calculator import compute_b_stage
+from .reading import build_reading, render_reading
+from .response_cache import get_response_cache, cache_key
+
+
+class WarmupState:
+    """預熱進度（供 /health/ready 回報）"""
+
+    def __init__(self):
+        self.ready = False
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps: Dict[str, float] = {}
+
+    def to_dict(self) -> Dict:
+        return {
+            'ready': self.ready,
+            'error': self.error,
+            'steps': {name: round(seconds, 4) for name, seconds in self.steps.items()},
+            'duration': round(self.finished_at - self.started_at, 4)
+            if self.started_at and self.finished_at else None
+        }
+
+
+async def _step(state: WarmupState, name: str, func, *args):
+    start = time.perf_counter()
+    if asyncio.iscoroutinefunction(func):
+        result = await func(*args)
+    else:
+        # 載入 JSON、匯入 SDK 等阻塞工作不佔用 event loop
+        result = await asyncio.to_thread(func, *args)
+    state.steps[name] = time.perf_counter() - start
+    return result
+
+
+async def _prerender_a1(generator):
+    """預先產生 4096 組六爻的 A1 回應（與 GET /api/reading/{yao} 相同的快取鍵）"""
+    cache = get_response_cache()
+    if cache.max_entries < 4096:
+        print(f"回應快取上限 {cache.max_entries} 小於 4096，略過 A1 預先產生")
+        return
+    for values in itertools.product((6, 7, 8, 9), repeat=6):
+        yao = ''.join(map(str, values))
+        await cache.get_or_compute(
+            cache_key('reading', yao),
+            lambda: build_reading(None, generator, None, list(values)),
+            route='warmup', serializer=render_reading
+        )
+        # 讓出 event loop，預熱期間存活檢查仍可回應
+        await asyncio.sleep(0)
+
+
+async def _warm_llm_connection():
+    """以列出模型的輕量請求建立到 Anthropic 的連線（失敗只印出訊息）"""
+    from ..llm.clients import get_async_anthropic_client
+    if os.environ.get('YILI_LLM_ADAPTER', 'claude').lower() != 'claude':
+        return
+    try:
+        client = get_async_anthropic_client()
+        if not hasattr(client, 'with_options'):
+            # cassette 替身沒有 models 介面（重播不連網，不需預熱）
+            return
+        await client.with_options(max_retries=0, timeout=10).models.list(limit=1)
+    except Exception as e:
+        print(f"LLM 連線預熱失敗：{e}")
+
+
+async def warm_up(state: WarmupState, get_generator: Callable, get_adapter: Callable,
+                  warm_llm: Optional[bool] = None, prerender: Optional[bool] = None) -> WarmupState:
+    """
+    依序執行預熱步驟；任何一步失敗時記錄錯誤，維持未就緒
+
+    Args:
+        state: 預熱進度
+        get_generator: 取得（並快取）YiliGenerator 的函式
+        get_adapter: 取得（並快取）LLM 微調適配器的函式
+        warm_llm: 是否預熱 LLM 連線，預設讀取 WARMUP_LLM
+        prerender: 是否預先產生全部 A1 回應，預設讀取 WARMUP_PRERENDER_A1
+    """
+    if warm_llm is None:
+        warm_llm = os.getenv('WARMUP_LLM', '0') == '1'
+    if prerender is None:
+        prerender = os.getenv('WARMUP_PRERENDER_A1', '0') == '1'
+
+    state.started_at = time.perf_counter()
+    try:
+        await _step(state, 'data', lambda: (load_data('modern2'), load_data('original')))
+        generator = await _step(state, 'generator', get_generator)
+
+        async def tables():
+            compute_b_stage([7, 8, 9, 6, 7, 8])
+            await get_response_cache().get_or_compute(
+                cache_key('reading', '789678'),
+                lambda: build_reading(None, generator, None, [7, 8, 9, 6, 7, 8]),
+                route='warmup', serializer=render_reading
+            )
+            if prerender:
+                await _prerender_a1(generator)
+        await _step(state, 'tables', tables)
+
+        adapter = await _step(state, 'llm_client', get_adapter)
+        if warm_llm and adapter is not None:
+            await _step(state, 'llm_connection', _warm_llm_connection)
+
+        state.ready = True
+    except Exception as e:
+        state.error = str(e)
+        print(f"預熱失敗：{e}")
+    finally:
+        state.finished_at = time.perf_counter()
+    return state
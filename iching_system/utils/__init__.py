@@ -1,6 +1,34 @@
-# iching_system/utils/__init__.py
 """
 工具函數模組
 """
 
-# 預留擴展
+from .metrics import (
+    MetricsRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY
+)
+
+from .serialization import (
+    dumps,
+    dumps_indent,
+    loads,
+    msgpack_dumps,
+    msgpack_ext,
+    MSGPACK_BACKEND
+)
+
+__all__ = [
+    'MetricsRegistry',
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'REGISTRY',
+    'dumps',
+    'dumps_indent',
+    'loads',
+    'msgpack_dumps',
+    'msgpack_ext',
+    'MSGPACK_BACKEND'
+]
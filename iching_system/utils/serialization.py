@@ -0,0 +1,91 @@
+# iching_system/utils/serialization.py
+"""
+快速 JSON 序列化
+================
+依安裝的套件選擇後端：orjson > msgspec > 標準庫 json
+
+所有後端輸出相同的內容：UTF-8、不跳脫中文、緊湊格式
+（等同 json.dumps(obj, ensure_ascii=False, separators=(',', ':'))）；
+快速後端無法處理的物件（例如卦號等非字串 key）改由標準庫 json 輸出
+
+MessagePack（精簡二進位回應）：msgpack > msgspec；都未安裝時 MSGPACK_BACKEND 為 None
+"""
+
+import json
+
+# 快速後端無法編碼時拋出的例外（orjson.JSONEncodeError 為 TypeError 的子類別）
+_ENCODE_ERRORS = (TypeError,)
+
+try:
+    import orjson
+    BACKEND = 'orjson'
+except ImportError:
+    orjson = None
+    try:
+        import msgspec
+        BACKEND = 'msgspec'
+        _msgspec_encoder = msgspec.json.Encoder()
+        _ENCODE_ERRORS = (TypeError, msgspec.EncodeError)
+    except ImportError:
+        BACKEND = 'json'
+
+try:
+    import msgpack
+    MSGPACK_BACKEND = 'msgpack'
+except ImportError:
+    msgpack = None
+    try:
+        import msgspec
+        MSGPACK_BACKEND = 'msgspec'
+        _msgspec_msgpack_encoder = msgspec.msgpack.Encoder()
+    except ImportError:
+        MSGPACK_BACKEND = None
+
+
+def dumps(obj) -> bytes:
+    """緊湊 UTF-8 JSON"""
+    try:
+        if BACKEND == 'orjson':
+            return orjson.dumps(obj)
+        if BACKEND == 'msgspec':
+            return _msgspec_encoder.encode(obj)
+    except _ENCODE_ERRORS:
+        pass  # 非字串 key 等：json 會轉成字串 key，改用 json 以保持輸出一致
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_indent(obj) -> str:
+    """縮排 2 格的 JSON 字串（等同 json.dumps(obj, ensure_ascii=False, indent=2)）"""
+    if BACKEND == 'orjson':
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+def loads(data):
+    if BACKEND == 'orjson':
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def msgpack_ext(code: int, data: bytes):
+    """MessagePack extension 值（依後端建立 ExtType / Ext）"""
+    if MSGPACK_BACKEND == 'msgpack':
+        return msgpack.ExtType(code, data)
+    return msgspec.msgpack.Ext(code, data)
+
+
+def msgpack_dumps(obj) -> bytes:
+    """
+    MessagePack 編碼
+
+    Raises:
+        RuntimeError: msgpack / msgspec 都未安裝
+    """
+    if MSGPACK_BACKEND == 'msgpack':
+        return msgpack.packb(obj, use_bin_type=True)
+    if MSGPACK_BACKEND == 'msgspec':
+        return _msgspec_msgpack_encoder.encode(obj)
+    raise RuntimeError("需要安裝 msgpack 或 msgspec")
@@ -0,0 +1,237 @@
+"""
+API 多程序服務（pre-fork）
+==========================
+`uvicorn api:app` 只有一個程序，只用到一顆 CPU；`uvicorn --workers` 以 spawn
+建立子程序，每個 worker 各自載入一份資料。這裡改成先在主程序完成預熱：
+
+1. 主程序關閉 GC，匯入 api 並執行預熱（易經資料、YiliGenerator 三個 JSON
+   與預生成版本、卦碼索引、A1 回應；WARMUP_PRERENDER_A1=1 時含全部 4096 組），
+   並先匯入 LLM SDK（anthropic 匯入約 1.5 秒，只匯入不建立客戶端）
+2. gc.freeze()：已載入的物件移到永久代，worker 的 GC 不再寫入它們的
+   GC 標頭，記憶體分頁維持 copy-on-write 共用
+3. 綁定 socket 後 fork 出 N 個 worker，各自執行 uvicorn（共用同一個 socket）
+4. worker 異常結束時重新 fork；收到 SIGTERM / SIGINT 時轉送給所有 worker
+5. --job-workers N 時另外 fork 出 N 個背景工作 worker（worker.py，需要
+   JOB_QUEUE_URL 設定共用後端），API worker 不執行 Agent 工作。
+   多個 API worker 不能使用程序內佇列（工作只存在建立它的 worker，
+   其他 worker 查詢會 404）：未設定 JOB_QUEUE_URL 時改用暫存目錄的
+   SQLite 佇列並至少啟動一個背景工作 worker；明確設定 memory:// 時拒絕啟動
+
+LLM 客戶端與連線池在 worker 內建立（不跨 fork 共用）。
+指標（/metrics）與程序內回應快取都是各 worker 各自一份；
+要跨 worker 共用回應快取請設定 RESPONSE_CACHE_URL。
+
+執行：
+    python serve.py [--workers N] [--job-workers N] [--host 0.0.0.0] [--port 8080] [--no-freeze]
+
+worker 數預設讀取 WEB_CONCURRENCY，未設定時為 1（單一程序，行為與
+`uvicorn api:app` 相同）；多程序需以 --workers 或 WEB_CONCURRENCY 明確指定，
+此時背景工作佇列的規則見第 5 點。--workers 1 時不 fork，直接在主程序服務
+"""
+
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import importlib
+
+
+# 在主程序先匯入、由 worker 共用的模組（未安裝的略過）
+PRELOAD_MODULES = (
+    'iching_system.core.yili_llm_adapter',
+    'iching_system.llm.semantic_cache',
+    'anthropic',
+    'google.generativeai',
+)
+
+
+# 多個 API worker 且未設定 JOB_QUEUE_URL 時使用的共用佇列
+DEFAULT_JOB_DB = os.path.join(tempfile.gettempdir(), 'yili-jobs.db')
+
+
+def shared_job_queue(workers: int, job_workers: int) -> int:
+    """
+    多個 API worker 時確保背景工作佇列跨程序共用（必須在匯入 api 前呼叫）
+
+    Returns:
+        背景工作 worker 數（改用預設 SQLite 佇列時至少 1）
+    """
+    if workers <= 1:
+        return job_workers
+    url = os.getenv('JOB_QUEUE_URL')
+    if not url:
+        os.environ['JOB_QUEUE_URL'] = 'sqlite://' + DEFAULT_JOB_DB
+        print(f"⚠️ {workers} 個 API worker 且未設定 JOB_QUEUE_URL：背景工作改用暫存目錄的 "
+              f"SQLite 佇列 {DEFAULT_JOB_DB}（重開機後清空；正式環境請設定 JOB_QUEUE_URL）")
+        return max(job_workers, 1)
+    if url.startswith('memory:'):
+        raise SystemExit(f"JOB_QUEUE_URL={url} 是程序內佇列，不能搭配 {workers} 個 API worker；"
+                         "請設定 sqlite:///path/jobs.db 或使用 --workers 1")
+    return job_workers
+
+
+def preload(prerender=None):
+    """在主程序載入並預熱 API（不建立 LLM 客戶端）"""
+    import api
+    if not api.CORE_LOADED:
+        raise SystemExit(f"核心模組載入失敗：{api.LOAD_ERROR}")
+    state = asyncio.run(api.warm_up(
+        api.WarmupState(), api.get_generator, lambda: None,
+        warm_llm=False, prerender=prerender
+    ))
+    if not state.ready:
+        raise SystemExit(f"預熱失敗：{state.error}")
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    print(f"主程序預熱完成：{state.to_dict()['steps']}")
+    return api.app
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_server(app, sock: socket.socket, log_level: str):
+    import uvicorn
+    config = uvicorn.Config(app, lifespan='on', log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def run_job_worker():
+    from worker import run_worker
+    run_worker()
+
+
+def _fork_worker(target) -> int:
+    """fork 出子程序執行 target()"""
+    pid = os.fork()
+    if pid:
+        return pid
+    # worker：恢復預設訊號處理（uvicorn / worker.py 會安裝自己的），重新啟用 GC
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    gc.enable()
+    code = 0
+    try:
+        target()
+    except BaseException as e:
+        print(f"worker {os.getpid()} 結束：{e!r}")
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def serve(workers: int, host: str, port: int, freeze: bool = True,
+          log_level: str = 'info', prerender=None, job_workers: int = 0):
+    """
+    預熱後 fork 出 workers 個 uvicorn worker，直到收到 SIGTERM / SIGINT
+
+    Args:
+        workers: worker 數（1 且沒有 job_workers 時不 fork）
+        job_workers: 背景工作 worker 數（需要 JOB_QUEUE_URL 共用後端）
+        freeze: 是否在 fork 前 gc.freeze()（關閉可比較共用記憶體的差異）
+        prerender: 是否預先產生全部 A1 回應，預設讀取 WARMUP_PRERENDER_A1
+    """
+    job_workers = shared_job_queue(workers, job_workers)
+    if freeze:
+        # 載入期間不做 GC，避免在共用分頁留下空洞
+        gc.disable()
+    app = preload(prerender)
+    sock = bind_socket(host, port)
+
+    if job_workers:
+        from iching_system.service.jobs import get_job_queue
+        if get_job_queue().in_process:
+            print("JOB_QUEUE_URL 未設定共用後端，不啟動背景工作 worker（工作由 API worker 自己執行）")
+            job_workers = 0
+
+    if workers <= 1 and not job_workers:
+        gc.enable()
+        print(f"單一程序服務 http://{host}:{port}")
+        run_server(app, sock, log_level)
+        return
+
+    if freeze:
+        gc.freeze()
+        print(f"gc.freeze()：{gc.get_freeze_count()} 個物件移入永久代")
+
+    children = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    def api_worker():
+        run_server(app, sock, log_level)
+
+    for target in [api_worker] * workers + [run_job_worker] * job_workers:
+        children[_fork_worker(target)] = (time.monotonic(), target)
+    print(f"主程序 {os.getpid()}：{workers} 個 worker、{job_workers} 個背景工作 worker "
+          f"{sorted(children)}，服務 http://{host}:{port}")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        child = children.pop(pid, None)
+        if child is None or stopping:
+            continue
+        started, target = child
+        print(f"worker {pid} 異常結束（狀態 {status}），重新啟動")
+        if time.monotonic() - started < 1:
+            # 啟動即失敗時放慢重啟，避免空轉
+            time.sleep(1)
+        if not stopping:
+            children[_fork_worker(target)] = (time.monotonic(), target)
+
+    sock.close()
+
+
+def default_workers() -> int:
+    """WEB_CONCURRENCY，未設定時為 1（多程序需明確指定）"""
+    return int(os.getenv('WEB_CONCURRENCY') or 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="易力決策 API 多程序服務（pre-fork）")
+    parser.add_argument('--workers', type=int, default=default_workers())
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '8080')))
+    parser.add_argument('--job-workers', type=int, default=int(os.getenv('JOB_WORKERS', '0')),
+                        help="背景工作 worker 數（需要 JOB_QUEUE_URL 共用後端）")
+    parser.add_argument('--no-freeze', action='store_true', help="fork 前不呼叫 gc.freeze()")
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args()
+
+    serve(args.workers, args.host, args.port, freeze=not args.no_freeze, log_level=args.log_level,
+          job_workers=args.job_workers)
+
+
+if __name__ == '__main__':
+    main()
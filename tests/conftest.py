@@ -0,0 +1,35 @@
+"""
+測試共用設定
+============
+測試不呼叫真實的 LLM：需要 LLM 的流程以 cassette（iching_system/llm/cassette.py）
+的 synthetic 模式回應，或直接替換 adapter。
+
+    python -m pytest -q
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# 匯入任何模組前設定：LLM 呼叫一律由 cassette 回傳佔位文字，不連網
+for name in ('ANTHROPIC_API_KEY', 'GEMINI_API_KEY', 'GOOGLE_API_KEY'):
+    os.environ.pop(name, None)
+os.environ.update({
+    'LLM_CASSETTE_MODE': 'replay',
+    'LLM_CASSETTE_PATH': os.path.join(ROOT, 'tests', 'no-such-cassette.jsonl'),
+    'LLM_CASSETTE_MISS': 'synthetic',
+    'LLM_CASSETTE_LATENCY': 'none',
+    'JOB_QUEUE_URL': 'memory://',
+})
+
+
+@pytest.fixture(scope='session')
+def generator():
+    """YiliGenerator 載入一次（資料檔較大）"""
+    from iching_system.core.yili_generator import YiliGenerator
+    return YiliGenerator()
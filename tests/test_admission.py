@@ -0,0 +1,166 @@
+"""准入控制：名額、排隊、過載與客戶端限流；客戶端識別"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from iching_system.service.admission import LLM_EXPECTED_SECONDS, AdmissionController, ClientRateLimited
+
+
+def _controller(**kwargs):
+    kwargs.setdefault('client_rate', 0)
+    return AdmissionController(**kwargs)
+
+
+async def _hold(controller, entered, release, results):
+    async with controller.admit() as admission:
+        results.append(admission)
+        entered.set()
+        if admission.admitted and release is not None:
+            await release.wait()
+
+
+def test_queued_request_gets_released_slot():
+    async def main():
+        controller = _controller(max_concurrency=1, latency_budget=5)
+        entered, release, results = asyncio.Event(), asyncio.Event(), []
+        first = asyncio.create_task(_hold(controller, entered, release, results))
+        await entered.wait()
+        second = asyncio.create_task(_hold(controller, asyncio.Event(), None, results))
+        await asyncio.sleep(0.01)
+        assert controller.queued == 1
+        release.set()
+        await asyncio.gather(first, second)
+        return controller, results
+
+    controller, results = asyncio.run(main())
+    assert [r.admitted for r in results] == [True, True]
+    assert controller.stats()['active'] == 0
+
+
+def test_queue_timeout_degrades():
+    async def main():
+        controller = _controller(max_concurrency=1, latency_budget=0.05)
+        controller._service_times['adapt'] = 0.01
+        entered, release, results = asyncio.Event(), asyncio.Event(), []
+        first = asyncio.create_task(_hold(controller, entered, release, results))
+        await entered.wait()
+        async with controller.admit() as admission:
+            pass
+        release.set()
+        await first
+        return controller, admission
+
+    controller, admission = asyncio.run(main())
+    assert not admission.admitted and admission.reason == 'queue_timeout'
+    assert controller.stats()['active'] == 0 and controller.queued == 0
+
+
+def test_overloaded_and_queue_full_do_not_wait():
+    async def main():
+        controller = _controller(max_concurrency=1, latency_budget=1)
+        entered, release, results = asyncio.Event(), asyncio.Event(), []
+        first = asyncio.create_task(_hold(controller, entered, release, results))
+        await entered.wait()
+        controller._service_times['adapt'] = 10  # 估計等待 10 秒，超過預算
+        async with controller.admit() as overloaded:
+            pass
+        controller.max_queue = 0
+        async with controller.admit() as full:
+            pass
+        release.set()
+        await first
+        return overloaded, full
+
+    overloaded, full = asyncio.run(main())
+    assert overloaded.reason == 'overloaded' and overloaded.retry_after > 0
+    assert full.reason == 'queue_full'
+
+
+def test_agent_runs_keep_their_own_service_time():
+    async def main():
+        controller = _controller(max_concurrency=2, latency_budget=1)
+        controller._service_times['agent'] = 30  # 先前的 A4 Agent 分析很慢
+        async with controller.admit(workload='agent'):
+            pass
+        async with controller.admit() as admission:
+            pass
+        return controller, admission
+
+    controller, admission = asyncio.run(main())
+    assert admission.admitted
+    service_time = controller.stats()['service_time']
+    assert service_time['adapt'] <= LLM_EXPECTED_SECONDS < service_time['agent']
+    assert controller._running == {'agent': 0, 'adapt': 0}
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def main():
+        controller = _controller(max_concurrency=1, latency_budget=5)
+        entered, release, results = asyncio.Event(), asyncio.Event(), []
+        first = asyncio.create_task(_hold(controller, entered, release, results))
+        await entered.wait()
+        waiting = asyncio.create_task(_hold(controller, asyncio.Event(), None, results))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        release.set()
+        await first
+        async with controller.admit() as again:
+            pass
+        return controller, again
+
+    controller, again = asyncio.run(main())
+    assert again.admitted
+    assert controller.stats()['active'] == 0 and controller.queued == 0
+
+
+def test_client_rate_limit():
+    async def main():
+        controller = AdmissionController(client_rate=0.01, client_burst=1)
+        async with controller.admit('a') as first:
+            pass
+        async with controller.admit('a') as second:
+            pass
+        async with controller.admit('b') as other:
+            pass
+        with pytest.raises(ClientRateLimited) as info:
+            controller.check_client('a')
+        return first, second, other, info.value
+
+    first, second, other, limited = asyncio.run(main())
+    assert first.admitted and other.admitted
+    assert second.reason == 'rate_limited' and second.retry_after > 0
+    assert int(limited.retry_after_header) >= 1
+
+
+def _connection(forwarded=None, host='10.0.0.1'):
+    headers = {'x-forwarded-for': forwarded} if forwarded is not None else {}
+    return SimpleNamespace(headers=headers, client=SimpleNamespace(host=host))
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = pytest.importorskip('api')
+    monkeypatch.setattr(api, 'TRUST_PROXY_HEADERS', True)
+    monkeypatch.setattr(api, 'TRUSTED_PROXY_HOPS', 1)
+    return api
+
+
+def test_client_id_ignores_spoofed_forwarded_entries(api):
+    # 客戶端自己填的開頭項目不可用來換身分
+    assert api._client_id(_connection('1.1.1.1, 203.0.113.7')) == '203.0.113.7'
+    assert api._client_id(_connection('2.2.2.2, 203.0.113.7')) == '203.0.113.7'
+
+
+def test_client_id_with_two_trusted_proxies(api, monkeypatch):
+    monkeypatch.setattr(api, 'TRUSTED_PROXY_HOPS', 2)
+    assert api._client_id(_connection('1.1.1.1, 203.0.113.7, 10.1.2.3')) == '203.0.113.7'
+    assert api._client_id(_connection('203.0.113.7')) == '203.0.113.7'
+
+
+def test_client_id_without_proxy_headers(api, monkeypatch):
+    assert api._client_id(_connection()) == '10.0.0.1'
+    monkeypatch.setattr(api, 'TRUST_PROXY_HEADERS', False)
+    assert api._client_id(_connection('1.1.1.1')) == '10.0.0.1'
@@ -0,0 +1,76 @@
+"""批次解卦：去重、依原始位置輸出、整批一次的客戶端額度"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from iching_system.service import admission
+from iching_system.service.admission import AdmissionController
+from iching_system.service.batch import stream_batch
+
+
+class FakeAdapter:
+    """記錄呼叫次數的微調替身"""
+
+    def __init__(self):
+        self.questions = []
+
+    async def aadapt_batch(self, sections, question, names=None):
+        self.questions.append(question)
+        await asyncio.sleep(0.01)
+        return {key: f'{question}：{text}' for key, text in sections.items()}
+
+
+@pytest.fixture
+def fresh_admission(monkeypatch):
+    controller = AdmissionController(max_concurrency=4, client_rate=0.5, client_burst=5)
+    monkeypatch.setattr(admission, '_admission', controller)
+    return controller
+
+
+def _collect(items, generator, adapter=None):
+    async def main():
+        return [line async for line in stream_batch(items, generator, adapter)]
+    lines = b''.join(asyncio.run(main())).decode().splitlines()
+    return sorted((json.loads(line) for line in lines), key=lambda line: line['index'])
+
+
+def test_duplicates_are_computed_once(generator, fresh_admission):
+    adapter = FakeAdapter()
+    items = [{'question': '該不該換工作'}, {'question': ' 該不該換工作 '}, {'yao_values': [7, 7, 7, 8, 8, 8]},
+             {'question': '是否搬家'}, {'yao_values': [7, 7, 7, 8, 8, 8]}]
+    lines = _collect(items, generator, adapter)
+    assert [line['index'] for line in lines] == [0, 1, 2, 3, 4]
+    assert sorted(adapter.questions) == ['是否搬家', '該不該換工作']
+    assert lines[0]['result'] == lines[1]['result']
+    assert lines[2]['result'] == lines[4]['result']
+    assert lines[0]['result']['reading']['meta']['adapted'] == ['s1_status', 's2_trend', 's6_outlook']
+
+
+def test_invalid_item_reports_error_only_for_that_line(generator):
+    lines = _collect([{'yao_values': [1, 2, 3]}, {'yao_values': [7, 7, 7, 7, 7, 7]}], generator)
+    assert 'error' in lines[0]
+    assert lines[1]['result']['yao_values'] == [7, 7, 7, 7, 7, 7]
+
+
+def test_batch_larger_than_client_burst_is_charged_once(monkeypatch, fresh_admission):
+    api = pytest.importorskip('api')
+    if not api.CORE_LOADED:
+        pytest.skip(api.LOAD_ERROR)
+    adapter = FakeAdapter()
+    monkeypatch.setattr(api, 'get_adapter', lambda: adapter)
+    body = {'items': [{'question': f'第 {i} 個問題'} for i in range(12)], 'adapt': True}
+
+    async def main():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.post('/api/ask/batch', json=body)
+
+    response = asyncio.run(main())
+    assert response.status_code == 200
+    results = [json.loads(line)['result'] for line in response.text.splitlines()]
+    assert len(results) == 12
+    assert not any(result.get('degraded') for result in results)
+    assert len(adapter.questions) == 12
@@ -0,0 +1,124 @@
+"""LLM cassette：錄製後重播、輪流取用、找不到時的處理、延遲設定"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from iching_system.llm.cassette import (
+    Cassette, CassetteAnthropic, CassetteGeminiModel, CassetteMiss
+)
+
+
+REQUEST = {'model': 'claude-test', 'max_tokens': 100,
+           'messages': [{'role': 'user', 'content': '問題'}]}
+
+
+class FakeMessages:
+    def __init__(self, texts):
+        self.texts = list(texts)
+        self.calls = 0
+
+    def create(self, **kwargs):
+        text = self.texts[self.calls % len(self.texts)]
+        self.calls += 1
+        return SimpleNamespace(
+            content=[SimpleNamespace(type='text', text=text)],
+            usage=SimpleNamespace(input_tokens=3, output_tokens=len(text))
+        )
+
+
+class FakeGemini:
+    def generate_content(self, prompt, **kwargs):
+        return SimpleNamespace(
+            text=f'gemini:{prompt}',
+            usage_metadata=SimpleNamespace(prompt_token_count=1, candidates_token_count=2)
+        )
+
+
+def _record(path, texts):
+    cassette = Cassette(str(path), mode='record')
+    client = CassetteAnthropic(cassette, SimpleNamespace(messages=FakeMessages(texts)))
+    for _ in texts:
+        client.messages.create(**REQUEST)
+
+
+def test_record_then_replay_in_order(tmp_path):
+    path = tmp_path / 'llm.jsonl'
+    _record(path, ['first', 'second'])
+
+    replay = CassetteAnthropic(Cassette(str(path), latency='none'))
+    texts = [replay.messages.create(**REQUEST).content[0].text for _ in range(3)]
+    assert texts == ['first', 'second', 'first']
+
+
+def test_async_replay_and_stream(tmp_path):
+    path = tmp_path / 'llm.jsonl'
+    _record(path, ['完整的回應'])
+    cassette = Cassette(str(path), latency='none')
+
+    async def main():
+        client = CassetteAnthropic(cassette, is_async=True)
+        response = await client.messages.create(**REQUEST)
+        async with client.messages.stream(**REQUEST) as stream:
+            chunks = [text async for text in stream.text_stream]
+        return response.content[0].text, ''.join(chunks)
+
+    assert asyncio.run(main()) == ('完整的回應', '完整的回應')
+
+
+def test_different_request_misses(tmp_path):
+    path = tmp_path / 'llm.jsonl'
+    _record(path, ['first'])
+    replay = CassetteAnthropic(Cassette(str(path), latency='none'))
+    with pytest.raises(CassetteMiss):
+        replay.messages.create(**dict(REQUEST, max_tokens=200))
+
+    synthetic = CassetteAnthropic(Cassette(str(path), latency='none', on_miss='synthetic'))
+    text = synthetic.messages.create(**dict(REQUEST, max_tokens=200)).content[0].text
+    assert text.startswith('[cassette:claude]')
+
+
+def test_gemini_record_then_replay(tmp_path):
+    path = tmp_path / 'llm.jsonl'
+    recorder = CassetteGeminiModel(Cassette(str(path), mode='record'), 'gemini-test', FakeGemini())
+    assert recorder.generate_content('問').text == 'gemini:問'
+
+    cassette = Cassette(str(path), latency='none')
+    replay = CassetteGeminiModel(cassette, 'gemini-test')
+    response = replay.generate_content('問')
+    assert response.text == 'gemini:問'
+    assert response.usage_metadata.candidates_token_count == 2
+    assert cassette.has_provider('gemini') and not cassette.has_provider('claude')
+
+
+class ConfiguredGemini:
+    def generate_content(self, prompt, generation_config=None):
+        return SimpleNamespace(
+            text=f"{prompt}:{generation_config['max_output_tokens']}",
+            usage_metadata=SimpleNamespace(prompt_token_count=1, candidates_token_count=2)
+        )
+
+
+def test_gemini_key_includes_generation_config(tmp_path):
+    path = tmp_path / 'llm.jsonl'
+    recorder = CassetteGeminiModel(Cassette(str(path), mode='record'), 'gemini-test', ConfiguredGemini())
+    for max_tokens in (100, 500):
+        recorder.generate_content('問', generation_config={'max_output_tokens': max_tokens})
+
+    replay = CassetteGeminiModel(Cassette(str(path), latency='none', on_miss='error'), 'gemini-test')
+    for max_tokens in (500, 100):
+        response = replay.generate_content('問', generation_config={'max_output_tokens': max_tokens})
+        assert response.text == f'問:{max_tokens}'
+    with pytest.raises(CassetteMiss):
+        replay.generate_content('問')
+
+
+def test_latency_settings():
+    entry = {'duration': 2.0, 'text': 'abcd', 'chunks': [[0.5, 'ab'], [2.0, 'cd']]}
+    assert Cassette('missing.jsonl').duration(entry) == 2.0
+    assert Cassette('missing.jsonl', latency='0.5').chunk_schedule(entry) == [(0.25, 'ab'), (0.75, 'cd')]
+    assert Cassette('missing.jsonl', latency='fixed:1').chunk_schedule(entry) == [(0.5, 'ab'), (0.5, 'cd')]
+    assert Cassette('missing.jsonl', latency='none').duration(entry) == 0.0
+    with pytest.raises(ValueError):
+        Cassette('missing.jsonl', mode='rewind')
@@ -0,0 +1,70 @@
+"""非同步 LLM 客戶端：每個 event loop 一個、loop 結束後釋放、關閉時清除"""
+
+import gc
+import asyncio
+
+import pytest
+
+pytest.importorskip('anthropic')
+
+from iching_system.llm import clients
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    clients.reset_clients()
+    yield
+    clients.reset_clients()
+
+
+def test_one_client_per_loop():
+    async def get_twice():
+        first = clients._async_anthropic_client('test-key')
+        return first, clients._async_anthropic_client('test-key')
+
+    first, same = asyncio.run(get_twice())
+    other, _ = asyncio.run(get_twice())
+    assert first is same
+    assert other is not first
+
+
+def test_client_released_with_its_loop():
+    async def get_client():
+        clients._async_anthropic_client('test-key')
+        return len(clients._async_anthropic_clients)
+
+    assert asyncio.run(get_client()) == 1
+    gc.collect()
+    assert len(clients._async_anthropic_clients) == 0
+
+
+def test_close_async_clients():
+    async def open_and_close():
+        client = clients._async_anthropic_client('test-key')
+        await clients.close_async_clients()
+        return client, len(clients._async_anthropic_clients)
+
+    client, remaining = asyncio.run(open_and_close())
+    assert remaining == 0
+    assert client.is_closed()
+
+
+def test_ollama_async_client_per_loop():
+    pytest.importorskip('httpx')
+    from iching_system.core.yili_llm_adapter import OllamaLLMAdapter
+    from iching_system.llm.semantic_cache import CachedLLMAdapter
+
+    adapter = OllamaLLMAdapter(base_url='http://127.0.0.1:9')
+
+    async def open_and_close():
+        client = adapter._async_client()
+        assert adapter._async_client() is client
+        await CachedLLMAdapter(adapter).aclose()
+        return client
+
+    first = asyncio.run(open_and_close())
+    second = asyncio.run(open_and_close())
+    assert first is not second
+    assert first.is_closed and second.is_closed
+    assert len(adapter._async_clients) == 0
+    adapter.close()
@@ -0,0 +1,74 @@
+"""精簡二進位回應：Accept 協商、模板引用的還原與版本不符"""
+
+import asyncio
+
+import httpx
+import pytest
+
+msgpack = pytest.importorskip('msgpack')
+
+from iching_system.service import compact
+from iching_system.service.compact import TEMPLATE_EXT_TYPE, TemplateTable, wants_msgpack
+
+
+def _decode(body, chunks):
+    """客戶端的解碼：引用換回已快取的模板文字"""
+    def ext_hook(code, data):
+        assert code == TEMPLATE_EXT_TYPE
+        return chunks[data[0]][data[1]]
+    return msgpack.unpackb(body, raw=False, ext_hook=ext_hook)
+
+
+def test_accept_negotiation():
+    assert wants_msgpack('application/msgpack')
+    assert wants_msgpack('application/json;q=0.5, application/x-msgpack')
+    assert not wants_msgpack('application/json, application/msgpack;q=0.5')
+    assert not wants_msgpack('*/*')
+    assert not wants_msgpack(None)
+
+
+def test_cached_chunks_header():
+    table = TemplateTable([['甲乙丙丁戊'], ['己庚辛壬癸']])
+    assert table.cached_chunks(f'{table.version}:3') == 3
+    assert table.cached_chunks(f'{table.version}:ff') == 3
+    assert table.cached_chunks('old:3') == 0
+    assert table.cached_chunks(f'{table.version}:zz') == 0
+
+
+def test_encode_round_trip_only_references_cached_chunks():
+    table = TemplateTable([['共用的段落標題'], ['第一卦的卦解文字']])
+    payload = {'title': '共用的段落標題', 'texts': ['第一卦的卦解文字', '問題'], 'n': 1}
+    only_common = table.encode(payload, cached=1)
+    assert _decode(only_common, table.chunks) == payload
+    assert '第一卦的卦解文字'.encode() in only_common
+    assert '共用的段落標題'.encode() not in only_common
+    assert msgpack.unpackb(table.encode(payload), raw=False) == payload
+
+
+def test_reading_round_trip_over_api(monkeypatch):
+    api = pytest.importorskip('api')
+    monkeypatch.setattr(compact, '_template_table', None)
+
+    async def main():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            info = (await client.get('/api/templates')).json()
+            chunks = [(await client.get(info['url'].format(n=n))).json()['texts']
+                      for n in range(info['chunks'])]
+            plain = await client.get('/api/reading/789678')
+            mask = format((1 << info['chunks']) - 1, 'x')
+            compact_response = await client.get('/api/reading/789678', headers={
+                'Accept': 'application/msgpack',
+                'X-Yili-Templates': f"{info['version']}:{mask}"
+            })
+            stale = await client.get('/api/reading/789678', headers={
+                'Accept': 'application/msgpack', 'X-Yili-Templates': f'old:{mask}'
+            })
+        return info, chunks, plain, compact_response, stale
+
+    info, chunks, plain, compact_response, stale = asyncio.run(main())
+    assert compact_response.headers['content-type'].startswith('application/msgpack')
+    assert _decode(compact_response.content, chunks) == plain.json()
+    assert len(compact_response.content) < len(stale.content) < len(plain.content)
+    assert msgpack.unpackb(stale.content, raw=False) == plain.json()
+    assert stale.headers.get('x-yili-templates-version') == info['version']
@@ -0,0 +1,109 @@
+"""YiliGenerator：各模式共用的預生成版本、預生成腳本的中斷續跑"""
+
+import json
+
+import pytest
+
+from iching_system import precompute_variants
+from iching_system.divination.a3_questionnaire import classify_question
+
+YAO = [7, 8, 9, 6, 7, 8]
+QUESTION = '該不該換工作'
+
+
+@pytest.fixture
+def variants(generator, monkeypatch):
+    category = classify_question(QUESTION)
+    keys = generator.variant_keys(generator.generate_a1(YAO)['meta'])
+    data = {}
+    for section_id, (group, key) in keys.items():
+        data.setdefault(group, {})[key] = {category: f'預生成 {section_id}'}
+    monkeypatch.setattr(generator, 'variants', data)
+    return category
+
+
+@pytest.mark.parametrize('mode', ['generate', 'a2', 'a3', 'a4'])
+def test_every_mode_uses_variants(generator, variants, mode):
+    if mode == 'generate':
+        result = generator.generate(YAO, QUESTION, category=variants)
+    elif mode == 'a2':
+        result = generator.generate_a2(YAO, QUESTION, category=variants)
+    elif mode == 'a3':
+        result = generator.generate_a3(YAO, QUESTION, {'scores': []}, category=variants)
+    else:
+        result = generator.generate_a4(YAO, QUESTION, {'keywords': []}, category=variants)
+    assert result['meta']['variant'] == variants
+    for section_id in ('s1_status', 's2_trend', 's6_outlook'):
+        assert result['sections'][section_id]['content'] == f'預生成 {section_id}'
+
+
+def test_a1_stays_neutral(generator, variants):
+    result = generator.generate(YAO)
+    assert 'variant' not in result['meta']
+    assert result['sections']['s1_status']['content'] != '預生成 s1_status'
+    assert 'variant' not in generator.generate_a2(YAO, QUESTION)['meta']
+
+
+def test_variant_keys(generator):
+    meta = generator.generate_a1(YAO)['meta']
+    keys = generator.variant_keys(meta)
+    ben, zhi = keys['s1_status'][1], keys['s6_outlook'][1]
+    assert keys == {'s1_status': ('s1', ben), 's2_trend': ('s2', f'{ben}_{zhi}'), 's6_outlook': ('s6', zhi)}
+    assert ben in generator.general and zhi in generator.general
+    assert f'{ben}_{zhi}' in generator.trends
+
+
+def test_apply_variants_partial_and_missing(generator, monkeypatch):
+    keys = generator.variant_keys(generator.generate_a1(YAO)['meta'])
+    group, key = keys['s1_status']
+    monkeypatch.setattr(generator, 'variants', {group: {key: {'career': '職涯版現況'}}})
+
+    result = generator.generate_a1(YAO)
+    neutral_s2 = result['sections']['s2_trend']['content']
+    assert generator.apply_variants(result, 'career') is False
+    assert result['sections']['s1_status']['content'] == '職涯版現況'
+    assert result['sections']['s2_trend']['content'] == neutral_s2
+    assert result['meta']['variant'] == 'career'
+
+    # 沒有預生成檔案（或該分類沒有任何版本）時不標記 variant
+    monkeypatch.setattr(generator, 'variants', {'s1': {}, 's2': {}, 's6': {}})
+    result = generator.generate_a1(YAO)
+    assert generator.apply_variants(result, 'career') is False
+    assert 'variant' not in result['meta']
+
+
+class InterruptingAdapter:
+    """微調 fail_at 批之後中斷（模擬 Ctrl-C）"""
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.batches = []
+
+    def adapt_batch(self, sections, question, names=None):
+        if len(self.batches) == self.fail_at:
+            raise KeyboardInterrupt
+        self.batches.append(list(sections))
+        return {k: f'職涯版：{v}' for k, v in sections.items()}
+
+
+def test_precompute_resumes_after_interrupt(tmp_path, monkeypatch):
+    output = tmp_path / 'variants.json'
+    argv = ['--sections', 's1', '--categories', 'career', '--limit', '6', '--batch-size', '2',
+            '--workers', '1', '--save-every', '1', '--output', str(output)]
+
+    first = InterruptingAdapter(fail_at=2)
+    monkeypatch.setattr(precompute_variants, 'create_adapter', lambda: first)
+    with pytest.raises(KeyboardInterrupt):
+        precompute_variants.main(argv)
+    saved = json.loads(output.read_text(encoding='utf-8'))['sections']['s1']
+    assert len(saved) == 4
+
+    second = InterruptingAdapter()
+    monkeypatch.setattr(precompute_variants, 'create_adapter', lambda: second)
+    precompute_variants.main(argv)
+    # 只重跑尚未寫回的一批
+    assert len(second.batches) == 1
+    assert not set(second.batches[0]) & set(saved)
+    data = json.loads(output.read_text(encoding='utf-8'))
+    assert len(data['sections']['s1']) == 6
+    assert all(v['career'].startswith('職涯版：') for v in data['sections']['s1'].values())
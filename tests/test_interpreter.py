@@ -0,0 +1,40 @@
+"""六點並行解卦：第 1-5 點同時開始，第 6 點在第 5 點完成後才開始並取得建議"""
+
+import threading
+
+from iching_system.core.calculator import compute_b_stage
+from iching_system.interpretation import interpreter
+from iching_system.interpretation.interpreter import POINT_KEYS, interpret_stream
+
+
+def test_interpret_stream_dependencies(monkeypatch):
+    # 第 1-5 點必須同時在執行中才能通過 barrier（否則逾時失敗）
+    barrier = threading.Barrier(5, timeout=5)
+    lock = threading.Lock()
+    events = []
+
+    def point(key, text):
+        def run(*args):
+            barrier.wait()
+            with lock:
+                events.append(('done', key))
+            return text
+        return run
+
+    def prospect(question, hex_target, advice_text):
+        with lock:
+            events.append(('start', '6_展望'))
+        return f'展望依據：{advice_text}'
+
+    monkeypatch.setattr(interpreter, 'generate_hex_summary', point('1_現況', '現況'))
+    monkeypatch.setattr(interpreter, 'generate_transition_summary', point('2_變化趨勢', '趨勢'))
+    monkeypatch.setattr(interpreter, 'generate_process_summary', point('3_變化過程', '過程'))
+    monkeypatch.setattr(interpreter, 'generate_six_lines', point('4_六爻境遇', '六爻'))
+    monkeypatch.setattr(interpreter, 'generate_advice', point('5_建議', '建議文字'))
+    monkeypatch.setattr(interpreter, 'generate_prospect', prospect)
+
+    results = dict(interpret_stream('該不該換工作', compute_b_stage([7, 8, 9, 6, 7, 8])))
+
+    assert set(results) == set(POINT_KEYS)
+    assert events.index(('done', '5_建議')) < events.index(('start', '6_展望'))
+    assert results['6_展望'] == '展望依據：建議文字'
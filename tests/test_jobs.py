@@ -0,0 +1,190 @@
+"""背景工作佇列：取出、重新排隊、停止；SQLite 後端的取出、逾時回收與取消；A4 工作的准入控制"""
+
+import asyncio
+
+import pytest
+
+from iching_system.service import admission, jobs
+from iching_system.service.jobs import JobQueue, JobWorker, MemoryJobBackend, SQLiteJobBackend
+
+
+def _echo_params(params):
+    return dict(params)
+
+
+@pytest.fixture
+def slow_kind(monkeypatch):
+    """執行到被取消為止的工作種類"""
+    async def run(params, ctx):
+        await ctx.emit('progress', step='sleep')
+        await asyncio.sleep(3600)
+
+    monkeypatch.setitem(jobs.JOB_KINDS, 'slow', (_echo_params, run))
+
+
+def test_stop_requeues_running_jobs_while_all_slots_are_busy(slow_kind):
+    async def main():
+        queue = JobQueue(MemoryJobBackend())
+        first = await queue.submit('slow', {})
+        second = await queue.submit('slow', {})
+        worker = JobWorker(queue, lambda: None, concurrency=1, name='w1')
+        stop = asyncio.Event()
+        task = asyncio.create_task(worker.run(stop))
+        while (await queue.get(first['id']))['status'] != 'running':
+            await asyncio.sleep(0.01)
+        # 唯一的名額被佔用：worker 停在等待名額
+        stop.set()
+        await asyncio.wait_for(task, 2)
+        return await queue.get(first['id']), await queue.get(second['id'])
+
+    first, second = asyncio.run(main())
+    assert first['status'] == 'queued'
+    assert first['attempts'] == 0
+    assert first['events'][-1]['reason'] == 'worker_shutdown'
+    assert second['status'] == 'queued'
+
+
+# ---------------------------------------------------------------------------
+# SQLite 後端
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    return str(tmp_path / 'jobs.db')
+
+
+def _age_heartbeat(backend, job_id, seconds):
+    with backend._transaction() as conn:
+        conn.execute('UPDATE jobs SET heartbeat_at = heartbeat_at - ? WHERE id = ?', (seconds, job_id))
+
+
+def test_sqlite_claims_each_job_once_in_order(sqlite_path):
+    async def main():
+        api = SQLiteJobBackend(sqlite_path)
+        first = await api.submit('a4', {'n': 1})
+        second = await api.submit('a4', {'n': 2})
+        # 兩個 worker 程序各自的連線
+        w1, w2 = SQLiteJobBackend(sqlite_path), SQLiteJobBackend(sqlite_path)
+        claimed = [await w1.claim('w1'), await w2.claim('w2'), await w1.claim('w1')]
+        return first, second, claimed, await api.counts()
+
+    first, second, claimed, counts = asyncio.run(main())
+    assert [claimed[0]['id'], claimed[1]['id']] == [first['id'], second['id']]
+    assert claimed[0]['worker'] == 'w1' and claimed[0]['attempts'] == 1
+    assert claimed[0]['params'] == {'n': 1}
+    assert claimed[2] is None
+    assert counts == {'running': 2}
+
+
+def test_sqlite_finish_records_result_and_events(sqlite_path):
+    async def main():
+        backend = SQLiteJobBackend(sqlite_path)
+        job = await backend.submit('a4', {})
+        await backend.claim('w1')
+        await backend.append_event(job['id'], {'type': 'progress', 'step': 'context'})
+        await backend.finish(job['id'], 'succeeded', result={'ok': True})
+        # 已結束的工作不會被再次結束
+        await backend.finish(job['id'], 'failed', error='late')
+        return await backend.get(job['id']), await backend.events(job['id']), await backend.events(job['id'], 2)
+
+    job, events, later = asyncio.run(main())
+    assert job['status'] == 'succeeded' and job['result'] == {'ok': True} and job['error'] is None
+    assert [e.get('status', e.get('step')) for e in events] == ['queued', 'running', 'context', 'succeeded']
+    assert [e['seq'] for e in events] == [1, 2, 3, 4]
+    assert [e['seq'] for e in later] == [3, 4]
+
+
+def test_sqlite_requeue_does_not_count_an_attempt(sqlite_path):
+    async def main():
+        backend = SQLiteJobBackend(sqlite_path)
+        job = await backend.submit('a4', {})
+        await backend.claim('w1')
+        await backend.requeue(job['id'], 'worker_shutdown')
+        requeued = await backend.get(job['id'])
+        return requeued, await backend.claim('w2')
+
+    requeued, claimed = asyncio.run(main())
+    assert requeued['status'] == 'queued' and requeued['attempts'] == 0
+    assert claimed['attempts'] == 1 and claimed['worker'] == 'w2'
+
+
+def test_sqlite_recovers_stale_jobs_until_max_attempts(sqlite_path):
+    async def main():
+        backend = SQLiteJobBackend(sqlite_path, stale_seconds=60, max_attempts=2)
+        job = await backend.submit('a4', {})
+        await backend.claim('crashed')
+        _age_heartbeat(backend, job['id'], 120)
+        retried = await backend.claim('w2')
+        _age_heartbeat(backend, job['id'], 120)
+        nothing = await backend.claim('w3')
+        return retried, nothing, await backend.get(job['id']), await backend.events(job['id'])
+
+    retried, nothing, job, events = asyncio.run(main())
+    assert retried['worker'] == 'w2' and retried['attempts'] == 2
+    assert nothing is None
+    assert job['status'] == 'failed' and job['error']
+    assert any(e.get('reason') == 'stale' for e in events)
+
+
+def test_sqlite_heartbeat_reports_cancelled_jobs(sqlite_path):
+    async def main():
+        backend = SQLiteJobBackend(sqlite_path)
+        kept = await backend.submit('a4', {})
+        dropped = await backend.submit('a4', {})
+        await backend.claim('w1')
+        await backend.claim('w1')
+        await backend.cancel(dropped['id'])
+        return kept, dropped, await backend.heartbeat([kept['id'], dropped['id']])
+
+    kept, dropped, stopped = asyncio.run(main())
+    assert stopped == [dropped['id']]
+
+
+def test_sqlite_worker_runs_job(sqlite_path, monkeypatch):
+    async def run(params, ctx):
+        await ctx.emit('progress', step='echo')
+        return {'echo': params['value']}
+
+    monkeypatch.setitem(jobs.JOB_KINDS, 'echo', (_echo_params, run))
+
+    async def main():
+        queue = JobQueue(SQLiteJobBackend(sqlite_path, poll_interval=0.01))
+        job = await queue.submit('echo', {'value': 42})
+        worker = JobWorker(JobQueue(SQLiteJobBackend(sqlite_path, poll_interval=0.01)),
+                           lambda: None, concurrency=2, name='w1')
+        stop = asyncio.Event()
+        task = asyncio.create_task(worker.run(stop))
+        events = [event async for event in queue.subscribe(job['id'])]
+        stop.set()
+        await asyncio.wait_for(task, 2)
+        return await queue.get(job['id']), events
+
+    job, events = asyncio.run(main())
+    assert job['status'] == 'succeeded' and job['result'] == {'echo': 42}
+    assert events[-1]['status'] == 'succeeded'
+
+
+def test_a4_job_reading_goes_through_admission(generator, monkeypatch):
+    async def analyze(question, description=None, progress=None):
+        return {'keywords': ['市場']}, [7, 3, 9]
+
+    class NoAdapt:
+        async def aadapt_batch(self, *args, **kwargs):
+            raise AssertionError('未取得名額時不可微調')
+
+    # 名額已滿且不排隊：解卦不微調並標記降級
+    controller = admission.AdmissionController(max_concurrency=1, max_queue=0, client_rate=0)
+    controller._active = 1
+    monkeypatch.setattr(admission, '_admission', controller)
+    monkeypatch.setattr(jobs, 'aanalyze_outer', analyze)
+
+    async def main():
+        backend = MemoryJobBackend()
+        job = await backend.submit('a4', {})
+        ctx = jobs.JobContext(job, backend, generator, NoAdapt())
+        params = jobs.validate_a4_params({'question': '該不該創業'})
+        return await jobs.run_a4(params, ctx)
+
+    payload = asyncio.run(main())
+    assert payload['degraded'] and payload['degraded_reason'] == 'queue_full'
+    assert payload['agent']['outer_scores'] == [7, 3, 9]
@@ -0,0 +1,180 @@
+"""LLM 微調適配器：批次分批、截斷的 JSON、逐段補齊的段落名稱、串流中途失敗"""
+
+import asyncio
+import json
+import re
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from iching_system.core import yili_llm_adapter
+from iching_system.core.yili_llm_adapter import ClaudeLLMAdapter, OllamaLLMAdapter, _parse_batch_response
+
+
+class FakeMessages:
+    """回傳批次 JSON；輸出超過 max_tokens（每段以 500 計）時截斷"""
+
+    def __init__(self):
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def create(self, model, max_tokens, messages):
+        prompt = messages[0]['content']
+        sections = json.loads(re.search(r'原文：\n(\{.*?\n\})', prompt, re.S).group(1))
+        with self._lock:
+            self.batches.append(list(sections))
+        text = json.dumps({k: f'微調：{v}' for k, v in sections.items()}, ensure_ascii=False)
+        if max_tokens < 500 * len(sections):
+            text = text[:len(text) * max_tokens // (500 * len(sections))]
+        return SimpleNamespace(content=[SimpleNamespace(text=text)],
+                               usage=SimpleNamespace(input_tokens=1, output_tokens=1))
+
+
+class RecordingAdapter(ClaudeLLMAdapter):
+    def __init__(self):
+        self.api_key = None
+        self.model = 'fake'
+        self.client = SimpleNamespace(messages=FakeMessages())
+        self.single = []
+
+    def adapt(self, content, question, section_name):
+        self.single.append(section_name)
+        return f'逐段：{content}'
+
+
+def test_parse_truncated_batch_keeps_complete_sections():
+    text = '```json\n{"a": "完整的\\"一段\\"", "b": "也完整", "c": "被截'
+    assert _parse_batch_response(text, {'a': 1, 'b': 1, 'c': 1}) == {'a': '完整的"一段"', 'b': '也完整'}
+
+
+def test_batch_is_split_into_chunks(generator):
+    adapter = RecordingAdapter()
+    result = generator.generate_a2([7, 8, 9, 6, 7, 8], '該不該換工作', adapter)
+    batches = adapter.client.messages.batches
+    assert len(batches) > 1
+    assert all(len(batch) <= yili_llm_adapter.BATCH_MAX_SECTIONS for batch in batches)
+    assert adapter.single == []
+    sections = result['sections']
+    assert sections['s1_status']['content'].startswith('微調：')
+    assert all(stage['content'].startswith('微調：') for stage in sections['s4_stages']['stages'])
+
+
+def test_fallback_uses_section_names_for_missing_ids(generator, monkeypatch):
+    # 一批送出全部段落時 max_tokens（4096）不足，輸出被截斷
+    monkeypatch.setattr(yili_llm_adapter, 'BATCH_MAX_SECTIONS', 100)
+    adapter = RecordingAdapter()
+    result = generator.generate_a2([7, 8, 9, 6, 7, 8], '該不該換工作', adapter)
+    assert len(adapter.client.messages.batches) == 1
+    # 已完整輸出的段落不重新呼叫，只補齊缺漏的段落
+    assert 0 < len(adapter.single) < len(adapter.client.messages.batches[0])
+    assert not any(name.startswith('s') and '_' in name for name in adapter.single)
+    assert result['sections']['s1_status']['content'].startswith('微調：')
+
+
+# === 串流：正常結束、第一段之前失敗、中途失敗 ===
+USAGE = SimpleNamespace(input_tokens=1, output_tokens=1)
+
+
+def _chunks(fail_after):
+    """依序產生 ' 微調'、'後的'、'文字'；fail_after 段之後拋出連線中斷"""
+    for i, text in enumerate([' 微調', '後的', '文字']):
+        if i == fail_after:
+            raise ConnectionResetError('連線中斷')
+        yield text
+
+
+class FakeStream:
+    def __init__(self, fail_after):
+        self.text_stream = _chunks(fail_after)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def get_final_message(self):
+        return SimpleNamespace(usage=USAGE)
+
+
+class FakeAsyncStream:
+    def __init__(self, fail_after):
+        self.text_stream = self._texts(fail_after)
+
+    async def _texts(self, fail_after):
+        for text in _chunks(fail_after):
+            yield text
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def get_final_message(self):
+        return SimpleNamespace(usage=USAGE)
+
+
+def _claude_adapter(monkeypatch, fail_after):
+    adapter = ClaudeLLMAdapter.__new__(ClaudeLLMAdapter)
+    adapter.api_key = None
+    adapter.model = 'fake'
+    adapter.client = SimpleNamespace(messages=SimpleNamespace(stream=lambda **kw: FakeStream(fail_after)))
+    async_client = SimpleNamespace(messages=SimpleNamespace(stream=lambda **kw: FakeAsyncStream(fail_after)))
+    monkeypatch.setattr(yili_llm_adapter, 'get_async_anthropic_client', lambda api_key=None: async_client)
+    return adapter
+
+
+def _ollama_adapter(monkeypatch, fail_after):
+    adapter = OllamaLLMAdapter.__new__(OllamaLLMAdapter)
+
+    async def astream(prompt, max_tokens=500, section=None):
+        for text in _chunks(fail_after):
+            yield text
+
+    adapter._stream = lambda prompt, max_tokens=500, section=None: _chunks(fail_after)
+    adapter._astream = astream
+    return adapter
+
+
+def _collect(adapter, is_async):
+    """收集串流片段；回傳 (片段, 例外)"""
+    parts = []
+    try:
+        if is_async:
+            async def run():
+                async for text in adapter.aadapt_stream('原文', '問題', 's1'):
+                    parts.append(text)
+            asyncio.run(run())
+        else:
+            for text in adapter.adapt_stream('原文', '問題', 's1'):
+                parts.append(text)
+    except ConnectionResetError as e:
+        return parts, e
+    return parts, None
+
+
+STREAM_CASES = [(make, is_async) for make in (_claude_adapter, _ollama_adapter) for is_async in (False, True)]
+
+
+@pytest.mark.parametrize('make, is_async', STREAM_CASES)
+def test_stream_completes(monkeypatch, make, is_async):
+    parts, error = _collect(make(monkeypatch, fail_after=None), is_async)
+    assert error is None
+    assert parts == ['微調', '後的', '文字']
+
+
+@pytest.mark.parametrize('make, is_async', STREAM_CASES)
+def test_stream_failing_before_first_chunk_yields_original(monkeypatch, make, is_async):
+    parts, error = _collect(make(monkeypatch, fail_after=0), is_async)
+    assert error is None
+    assert parts == ['原文']
+
+
+@pytest.mark.parametrize('make, is_async', STREAM_CASES)
+def test_stream_failing_midway_raises(monkeypatch, make, is_async):
+    # 已輸出部分文字：不可默默結束，呼叫端才能捨棄半段文字、改用原文
+    parts, error = _collect(make(monkeypatch, fail_after=2), is_async)
+    assert isinstance(error, ConnectionResetError)
+    assert parts == ['微調', '後的']
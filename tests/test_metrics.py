@@ -0,0 +1,80 @@
+"""指標註冊表：Counter / Gauge / Histogram、Prometheus 文字格式、/metrics"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from iching_system.utils.metrics import Counter, Gauge, MetricsRegistry
+
+
+def test_counter_and_gauge_render():
+    registry = MetricsRegistry()
+    calls = registry.counter('calls_total', '呼叫次數', ['route'])
+    calls.inc(route='/a')
+    calls.inc(2, route='/b "x"')
+    in_flight = registry.gauge('in_flight', '處理中', ['route'])
+    in_flight.inc(route='/a')
+    in_flight.inc(route='/a')
+    in_flight.dec(route='/a')
+    in_flight.set(0.5, route='/b')
+
+    assert calls.value(route='/b "x"') == 2
+    assert calls.sum_by('route') == {'/a': 1, '/b "x"': 2}
+    assert in_flight.value(route='/a') == 1
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP calls_total 呼叫次數', '# TYPE calls_total counter']
+    assert 'calls_total{route="/b \\"x\\""} 2' in lines
+    assert '# TYPE in_flight gauge' in lines
+    assert 'in_flight{route="/a"} 1' in lines and 'in_flight{route="/b"} 0.5' in lines
+
+    with pytest.raises(ValueError):
+        calls.inc(-1, route='/a')
+    with pytest.raises(ValueError):
+        calls.inc(route='/a', status='200')
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', '耗時', ['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, stage='s')
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{stage="s",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="s",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="s",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{stage="s"} 3' in lines
+    assert latency.snapshot(stage='s') == {'sum': 5.55, 'count': 3}
+
+
+def test_registry_reuses_metrics_and_rejects_kind_mismatch():
+    registry = MetricsRegistry()
+    counter = registry.counter('requests_total', '請求數')
+    gauge = registry.gauge('queue_depth', '佇列長度')
+    assert registry.counter('requests_total', '請求數') is counter
+    assert not isinstance(gauge, Counter) and not isinstance(counter, Gauge)
+    with pytest.raises(ValueError):
+        registry.gauge('requests_total', '請求數')
+    with pytest.raises(ValueError):
+        registry.counter('queue_depth', '佇列長度')
+
+
+def test_metrics_endpoint():
+    api = pytest.importorskip('api')
+    if not api.CORE_LOADED:
+        pytest.skip(api.LOAD_ERROR)
+
+    async def main():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            await client.get('/api/reading/789678')
+            return await client.get('/metrics')
+
+    response = asyncio.run(main())
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    text = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/reading/{yao}",status="200"}' in text
+    assert '# TYPE http_requests_in_flight gauge' in text
+    assert 'api_stage_duration_seconds_count{stage="generate"}' in text
+    assert 'cache_hit_ratio{cache="response"}' in text
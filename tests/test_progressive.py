@@ -0,0 +1,87 @@
+"""漸進式解卦：事件順序、delta 串流、完成後由回應快取送出"""
+
+import asyncio
+
+import pytest
+
+from iching_system.service import admission
+from iching_system.service.admission import AdmissionController
+from iching_system.service.progressive import IMMEDIATE_SECTIONS, progressive_reading
+from iching_system.service.response_cache import cache_key
+
+
+class StreamingAdapter:
+    """每段分兩個 delta 送出的微調替身"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def aadapt_stream(self, content, question, section_name):
+        self.calls += 1
+        for part in (f'{section_name}:', '微調'):
+            await asyncio.sleep(0)
+            yield part
+
+
+@pytest.fixture(autouse=True)
+def fresh_admission(monkeypatch):
+    monkeypatch.setattr(admission, '_admission', AdmissionController(client_rate=0))
+
+
+def _events(question, generator, adapter, key):
+    async def main():
+        return [event async for event in progressive_reading(question, generator, adapter, key=key)]
+    return asyncio.run(main())
+
+
+def test_immediate_sections_come_before_adapted_ones(generator):
+    adapter = StreamingAdapter()
+    events = _events('要不要換工作', generator, adapter, key=None)
+    names = [event for event, _ in events]
+    key_sections = [section_id for section_id, _ in generator.KEY_SECTIONS]
+
+    assert names[0] == 'reading' and names[-1] == 'done'
+    assert [data['id'] for _, data in events[1:4]] == list(IMMEDIATE_SECTIONS)
+    adapted = {data['id']: data['section']['content'] for event, data in events[4:] if event == 'section'}
+    assert adapted == {section_id: f'{section_id}:微調' for section_id in key_sections}
+    assert names.count('delta') == 2 * len(key_sections)
+    assert sorted(events[-1][1]['adapted']) == sorted(key_sections)
+    assert adapter.calls == len(key_sections)
+
+
+def test_second_request_is_served_from_cache(generator):
+    adapter = StreamingAdapter()
+    key = cache_key('test_progressive', '該不該搬家')
+    first = _events('該不該搬家', generator, adapter, key=key)
+    second = _events('該不該搬家', generator, adapter, key=key)
+
+    assert first[-1][1]['cached'] is False
+    assert second[-1][1]['cached'] is True
+    assert adapter.calls == len(generator.KEY_SECTIONS)
+    sections = lambda events: {d['id']: d['section'] for e, d in events if e == 'section'}
+    assert sections(first) == sections(second)
+
+
+def test_without_adapter_sends_neutral_sections(generator):
+    events = _events('要不要創業', generator, None, key=None)
+    assert len([event for event, _ in events if event == 'section']) == 6
+    assert events[-1][1] == {'adapted': [], 'cached': False, 'degraded': False}
+
+
+def test_llm_adapt_stage_excludes_consumer_time(generator):
+    from iching_system.service.instrumentation import STAGE_DURATION
+    from iching_system.service.progressive import _adapt_key_sections
+
+    key_sections = [section_id for section_id, _ in generator.KEY_SECTIONS]
+    payload = {'reading': generator.generate([7, 8, 9, 6, 7, 8], '要不要換工作'),
+               'interpretation': {'text': ''}}
+    before = STAGE_DURATION.snapshot(stage='llm_adapt') or {'sum': 0.0, 'count': 0}
+
+    async def main():
+        async for _ in _adapt_key_sections(payload, StreamingAdapter(), '要不要換工作', key_sections):
+            await asyncio.sleep(0.05)  # 呼叫端處理每個事件的時間
+
+    asyncio.run(main())
+    after = STAGE_DURATION.snapshot(stage='llm_adapt')
+    assert after['count'] == before['count'] + 1
+    assert after['sum'] - before['sum'] < 0.05
@@ -0,0 +1,98 @@
+"""Token bucket 補充、重試次數、截止時間與同步等待上限"""
+
+import time
+import asyncio
+
+import pytest
+
+from iching_system.llm import rate_limit
+from iching_system.llm.rate_limit import (
+    TokenBucket, RateLimitTimeout, call_with_retry, acall_with_retry
+)
+
+
+class Flaky:
+    """前 failures 次拋出限流錯誤，之後回傳 'ok'"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError('429 resource exhausted')
+        return 'ok'
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    """退避延遲固定為 0，測試不實際等待"""
+    monkeypatch.setattr(rate_limit, 'backoff_delay', lambda attempt, base, cap: 0.0)
+
+
+def test_bucket_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, 'time', lambda: now[0])
+    bucket = TokenBucket(rate=2, capacity=1)
+    bucket._updated = now[0]
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == pytest.approx(0.5)
+    now[0] += 0.5
+    assert bucket.try_acquire() == 0
+
+
+def test_bucket_respects_deadline_and_max_wait():
+    bucket = TokenBucket(rate=0.1, capacity=1)
+    bucket.acquire()
+    with pytest.raises(RateLimitTimeout):
+        bucket.acquire(deadline=time.time() + 1)
+    with pytest.raises(RateLimitTimeout):
+        bucket.acquire(max_wait=1)
+
+
+def test_returns_attempt_count():
+    fn = Flaky(failures=2)
+    assert call_with_retry(fn, max_attempts=3) == ('ok', 3)
+
+
+def test_max_attempts_counts_the_first_call():
+    fn = Flaky(failures=3)
+    with pytest.raises(RuntimeError) as info:
+        call_with_retry(fn, max_attempts=3)
+    assert fn.calls == 3
+    assert info.value.attempts == 3
+
+
+def test_other_errors_are_not_retried():
+    def broken():
+        raise ValueError('bad request')
+
+    with pytest.raises(ValueError) as info:
+        call_with_retry(broken)
+    assert info.value.attempts == 1
+
+
+def test_retry_stops_at_deadline(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'backoff_delay', lambda attempt, base, cap: 5.0)
+    fn = Flaky(failures=1)
+    with pytest.raises(RateLimitTimeout) as info:
+        call_with_retry(fn, deadline=time.time() + 1)
+    assert fn.calls == 1
+    assert info.value.attempts == 1
+
+
+def test_sync_retry_does_not_sleep_past_max_wait(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'backoff_delay', lambda attempt, base, cap: 5.0)
+    monkeypatch.setattr(rate_limit.time, 'sleep', lambda seconds: pytest.fail('slept in thread'))
+    with pytest.raises(RateLimitTimeout):
+        call_with_retry(Flaky(failures=1), max_wait=1)
+
+
+def test_async_returns_attempt_count():
+    fn = Flaky(failures=1)
+
+    async def call():
+        return fn()
+
+    assert asyncio.run(acall_with_retry(call, max_attempts=3)) == ('ok', 2)
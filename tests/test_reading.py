@@ -0,0 +1,35 @@
+"""以問題起卦：與最初 /api/ask 的卦碼與動爻相同"""
+
+import asyncio
+import hashlib
+import random
+
+import pytest
+
+from iching_system.service.reading import build_reading, cast_for_question
+
+# 問題7 的種子 % 7 == 6（無動爻）
+QUESTIONS = ['該不該換工作', '今年適合結婚嗎', 'Should I move?', '是否辭職創業', '明天會下雨嗎', '問題7']
+
+
+def baseline_hexagram(question):
+    """最初 /api/ask 的算法"""
+    hash_val = int(hashlib.sha256(question.encode()).hexdigest(), 16)
+    random.seed(hash_val)
+    code = ''.join(str(random.randint(0, 1)) for _ in range(6))
+    changing = hash_val % 7
+    return code, changing if changing < 6 else None
+
+
+@pytest.mark.parametrize('question', QUESTIONS)
+def test_question_casting_matches_baseline(question, generator):
+    payload = asyncio.run(build_reading(question, generator))
+    code, changing = baseline_hexagram(question)
+    assert payload['hexagram']['code'] == code
+    assert payload['hexagram']['changing'] == changing
+    assert payload['hexagram']['moving_lines'] == ([] if changing is None else [changing])
+
+
+def test_casting_is_deterministic():
+    assert cast_for_question('該不該換工作') == cast_for_question('該不該換工作')
+    assert all(v in (6, 7, 8, 9) for v in cast_for_question('x'))
@@ -0,0 +1,167 @@
+"""回應快取：命中、LRU、ETag 與 304、single-flight 合併與不可快取結果的 Cache-Control"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from iching_system.service.response_cache import ResponseCache, cache_key, etag_matches, make_etag
+
+
+def test_get_or_compute_stores_and_hits():
+    cache = ResponseCache(max_entries=4)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {'value': 1}
+
+    async def main():
+        first = await cache.get_or_compute('k', compute)
+        second = await cache.get_or_compute('k', compute)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert first[0] == make_etag(first[1])
+    assert first[2] is True
+    assert len(calls) == 1
+
+
+def test_uncacheable_result_is_not_stored():
+    cache = ResponseCache(max_entries=4)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {'degraded': True}
+
+    async def main():
+        for _ in range(2):
+            await cache.get_or_compute('k', compute, cacheable=lambda data: not data['degraded'])
+
+    asyncio.run(main())
+    assert len(calls) == 2
+    assert cache.stats()['entries'] == 0
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    calls = []
+
+    def compute(i):
+        async def run():
+            calls.append(i)
+            return {'i': i}
+        return run
+
+    async def main():
+        await cache.get_or_compute('0', compute(0))
+        await cache.get_or_compute('1', compute(1))
+        await cache.get_or_compute('0', compute(0))  # '0' 變成最近使用
+        await cache.get_or_compute('2', compute(2))  # 淘汰 '1'
+        await cache.get_or_compute('0', compute(0))
+        await cache.get_or_compute('1', compute(1))
+
+    asyncio.run(main())
+    assert cache.stats()['entries'] == 2
+    assert calls == [0, 1, 2, 1]
+
+
+def test_etag_matches():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches('*', '"c"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"a"')
+    assert cache_key('ask', 'q', True) != cache_key('ask', 'q', False)
+
+
+def test_concurrent_requests_share_one_computation():
+    cache = ResponseCache(max_entries=4)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {'value': 1}
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute('k', compute) for _ in range(10)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert len(set(results)) == 1
+
+
+def test_uncacheable_result_is_reported_to_every_waiter():
+    cache = ResponseCache(max_entries=4)
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return {'degraded': True}
+
+    async def main():
+        return await asyncio.gather(*(
+            cache.get_or_compute('k', compute, cacheable=lambda data: not data['degraded'])
+            for _ in range(3)
+        ))
+
+    results = asyncio.run(main())
+    assert [stored for _, _, stored in results] == [False, False, False]
+    assert asyncio.run(cache.get('k')) is None
+
+
+def test_reading_revalidates_with_304():
+    api = pytest.importorskip('api')
+    if not api.CORE_LOADED:
+        pytest.skip(api.LOAD_ERROR)
+
+    async def main():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            first = await client.get('/api/reading/789678')
+            etag = first.headers['etag']
+            again = await client.get('/api/reading/789678', headers={'If-None-Match': f'W/{etag}'})
+            other = await client.get('/api/reading/789678', headers={'If-None-Match': '"other"'})
+        return first, again, other
+
+    first, again, other = asyncio.run(main())
+    assert first.status_code == 200
+    assert first.headers['etag'] == make_etag(first.content)
+    assert 'immutable' in first.headers['cache-control']
+    assert again.status_code == 304 and again.content == b''
+    assert again.headers['etag'] == first.headers['etag']
+    assert other.status_code == 200 and other.content == first.content
+
+
+def test_coalesced_ask_gets_no_store_when_leader_result_is_degraded(monkeypatch):
+    api = pytest.importorskip('api')
+    if not api.CORE_LOADED:
+        pytest.skip(api.LOAD_ERROR)
+    from iching_system.service.admission import mark_degraded
+
+    started = []
+
+    async def degraded_reading(question, generator, adapter, *args, **kwargs):
+        # 領頭請求的結果沒有微調（降級），不可被 CDN 快取
+        started.append(question)
+        await asyncio.sleep(0.2)
+        payload = await api.build_reading(question, generator, None)
+        mark_degraded(payload, 'overloaded')
+        return payload
+
+    monkeypatch.setattr(api, 'get_adapter', lambda: object())
+    monkeypatch.setattr(api, 'admitted_reading', degraded_reading)
+
+    async def main():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            body = {'question': '測試合併請求的快取標頭'}
+            return await asyncio.gather(client.post('/api/ask', json=body),
+                                        client.post('/api/ask', json=body))
+
+    responses = asyncio.run(main())
+    assert len(started) == 1
+    assert [r.status_code for r in responses] == [200, 200]
+    assert [r.headers['cache-control'] for r in responses] == ['no-store', 'no-store']
+    assert responses[0].content == responses[1].content
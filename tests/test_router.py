@@ -0,0 +1,95 @@
+"""供應商路由：對沖、輸家丟棄、失敗改用、成本上限、輸出正規化"""
+
+import time
+import threading
+
+import pytest
+
+from iching_system.llm import router
+from iching_system.llm.router import GeminiProvider, LLMProvider, ProviderRouter
+
+
+class FakeProvider(LLMProvider):
+    def __init__(self, name, text='', delay=0.0, error=None, cost=0.0):
+        super().__init__()
+        self.name = name
+        self.text = text
+        self.delay = delay
+        self.error = error
+        self.cost = cost
+        self.calls = 0
+        self.started = threading.Event()
+
+    def complete(self, prompt, max_tokens, section=None):
+        self.calls += 1
+        self.started.set()
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.text
+
+    def estimate_cost(self, prompt, max_tokens):
+        return self.cost
+
+
+def make_router(providers, hedge_delay=0.05, **kwargs):
+    r = ProviderRouter(providers, **kwargs)
+    r.hedge_delay = lambda provider: hedge_delay
+    return r
+
+
+def test_hedge_returns_faster_backup():
+    slow = FakeProvider('slow', ' slow ', delay=0.5)
+    fast = FakeProvider('fast', ' fast \n')
+    assert make_router([slow, fast]).call('prompt') == 'fast'
+    assert slow.calls == 1 and fast.calls == 1
+
+
+def test_queued_loser_is_not_sent():
+    # 只有一個執行緒：對沖請求排隊時主要供應商先回應，對沖請求不應送出
+    primary = FakeProvider('primary', 'primary', delay=0.2)
+    backup = FakeProvider('backup', 'backup')
+    r = make_router([primary, backup], max_workers=1)
+    assert r.call('prompt') == 'primary'
+    r._executor.shutdown(wait=True)
+    assert backup.calls == 0
+    assert backup.stats.count() == 0
+
+
+def test_failover_after_error():
+    broken = FakeProvider('broken', error=RuntimeError('boom'))
+    backup = FakeProvider('backup', 'ok')
+    assert make_router([broken, backup], hedge=False).call('prompt') == 'ok'
+    assert broken.stats.error_rate() == 1.0
+
+
+def test_budget_blocks_hedge():
+    slow = FakeProvider('slow', 'slow', delay=0.2, cost=0.01)
+    backup = FakeProvider('backup', 'backup', cost=0.01)
+    assert make_router([slow, backup], budget=0.015).call('prompt') == 'slow'
+    assert backup.calls == 0
+
+
+def test_all_failed_raises_last_error():
+    a = FakeProvider('a', error=RuntimeError('a'))
+    b = FakeProvider('b', error=RuntimeError('b'))
+    with pytest.raises(RuntimeError, match='b'):
+        make_router([a, b], hedge=False).call('prompt')
+
+
+def test_gemini_passes_max_output_tokens(monkeypatch):
+    seen = {}
+
+    class Response:
+        text = '  答案  '
+        usage_metadata = None
+
+    class Model:
+        def generate_content(self, prompt, **kwargs):
+            seen.update(kwargs)
+            return Response()
+
+    monkeypatch.setattr(router, 'get_gemini_model', lambda model, api_key=None: Model())
+    text = make_router([GeminiProvider(api_key='test')]).call('prompt', max_tokens=123)
+    assert text == '答案'
+    assert seen['generation_config'] == {'max_output_tokens': 123}
@@ -0,0 +1,128 @@
+"""語意快取：近似問題命中、意思不同的問題不命中、段落名稱正規化"""
+
+import asyncio
+
+import pytest
+
+from iching_system.llm.semantic_cache import (
+    CachedLLMAdapter, SemanticCache, normalize_question, section_id
+)
+
+
+# 說法不同、意思相同：應命中
+SIMILAR_PAIRS = [
+    ('請問：我該不該跳槽？', '要不要換工作'),
+    ('我該不該跟女朋友求婚', '該不該跟女友求婚呢'),
+    ('明年換工作好不好', '換工作明年好不好'),
+    ('我還要不要繼續等他', '要不要繼續等他'),
+]
+
+# n-gram 相似度高但意思不同（或相反）：不可命中
+DIFFERENT_PAIRS = [
+    ('我和女朋友交往三年了，該不該求婚', '我和女朋友交往三年了，該不該分手'),
+    ('是否辭職創業', '是否辭職'),
+    ('該不該買房', '該不該賣房'),
+    ('要不要辭職', '要不要不辭職'),
+    ('今年適不適合結婚', '今年適不適合離婚'),
+    ('該不該跟男友復合', '該不該跟男友分開'),
+]
+
+
+def test_normalize_question():
+    assert normalize_question('請問：我該不該跳槽？') == '是否換工作'
+
+
+@pytest.mark.parametrize('stored, asked', SIMILAR_PAIRS)
+def test_similar_questions_hit(stored, asked):
+    cache = SemanticCache()
+    cache.put('k', stored, '微調結果')
+    assert cache.get('k', asked) == '微調結果'
+
+
+@pytest.mark.parametrize('stored, asked', DIFFERENT_PAIRS)
+def test_different_intents_miss(stored, asked):
+    cache = SemanticCache()
+    cache.put('k', stored, '微調結果')
+    assert cache.get('k', asked) is None
+    assert cache.get('k', stored) == '微調結果'
+
+
+def test_section_names_share_one_key():
+    content = '中性版現況'
+    keys = {SemanticCache.make_key(content, name) for name in ('s1', '現況', 's1_status')}
+    assert len(keys) == 1
+    assert section_id('展望') == 's6_outlook'
+    assert SemanticCache.make_key(content, 's1') != SemanticCache.make_key(content, 's2')
+
+
+class CountingAdapter:
+    def __init__(self):
+        self.calls = []
+
+    def adapt(self, content, question, section_name):
+        self.calls.append(section_name)
+        return f'{question}：{content}'
+
+    async def aadapt(self, content, question, section_name):
+        return self.adapt(content, question, section_name)
+
+
+def test_streamlit_and_api_section_names_reuse_adaptation():
+    adapter = CountingAdapter()
+    cached = CachedLLMAdapter(adapter)
+    first = cached.adapt('中性版現況', '該不該跳槽', 's1')
+    second = asyncio.run(cached.aadapt_batch({'s1_status': '中性版現況'}, '要不要換工作'))
+    assert second == {'s1_status': first}
+    assert adapter.calls == ['s1']
+
+
+def test_unadapted_text_is_not_cached():
+    class FailingAdapter:
+        def adapt(self, content, question, section_name):
+            return content
+
+    cached = CachedLLMAdapter(FailingAdapter())
+    cached.adapt('原文', '是否換工作', '現況')
+    assert cached.cache.stats()['keys'] == 0
+
+
+class CutOffAdapter:
+    """串流輸出「前半段」後連線中斷；complete=True 時正常結束"""
+
+    def __init__(self, complete=False):
+        self.complete = complete
+
+    def adapt_stream(self, content, question, section_name):
+        yield '前半段'
+        if not self.complete:
+            raise ConnectionResetError('連線中斷')
+        yield '後半段'
+
+    async def aadapt_stream(self, content, question, section_name):
+        for text in self.adapt_stream(content, question, section_name):
+            yield text
+
+
+def test_cut_off_stream_is_not_cached():
+    cached = CachedLLMAdapter(CutOffAdapter())
+    with pytest.raises(ConnectionResetError):
+        list(cached.adapt_stream('原文', '是否換工作', 's1'))
+
+    async def consume():
+        async for _ in cached.aadapt_stream('原文', '是否換工作', 's1'):
+            pass
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(consume())
+    assert cached.cache.stats()['keys'] == 0
+
+
+def test_stream_closed_early_is_not_cached():
+    cached = CachedLLMAdapter(CutOffAdapter(complete=True))
+    stream = cached.adapt_stream('原文', '是否換工作', 's1')
+    assert next(stream) == '前半段'
+    stream.close()
+    assert cached.cache.stats()['keys'] == 0
+
+    assert ''.join(cached.adapt_stream('原文', '是否換工作', 's1')) == '前半段後半段'
+    assert cached.cache.get(cached.cache.make_key('原文', 's1'), '是否換工作') == '前半段後半段'
@@ -0,0 +1,39 @@
+"""快速 JSON 序列化：各後端與標準庫 json 輸出相同的內容"""
+
+import json
+
+import pytest
+
+from iching_system.utils import serialization
+
+SAMPLES = [
+    {'question': '該不該換工作', 'yao_values': [7, 8, 9, 6, 7, 8], 'score': 0.5, 'empty': None},
+    {1: '乾', 64: '未濟'},                       # 卦號作為 key
+    {'nested': {2: {'ok': True}}, 'list': [{3: 'x'}]},
+    {True: 'yes', None: 'null'},
+]
+
+
+def _json(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+@pytest.mark.parametrize('obj', SAMPLES)
+def test_dumps_matches_json(obj):
+    assert serialization.dumps(obj) == _json(obj)
+    assert serialization.dumps_indent(obj) == json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+@pytest.mark.parametrize('obj', SAMPLES)
+def test_orjson_backend_matches_json(obj, monkeypatch):
+    orjson = pytest.importorskip('orjson')
+    monkeypatch.setattr(serialization, 'orjson', orjson)
+    monkeypatch.setattr(serialization, 'BACKEND', 'orjson')
+    assert serialization.dumps(obj) == _json(obj)
+    assert serialization.dumps_indent(obj) == json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+def test_json_backend(monkeypatch):
+    monkeypatch.setattr(serialization, 'BACKEND', 'json')
+    for obj in SAMPLES:
+        assert serialization.dumps(obj) == _json(obj)
@@ -0,0 +1,42 @@
+"""serve.py：預設單一程序、多個 API worker 時背景工作佇列的切換"""
+
+import os
+
+import pytest
+
+import serve
+
+
+@pytest.fixture
+def no_queue_url(monkeypatch):
+    monkeypatch.delenv('JOB_QUEUE_URL', raising=False)
+
+
+def test_single_worker_by_default(monkeypatch):
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    assert serve.default_workers() == 1
+    monkeypatch.setenv('WEB_CONCURRENCY', '4')
+    assert serve.default_workers() == 4
+
+
+def test_single_worker_keeps_in_process_queue(no_queue_url):
+    assert serve.shared_job_queue(1, 0) == 0
+    assert 'JOB_QUEUE_URL' not in os.environ
+
+
+def test_multiple_workers_switch_to_sqlite(no_queue_url):
+    assert serve.shared_job_queue(4, 0) == 1
+    assert os.environ['JOB_QUEUE_URL'] == 'sqlite://' + serve.DEFAULT_JOB_DB
+    assert serve.shared_job_queue(4, 3) == 3
+
+
+def test_multiple_workers_keep_configured_queue(monkeypatch):
+    monkeypatch.setenv('JOB_QUEUE_URL', 'sqlite:///var/lib/yili/jobs.db')
+    assert serve.shared_job_queue(4, 0) == 0
+    assert os.environ['JOB_QUEUE_URL'] == 'sqlite:///var/lib/yili/jobs.db'
+
+
+def test_multiple_workers_reject_memory_queue(monkeypatch):
+    monkeypatch.setenv('JOB_QUEUE_URL', 'memory://')
+    with pytest.raises(SystemExit):
+        serve.shared_job_queue(2, 0)
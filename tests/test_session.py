@@ -0,0 +1,128 @@
+"""WebSocket 起卦 session：A3 流程、A4 Agent 失敗後可繼續、解卦不阻塞訊息處理"""
+
+import asyncio
+
+import pytest
+
+from iching_system.service import admission, session as session_module
+from iching_system.service.admission import AdmissionController
+from iching_system.service.session import DEFAULT_SCORE, DivinationSession
+
+
+@pytest.fixture(autouse=True)
+def fresh_admission(monkeypatch):
+    monkeypatch.setattr(admission, '_admission', AdmissionController())
+
+
+def _receive_until_done(websocket):
+    messages = []
+    while True:
+        message = websocket.receive_json()
+        messages.append(message)
+        if message['type'] in ('done', 'error'):
+            return messages
+
+
+def test_a3_over_websocket():
+    api = pytest.importorskip('api')
+    if not api.CORE_LOADED:
+        pytest.skip(api.LOAD_ERROR)
+    from fastapi.testclient import TestClient
+
+    client = TestClient(api.app)
+    with client.websocket_connect('/ws/session') as websocket:
+        websocket.send_json({'type': 'start', 'method': 'A3', 'question': '該不該換工作'})
+        question = websocket.receive_json()
+        assert question['type'] == 'question' and len(question['aspects']) == 6
+
+        websocket.send_json({'type': 'score', 'index': 0, 'value': 11})
+        assert websocket.receive_json()['type'] == 'error'
+
+        websocket.send_json({'type': 'scores', 'values': [0, 2, 4, 6, 8, 10]})
+        scores = [websocket.receive_json() for _ in range(6)]
+        assert [m['score'] for m in scores] == [0, 2, 4, 6, 8, 10]
+
+        websocket.send_json({'type': 'divine'})
+        messages = _receive_until_done(websocket)
+    types = [m['type'] for m in messages]
+    assert types[0] == 'reading' and types[-1] == 'done'
+    reading = messages[0]
+    assert reading['yao_values'] == [m['yao'] for m in scores]
+    assert {m['id'] for m in messages if m['type'] == 'section'} == set(reading['order'])
+
+
+class Recorder:
+    def __init__(self):
+        self.messages = []
+
+    async def __call__(self, message):
+        self.messages.append(message)
+
+    def of(self, message_type):
+        return [m for m in self.messages if m['type'] == message_type]
+
+
+def test_agent_failure_degrades_and_analyze_retries(generator, monkeypatch):
+    calls = []
+
+    async def flaky_analyze(question, description=None, progress=None):
+        calls.append(question)
+        if len(calls) == 1:
+            raise RuntimeError('Gemini 無回應')
+        return {'keywords': ['市場']}, [7, 3, 9]
+
+    monkeypatch.setattr(session_module, 'aanalyze_outer', flaky_analyze)
+
+    async def main():
+        send = Recorder()
+        session = DivinationSession(send, generator)
+        await session.handle({'type': 'start', 'method': 'A4', 'question': '該不該創業'})
+        await session.handle({'type': 'analyze'})
+        await session._agent
+        degraded = send.of('scores')[-1]
+
+        # 降級後仍可解卦
+        await session.handle({'type': 'divine'})
+        await session._reading
+        done = send.of('done')[-1]
+
+        # 再送 analyze 重新分析
+        await session.handle({'type': 'analyze'})
+        await session._agent
+        return send, degraded, done, session
+
+    send, degraded, done, session = asyncio.run(main())
+    assert degraded == {'type': 'scores', 'inner': [DEFAULT_SCORE] * 3,
+                        'outer': [DEFAULT_SCORE] * 3, 'degraded': True}
+    assert send.of('error')[0]['detail'].startswith('外部環境分析失敗')
+    assert done['adapted'] == []
+    assert len(calls) == 2
+    assert send.of('scores')[-1]['outer'] == [7, 3, 9]
+    assert session.degraded is None
+
+
+def test_divine_runs_in_background_and_close_cancels_it(generator, monkeypatch):
+    release = asyncio.Event()
+
+    async def slow_analyze(question, description=None, progress=None):
+        await release.wait()
+        return {'keywords': ['市場']}, [7, 3, 9]
+
+    monkeypatch.setattr(session_module, 'aanalyze_outer', slow_analyze)
+
+    async def main():
+        send = Recorder()
+        session = DivinationSession(send, generator)
+        await session.handle({'type': 'start', 'method': 'A4', 'question': '該不該創業'})
+        # Agent 分析尚未完成：divine 立即返回，之後的訊息照常處理
+        await asyncio.wait_for(session.handle({'type': 'divine'}), timeout=1)
+        await session.handle({'type': 'score', 'index': 0, 'value': 9})
+        assert send.of('score')[-1]['score'] == 9
+        reading = session._reading
+        await session.close()
+        await asyncio.gather(reading, session._agent, return_exceptions=True)
+        return send, reading
+
+    send, reading = asyncio.run(main())
+    assert reading.cancelled()
+    assert send.of('reading') == [] and send.of('error') == []
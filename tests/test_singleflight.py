@@ -0,0 +1,120 @@
+"""Single-flight：合併、事件重播、取消與錯誤傳遞"""
+
+import asyncio
+
+import pytest
+
+from iching_system.service.singleflight import SingleFlight
+
+
+def test_followers_share_one_computation():
+    calls = []
+
+    async def compute(flight):
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def main():
+        flights = SingleFlight()
+        leader, is_leader = flights.run('k', compute)
+        follower, is_follower_leader = flights.run('k', compute)
+        results = await asyncio.gather(leader.wait(), follower.wait())
+        return flights, leader, follower, is_leader, is_follower_leader, results
+
+    flights, leader, follower, is_leader, is_follower_leader, results = asyncio.run(main())
+    assert leader is follower and leader.followers == 1
+    assert (is_leader, is_follower_leader) == (True, False)
+    assert results == ['result', 'result'] and calls == [1]
+    assert len(flights) == 0
+
+
+def test_late_follower_replays_published_events():
+    async def compute(flight):
+        flight.publish('a')
+        await asyncio.sleep(0.01)
+        flight.publish('b')
+        return 'done'
+
+    async def main():
+        flights = SingleFlight()
+        flights.run('k', compute)
+        await asyncio.sleep(0)
+        follower, leader = flights.run('k', compute)
+        return leader, [event async for event in follower.replay()], await follower.wait()
+
+    leader, events, result = asyncio.run(main())
+    assert not leader
+    assert events == ['a', 'b'] and result == 'done'
+
+
+def test_cancelled_waiter_does_not_cancel_computation():
+    async def compute(flight):
+        await asyncio.sleep(0.02)
+        return 'result'
+
+    async def main():
+        flights = SingleFlight()
+        flight, _ = flights.run('k', compute)
+        waiter = asyncio.create_task(flight.wait())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        follower, leader = flights.run('k', compute)
+        return leader, await follower.wait()
+
+    leader, result = asyncio.run(main())
+    assert not leader and result == 'result'
+
+
+def test_error_reaches_every_waiter_and_next_call_retries():
+    attempts = []
+
+    async def compute(flight):
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError('boom')
+        return 'ok'
+
+    async def main():
+        flights = SingleFlight()
+        first, _ = flights.run('k', compute)
+        second, _ = flights.run('k', compute)
+        errors = await asyncio.gather(first.wait(), second.wait(), return_exceptions=True)
+        retry, leader = flights.run('k', compute)
+        return errors, leader, await retry.wait()
+
+    errors, leader, result = asyncio.run(main())
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert leader and result == 'ok'
+
+
+def test_none_key_is_never_coalesced():
+    async def compute(flight):
+        return object()
+
+    async def main():
+        flights = SingleFlight()
+        first, first_leader = flights.run(None, compute)
+        second, second_leader = flights.run(None, compute)
+        return first is second, first_leader, second_leader, await first.wait() is await second.wait()
+
+    same, first_leader, second_leader, same_result = asyncio.run(main())
+    assert not same and first_leader and second_leader and not same_result
+
+
+def test_cancelled_computation_cancels_waiters():
+    async def compute(flight):
+        await asyncio.sleep(10)
+
+    async def main():
+        flights = SingleFlight()
+        flight, _ = flights.run('k', compute)
+        await asyncio.sleep(0)
+        flight.task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await flight.wait()
+        return len(flights)
+
+    assert asyncio.run(main()) == 0
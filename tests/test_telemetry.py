@@ -0,0 +1,99 @@
+"""LLM 呼叫遙測：狀態、tokens、最近紀錄與彙總、語意快取的 hit / miss 標記"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from iching_system.llm import telemetry
+from iching_system.llm.semantic_cache import CachedLLMAdapter
+from iching_system.llm.telemetry import llm_call, recent_calls, summary
+
+
+def _calls(section):
+    return [item for item in recent_calls(limit=1000) if item['section'] == section]
+
+
+def test_llm_call_records_usage_and_status():
+    with llm_call('claude', 'fake-model', section='t_usage') as call:
+        call.first_token()
+        call.set_usage(120, 30)
+    with pytest.raises(RuntimeError):
+        with llm_call('claude', 'fake-model', section='t_usage'):
+            raise RuntimeError('失敗')
+
+    ok, error = _calls('t_usage')[-2:]
+    assert ok['status'] == 'ok' and error['status'] == 'error'
+    assert ok['cache'] == 'none'
+    assert (ok['input_tokens'], ok['output_tokens']) == (120, 30)
+    assert error['input_tokens'] is None
+    assert 0 <= ok['ttft'] <= ok['wall_time']
+
+    labels = dict(provider='claude', model='fake-model', section='t_usage', cache='none')
+    assert telemetry.LLM_TOKENS_TOTAL.value(direction='input', **labels) >= 120
+    assert telemetry.LLM_CALLS.value(status='error', **labels) >= 1
+    assert summary()['t_usage']['output_tokens'] >= 30
+
+
+def test_cancelled_stream_is_recorded_as_cancelled():
+    def stream():
+        with llm_call('ollama', 'fake-model', section='t_cancel'):
+            yield '一'
+            yield '二'
+
+    texts = stream()
+    next(texts)
+    texts.close()
+    assert _calls('t_cancel')[-1]['status'] == 'cancelled'
+
+
+class TracedAdapter:
+    """每次微調都記錄一次 llm_call（與真實 adapter 相同，不指定 cache）"""
+
+    def adapt(self, content, question, section_name):
+        with llm_call('claude', 'fake-model', section=section_name):
+            return f'微調：{content}'
+
+    def adapt_stream(self, content, question, section_name):
+        with llm_call('claude', 'fake-model', section=section_name):
+            yield '微調：'
+            yield content
+
+    async def aadapt_batch(self, sections, question, names=None):
+        return {k: self.adapt(v, question, k) for k, v in sections.items()}
+
+
+def test_semantic_cache_tags_misses_and_hits():
+    cached = CachedLLMAdapter(TracedAdapter())
+    cached.adapt('原文', '是否換工作', 't_cache_adapt')
+    cached.adapt('原文', '要不要換工作', 't_cache_adapt')
+    assert [(c['provider'], c['cache']) for c in _calls('t_cache_adapt')[-2:]] == [
+        ('claude', 'miss'), ('cache', 'hit')
+    ]
+
+    for text in cached.adapt_stream('原文', '是否換工作', 't_cache_stream'):
+        # 串流期間呼叫端自己的呼叫不可被標記為 miss
+        with llm_call('claude', 'fake-model', section='t_cache_caller'):
+            pass
+    assert _calls('t_cache_stream')[-1]['cache'] == 'miss'
+    assert {c['cache'] for c in _calls('t_cache_caller')} == {'none'}
+
+    asyncio.run(cached.aadapt_batch({'t_cache_batch': '原文'}, '是否換工作'))
+    assert _calls('t_cache_batch')[-1]['cache'] == 'miss'
+
+
+def test_llm_metrics_endpoint_lists_recent_calls():
+    api = pytest.importorskip('api')
+    with llm_call('gemini', 'fake-model', section='t_endpoint') as call:
+        call.set_usage(10, 5)
+
+    async def main():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return (await client.get('/api/metrics/llm', params={'limit': 5})).json()
+
+    data = asyncio.run(main())
+    assert len(data['recent']) <= 5
+    assert data['recent'][-1]['section'] == 't_endpoint'
+    assert data['recent'][-1]['output_tokens'] == 5
+    assert data['by_section']['t_endpoint']['calls'] >= 1
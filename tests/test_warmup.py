@@ -0,0 +1,56 @@
+"""啟動預熱：步驟紀錄、cassette 下的 LLM 連線預熱、存活與就緒檢查"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from iching_system.service.warmup import WarmupState, warm_up
+
+
+def _warm(generator, warm_llm=False):
+    state = WarmupState()
+    asyncio.run(warm_up(state, lambda: generator, lambda: object(), warm_llm=warm_llm, prerender=False))
+    return state
+
+
+def test_warm_up_records_steps_with_cassette_client(generator, capsys):
+    # conftest 以 cassette 重播取代 Anthropic 客戶端，替身沒有 models 介面
+    state = _warm(generator, warm_llm=True)
+    assert state.ready and state.error is None
+    assert list(state.steps) == ['data', 'generator', 'tables', 'llm_client', 'llm_connection']
+    assert 'LLM 連線預熱失敗' not in capsys.readouterr().out
+    assert state.to_dict()['duration'] is not None
+
+
+def test_failed_step_stays_not_ready():
+    def broken_generator():
+        raise RuntimeError('資料檔損毀')
+
+    state = WarmupState()
+    asyncio.run(warm_up(state, broken_generator, lambda: None, warm_llm=False, prerender=False))
+    assert not state.ready
+    assert state.error == '資料檔損毀'
+    assert 'tables' not in state.steps
+
+
+def test_readiness_endpoint(generator, monkeypatch):
+    api = pytest.importorskip('api')
+    if not api.CORE_LOADED:
+        pytest.skip(api.LOAD_ERROR)
+    monkeypatch.setattr(api, 'WARMUP', WarmupState())
+
+    async def main():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            live = await client.get('/health/live')
+            before = await client.get('/health/ready')
+            await warm_up(api.WARMUP, lambda: generator, lambda: None, warm_llm=False, prerender=False)
+            after = await client.get('/health/ready')
+        return live, before, after
+
+    live, before, after = asyncio.run(main())
+    assert live.status_code == 200
+    assert before.status_code == 503 and before.json()['ready'] is False
+    assert after.status_code == 200 and after.json()['ready'] is True
+    assert 'tables' in after.json()['steps']
@@ -0,0 +1,59 @@
+"""
+背景工作 worker
+===============
+執行 /api/jobs 建立的工作（A4 Agent 起卦），與 API 程序透過共用的工作佇列溝通：
+
+    JOB_QUEUE_URL=sqlite:///var/lib/yili/jobs.db python worker.py [--concurrency 4]
+
+API 程序使用同一個 JOB_QUEUE_URL；也可以由 `serve.py --job-workers N`
+在預熱後的主程序 fork 出 worker。
+一個 worker 程序同時執行 concurrency 個工作（Agent 流程以 asyncio 等待 LLM）。
+收到 SIGTERM / SIGINT 時停止取出新工作，執行中的工作重新排入佇列
+"""
+
+import signal
+import asyncio
+import argparse
+
+
+def run_worker(concurrency=None):
+    """執行 worker 直到收到 SIGTERM / SIGINT"""
+    import api
+    from iching_system.service.jobs import get_job_queue, JobWorker, JOB_WORKER_CONCURRENCY
+    from iching_system.llm.clients import close_async_clients
+
+    if not api.CORE_LOADED:
+        raise SystemExit(f"核心模組載入失敗：{api.LOAD_ERROR}")
+    queue = get_job_queue()
+    if queue.in_process:
+        raise SystemExit("JOB_QUEUE_URL 未設定共用後端（例如 sqlite:///path/jobs.db），"
+                         "程序內佇列的工作由 API 程序自己執行")
+
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        worker = JobWorker(queue, api.get_generator, api.get_adapter,
+                           concurrency=concurrency or JOB_WORKER_CONCURRENCY)
+        print(f"背景工作 worker {worker.name}：{type(queue.backend).__name__}，同時 {worker.concurrency} 個")
+        try:
+            await worker.run(stop)
+        finally:
+            await close_async_clients()
+            adapter = api.get_adapter()
+            if adapter is not None:
+                await adapter.aclose()
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="易力決策背景工作 worker（A4 Agent 起卦）")
+    parser.add_argument('--concurrency', type=int, default=None, help="同時執行的工作數（預設 JOB_WORKER_CONCURRENCY）")
+    args = parser.parse_args()
+    run_worker(args.concurrency)
+
+
+if __name__ == '__main__':
+    main()